@@ -0,0 +1,193 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from build_manifest import write_json_if_changed
+
+logging.basicConfig(format="%(asctime)s %(levelname)s %(funcName)s: %(message)s")
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 默认扫描 code/ 目录：每个 <ticker>/data.json 是一家公司
+DEFAULT_ROOT = Path(__file__).resolve().parent.parent
+SUMMARY_NAME = "batch_summary.json"
+
+# 汇总中保留的 market_value.json 字段
+SUMMARY_FIELDS = (
+    "adj_recognized_value",
+    "adj_std",
+    "market_value",
+    "std_market_value",
+    "expected_stock_value",
+    "std_stock_value",
+)
+# 汇总中保留的现金流折现估值字段（见 dcf_engine）及保留的小数位，汇总中加前缀 dcf_
+DCF_SUMMARY_FIELDS = {"npv": 3, "equity_value": 3, "per_share_value": 6}
+# 每个 worker 处理这么多家公司后退出重建
+TASKS_PER_CHILD = 50
+# forkserver 启动时预先导入的模块：worker 从它 fork 出来，不再各自导入 numpy 与分析模块
+PRELOAD_MODULES = ("numpy", "qydl002039", "output_writer", "revenue_engine", "dcf_engine", "cost_trends", "price_scenarios")
+PLOT_PRELOAD_MODULES = ("matplotlib.figure", "matplotlib.backends.backend_agg", "chart_render")
+
+
+def discover_companies(root: Path) -> list:
+    """返回 root 下所有含 data.json 的子目录（按 ticker 排序）。"""
+    return sorted(p.parent for p in Path(root).glob("*/data.json"))
+
+
+def run_company(company_dir, plots: bool = True, universe=None, bundle_only: bool = False) -> dict:
+    """
+    在 worker 进程中分析一家公司：读取 data.json，串行运行全部阶段，计算市值，
+    产物写回该公司目录（plots=False 时不绘图）。返回用于汇总的小字典（只含标量，不回传中间数据），
+    其中 worker_maxrss_mb 为处理完这家公司时 worker 进程的峰值内存。
+
+    给出 universe（列式数据集目录，见 universe.py）时从数据集中按 ticker（目录名）读取切片视图，
+    不再读取 data.json。JSON 结果由后台线程写出；bundle_only=True 时每家公司只写一个结果包
+    （见 output_writer），不再写一组小 JSON 文件。
+    """
+    from output_writer import async_writes
+    from qydl002039 import (
+        load_store, qydl_dcf_valuation, qydl_generation_output_analysis, qydl_market_value_details, qydl_save_market_value,
+    )
+
+    company_dir = Path(company_dir)
+    row = {"ticker": company_dir.name, "error": None}
+    start = time.perf_counter()
+    try:
+        with async_writes(bundle_only=bundle_only):
+            if universe is not None:
+                from universe import Universe
+
+                store = Universe(universe).store(company_dir.name)
+            else:
+                store = load_store(company_dir / "data.json")
+            adj, adj_std = qydl_generation_output_analysis(store, executor="serial", out_dir=company_dir, plots=plots)
+            # 市值只算一次：同一份明细既写 market_value.json，也用于汇总行
+            details = qydl_market_value_details(store, adj, adj_std)
+            if details is not None:
+                qydl_save_market_value(details, company_dir)
+            details = details or {}
+            for key in SUMMARY_FIELDS:
+                row[key] = details.get(key)
+            dcf = qydl_dcf_valuation(store)
+            for key, ndigits in DCF_SUMMARY_FIELDS.items():
+                value = dcf.get(key)
+                row[f"dcf_{key}"] = round(value, ndigits) if value is not None else None
+    except Exception as e:
+        logger.exception(f"Failed to analyze {company_dir}")
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["elapsed_s"] = round(time.perf_counter() - start, 3)
+    # worker 由 forkserver fork 出来，不是调用方的子进程，调用方的 RUSAGE_CHILDREN 看不到它的内存
+    row["worker_maxrss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return row
+
+
+def _pool_context(plots: bool = True, universe=None):
+    """
+    worker 进程的启动方式：优先 forkserver，并预先导入 PRELOAD_MODULES（绘图时再加 PLOT_PRELOAD_MODULES），
+    重建 worker 只是一次 fork；不支持 forkserver 的平台退回 spawn。
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    ctx = multiprocessing.get_context("forkserver")
+    preload = list(PRELOAD_MODULES)
+    if plots:
+        preload.extend(PLOT_PRELOAD_MODULES)
+    if universe is not None:
+        preload.append("universe")
+    ctx.set_forkserver_preload(preload)
+    return ctx
+
+
+def run_batch(companies, max_workers=None, tasks_per_child=TASKS_PER_CHILD, plots: bool = True, universe=None,
+              bundle_only: bool = False) -> list:
+    """
+    用进程池并行分析多家公司，返回按 ticker 排序的汇总行。
+
+    - 同时提交的任务数不超过 2 * max_workers，公司数量再多，内存中也只有有限个任务
+    - 每个 worker 处理 tasks_per_child 家公司后退出重建，进程内累积的数据有上限；
+      worker 从预先导入了分析模块的 forkserver fork 出来，重建时不重新导入（见 _pool_context）
+    - 单家公司失败只记录在其汇总行的 error 中，不影响其他公司
+    """
+    companies = list(companies)
+    max_workers = max_workers or os.cpu_count() or 1
+    window = 2 * max_workers
+    rows = []
+    # max_tasks_per_child 不支持 fork
+    ctx = _pool_context(plots, universe)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx, max_tasks_per_child=tasks_per_child) as pool:
+        todo = iter(companies)
+        running = {}
+        while True:
+            for company in todo:
+                running[pool.submit(run_company, str(company), plots, universe, bundle_only)] = company
+                if len(running) >= window:
+                    break
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                company = running.pop(fut)
+                try:
+                    row = fut.result()
+                except Exception as e:
+                    logger.exception(f"Worker for {company} crashed")
+                    row = {"ticker": Path(company).name, "error": f"{type(e).__name__}: {e}"}
+                logger.info(f"Finished {row['ticker']} ({len(rows) + 1}/{len(companies)})")
+                rows.append(row)
+    return sorted(rows, key=lambda r: r["ticker"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量分析 <root>/<ticker>/data.json（或列式数据集中的各公司）并输出汇总")
+    parser.add_argument("root", nargs="?", default=str(DEFAULT_ROOT), help="包含各公司目录的根目录（默认 code/）")
+    parser.add_argument("--workers", type=int, default=None, help="worker 进程数（默认 CPU 数）")
+    parser.add_argument("--no-plot", action="store_true", help="只计算与写 JSON，不绘图")
+    parser.add_argument("--universe", default=None,
+                        help="从列式数据集读取各公司数据（见 universe.py），公司列表取数据集中的全部 ticker，产物写到 <root>/<ticker>/")
+    parser.add_argument("--bundle-only", action="store_true", help="每家公司只写一个结果包，不写单独的 JSON 文件")
+    parser.add_argument("--summary", default=None, help=f"汇总输出路径（默认 <root>/{SUMMARY_NAME}）")
+    args = parser.parse_args(argv)
+
+    root = Path(args.root)
+    if args.universe is not None:
+        from universe import Universe
+
+        companies = [root / ticker for ticker in Universe(Path(args.universe)).tickers]
+        for company in companies:
+            company.mkdir(parents=True, exist_ok=True)
+        if not companies:
+            logger.info(f"No companies in universe {args.universe}")
+            return []
+        logger.info(f"Analyzing {len(companies)} companies from universe {args.universe}, writing under {root}")
+    else:
+        companies = discover_companies(root)
+        if not companies:
+            logger.info(f"No */data.json found under {root}")
+            return []
+        logger.info(f"Analyzing {len(companies)} companies under {root}")
+
+    start = time.perf_counter()
+    rows = run_batch(companies, max_workers=args.workers, plots=not args.no_plot, universe=args.universe,
+                     bundle_only=args.bundle_only)
+    summary = {
+        "root": str(root),
+        "elapsed_s": round(time.perf_counter() - start, 3),
+        "companies": rows,
+    }
+    out_file = Path(args.summary) if args.summary else root / SUMMARY_NAME
+    try:
+        write_json_if_changed(out_file, summary)
+        logger.info(f"Saved batch summary to {out_file}")
+    except Exception:
+        logger.exception(f"Failed to write batch summary to {out_file}")
+    return rows
+
+
+if __name__ == "__main__":
+    main()
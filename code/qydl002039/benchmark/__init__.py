@@ -0,0 +1,9 @@
+"""
+基准测试：生成与 data.json 结构相同的合成数据，分阶段计时并记录峰值内存，与基线比较。
+
+在 code/qydl002039 目录下运行：python -m benchmark --help
+"""
+
+from benchmark.synthetic import generate_company, write_companies
+
+__all__ = ["generate_company", "write_companies"]
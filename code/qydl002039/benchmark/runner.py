@@ -0,0 +1,198 @@
+import argparse
+import json
+import logging
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmark.synthetic import write_companies
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+BASELINE_FILE = Path(__file__).parent / "baseline.json"
+DEFAULT_CASES = ("10x13x1", "100x100x1", "1000x13x1", "10x13x4")
+# 比基线慢超过 TOLERANCE 且绝对差超过 MIN_DELTA_S 才算回退，避免毫秒级抖动误报
+TOLERANCE = 0.25
+MIN_DELTA_S = 0.02
+MIN_DELTA_MB = 1.0
+
+
+def parse_case(text: str):
+    """"年数x电站数x公司数"，例如 "100x100x1"。"""
+    years, stations, companies = (int(p) for p in text.lower().split("x"))
+    return years, stations, companies
+
+
+def case_name(years, stations, companies) -> str:
+    return f"{years}x{stations}x{companies}"
+
+
+def _measure(name, func, results, trace=True, reset=None):
+    """
+    运行一个阶段并记录墙钟耗时；trace=True 时再在 tracemalloc 下运行一次，记录峰值内存（MB）。
+
+    tracemalloc 会让分配密集的代码慢数倍，所以计时与内存分两次测量。两次运行前都调用 reset
+    （删除快照、清空缓存等），使内存也按冷路径测量，而不是第一次运行留下的缓存命中路径。
+    返回第一次运行的结果。
+    """
+    if reset is not None:
+        reset()
+    start = time.perf_counter()
+    out = func()
+    elapsed = time.perf_counter() - start
+    peak_mb = None
+    if trace:
+        if reset is not None:
+            reset()
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_mb = round(peak / 2**20, 2)
+    results[name] = {"seconds": round(elapsed, 4), "peak_mb": peak_mb}
+    logger.info(f"  {name}: {elapsed:.4f}s" + (f", peak {peak_mb:.2f} MB" if peak_mb is not None else ""))
+    return out
+
+
+def bench_company(company_dir: Path, render: bool = True) -> dict:
+    """
+    对一家公司逐阶段计时；图表单独计为 rendering 阶段（在渲染进程池中进行，
+    不做 tracemalloc，内存见进程与子进程的 maxrss）。
+    """
+    import qydl002039 as q
+    from chart_render import set_plotting
+    from store_snapshot import snapshot_dir
+
+    results = {}
+    out_dir = Path(company_dir)
+    data_file = out_dir / "data.json"
+    previous = set_plotting(False)
+    try:
+        # 冷启动：没有快照，解析 JSON 并写出快照
+        store = _measure("load", lambda: q.load_store(data_file), results,
+                         reset=lambda: shutil.rmtree(snapshot_dir(data_file), ignore_errors=True))
+        # 热启动：快照已存在，只 mmap 打开
+        _measure("load_snapshot", lambda: q.load_store(data_file), results)
+        combined = _measure("extraction", lambda: q.qydl_extract_generation_output(store), results)
+        _measure("station_stats", lambda: q.analyze_and_plot_combined(combined, out_dir), results)
+        _measure("revenue_comparison", lambda: q.qydl_operating_revenue_and_generation_output_analysis(store, out_dir), results)
+        adj, adj_std = _measure("recognized_value", lambda: q.qydl_get_adj_recognized_value(store), results,
+                                reset=q._recognized_cache.clear)
+        _measure("market_value", lambda: q.qydl_get_market_value(store, adj, adj_std, out_dir=out_dir), results)
+        if render:
+            set_plotting(True)
+
+            def render_all():
+                q.analyze_and_plot_combined(combined, out_dir)
+                q.qydl_generation_output_history(store, out_dir)
+                q.qydl_operating_revenue_and_cash_flow_analysis(store, out_dir)
+                q.qydl_total_liabilities_and_cash_and_dividends_analysis(store, out_dir)
+
+            _measure("rendering", render_all, results, trace=False)
+    finally:
+        set_plotting(previous)
+    return results
+
+
+def bench_batch(root: Path, companies: list, render: bool) -> dict:
+    """多家公司时额外测 batch_runner 的整体耗时与 worker 的最大峰值内存（各 worker 自报的 maxrss）。"""
+    from batch_runner import run_batch
+
+    start = time.perf_counter()
+    rows = run_batch(companies, plots=render)
+    elapsed = time.perf_counter() - start
+    failed = [r["ticker"] for r in rows if r.get("error")]
+    worker_mb = max((r.get("worker_maxrss_mb") or 0.0 for r in rows), default=None)
+    logger.info(f"  batch: {elapsed:.3f}s for {len(rows)} companies ({len(failed)} failed), largest worker {worker_mb} MB")
+    return {"seconds": round(elapsed, 4), "companies": len(rows), "failed": failed, "worker_maxrss_mb": worker_mb}
+
+
+def run_case(years, stations, companies, render=True, seed=0) -> dict:
+    name = case_name(years, stations, companies)
+    logger.info(f"Case {name}: {years} years, {stations} stations, {companies} companies")
+    with tempfile.TemporaryDirectory(prefix="qydl_bench_") as tmp:
+        start = time.perf_counter()
+        dirs = write_companies(Path(tmp), companies, years, stations, seed)
+        size_kb = (dirs[0] / "data.json").stat().st_size / 1024
+        logger.info(f"  generated in {time.perf_counter() - start:.3f}s ({size_kb:.0f} KB per data.json)")
+        result = {"data_json_kb": round(size_kb, 1), "stages": bench_company(dirs[0], render)}
+        if companies > 1:
+            result["stages"]["batch"] = bench_batch(Path(tmp), dirs, render)
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance=TOLERANCE) -> list:
+    """返回回退列表：[(case, stage, metric, baseline, current), ...]，metric 为 "seconds" 或 "peak_mb"。"""
+    min_delta = {"seconds": MIN_DELTA_S, "peak_mb": MIN_DELTA_MB}
+    regressions = []
+    for case, res in results.items():
+        base_stages = baseline.get(case, {}).get("stages", {})
+        for stage, cur in res["stages"].items():
+            base = base_stages.get(stage, {})
+            for metric, delta in min_delta.items():
+                b, c = base.get(metric), cur.get(metric)
+                if b is None or c is None:
+                    continue
+                if c > b * (1 + tolerance) and c - b > delta:
+                    regressions.append((case, stage, metric, b, c))
+    return regressions
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(funcName)s: %(message)s")
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="qydl002039 分阶段基准测试")
+    parser.add_argument("cases", nargs="*", default=list(DEFAULT_CASES),
+                        help="年数x电站数x公司数，例如 100x100x1（年数 10-10000、电站 13-2000、公司 1-1000）")
+    parser.add_argument("--no-render", action="store_true", help="不计绘图阶段")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=str(BASELINE_FILE), help="基线文件")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果更新基线中的这些用例")
+    parser.add_argument("--output", default=None, help="把本次结果写到该 JSON 文件")
+    args = parser.parse_args(argv)
+
+    # 阶段日志只保留基准自身的输出（模块导入时会把各自 logger 设为 INFO，需在导入之后调整）
+    import qydl002039  # noqa: F401
+    for name in ("qydl002039", "chart_render", "build_manifest", "stage_scheduler", "batch_runner"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    results = {}
+    for text in args.cases:
+        years, stations, companies = parse_case(text)
+        results[case_name(years, stations, companies)] = run_case(years, stations, companies, not args.no_render, args.seed)
+    maxrss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logger.info(f"Peak RSS: {maxrss_mb:.1f} MB (batch workers report their own, see stages.batch.worker_maxrss_mb)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "maxrss_mb": round(maxrss_mb, 1)}, f, ensure_ascii=False, indent=2)
+
+    baseline_path = Path(args.baseline)
+    baseline = {}
+    if baseline_path.exists():
+        with baseline_path.open("r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with baseline_path.open("w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        logger.info(f"Updated baseline {baseline_path}")
+        return 0
+
+    regressions = compare(results, baseline)
+    for case, stage, metric, b, c in regressions:
+        logger.warning(f"REGRESSION {case} {stage} {metric}: {b} -> {c} ({c / b:.2f}x)")
+    if not regressions:
+        logger.info("No regressions against baseline" if baseline else "No baseline to compare against")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
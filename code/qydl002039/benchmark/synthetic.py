@@ -0,0 +1,115 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+# 顶层年度字段（与 data.json 相同的键名）及其大致量级
+COMPANY_FIELDS = {
+    "cash_and_cash_equivalents": 3.0,
+    "total_liabilities": 90.0,
+    "generation_output": 60.0,
+    "avg_on_grid_price": 0.3,
+    "operating_revenue": 20.0,
+    "operating_cost": 10.0,
+    "taxes_and_surcharges": 0.3,
+    "administrative_expenses": 1.2,
+    "financial_expenses": 3.5,
+    "income_tax_expense": 0.8,
+    "net_profit": 4.5,
+    "net_profit_attributable_to_parent": 2.7,
+    "cash_received_from_sales_and_services": 24.0,
+    "cash_inflow_operating_activities": 25.0,
+    "net_cash_flow_operating": 16.0,
+    "net_cash_flow_investing": -2.0,
+    "total_dividends_paid": 0.8,
+}
+SHAREHOLDING_CHOICES = (100.0, 51.0, 30.0, 58.66)
+STATIONS_PER_SUBSIDIARY = 4
+
+
+def _layout(n_stations: int):
+    """
+    按真实数据的形状分配电站：前两个电站直接作为一级子公司（如 puding），
+    其余每 STATIONS_PER_SUBSIDIARY 个归入一个子公司，最后约 30% 放在 pv_power_plant 下。
+
+    返回 [(subsidiary, station 或 None), ...]；station 为 None 表示子公司本身即电站。
+    """
+    n_direct = min(2, n_stations)
+    n_pv = (n_stations - n_direct) * 3 // 10
+    n_nested = n_stations - n_direct - n_pv
+    layout = [(f"plant_{i}", None) for i in range(n_direct)]
+    layout += [(f"group_{i // STATIONS_PER_SUBSIDIARY}", f"station_{i}") for i in range(n_nested)]
+    layout += [("pv_power_plant", f"station_{n_nested + i}_pv") for i in range(n_pv)]
+    return layout
+
+
+def generate_company(years: int = 10, stations: int = 13, seed: int = 0, start_year: int = 2015,
+                     na_rate: float = 0.05) -> dict:
+    """
+    生成一家公司的合成 data.json（dict）。
+
+    - 顶层: expected_rate、curr 以及 years 个年份键，每年含 COMPANY_FIELDS 与 subsidiaries
+    - subsidiaries 下的电站含 generation_output / on_grid_price / installed_capacity_mw，
+      各电站有随机的投产年份（之前的年份没有该电站），其余年份按 na_rate 随机写 "NA"
+    """
+    rng = np.random.default_rng(seed)
+    layout = _layout(stations)
+    subs = sorted({sub for sub, _ in layout}, key=[s for s, _ in layout].index)
+    ratios = {sub: float(rng.choice(SHAREHOLDING_CHOICES)) for sub in subs if sub != "pv_power_plant"}
+
+    capacity = rng.uniform(20, 1000, stations).round(1)
+    base_gen = capacity * rng.uniform(0.002, 0.006, stations)
+    base_price = rng.uniform(0.25, 0.40, stations)
+    first_year = rng.integers(0, max(1, years // 2), stations)
+    first_year[: max(1, stations // 2)] = 0
+
+    gen = (base_gen[:, None] * rng.normal(1.0, 0.12, (stations, years))).round(2)
+    price = (base_price[:, None] + rng.normal(0, 0.005, (stations, years))).round(4)
+    na = rng.random((stations, years, 2)) < na_rate
+
+    walks = {
+        name: (scale * np.abs(1.0 + np.cumsum(rng.normal(0, 0.03, years)))).round(2)
+        for name, scale in COMPANY_FIELDS.items()
+    }
+
+    data = {"expected_rate": 0.07}
+    for t in range(years):
+        year = {name: float(walks[name][t]) for name in COMPANY_FIELDS}
+        subsidiaries = {}
+        for i, (sub, station) in enumerate(layout):
+            if t < first_year[i]:
+                continue
+            node = {
+                "generation_output": "NA" if na[i, t, 0] else float(gen[i, t]),
+                "on_grid_price": "NA" if na[i, t, 1] else float(price[i, t]),
+                "installed_capacity_mw": float(capacity[i]),
+            }
+            parent = subsidiaries.setdefault(sub, {})
+            if sub in ratios and "shareholding_ratio" not in parent:
+                parent["shareholding_ratio"] = ratios[sub]
+            if station is None:
+                parent.update(node)
+            else:
+                parent[station] = node
+        year["subsidiaries"] = subsidiaries
+        data[str(start_year + t)] = year
+
+    data["curr"] = {
+        "total_liabilities": float(walks["total_liabilities"][-1]),
+        "cash_and_cash_equivalents": float(walks["cash_and_cash_equivalents"][-1]),
+        "total_shares_outstanding": 4.2756,
+    }
+    return data
+
+
+def write_companies(root: Path, companies: int = 1, years: int = 10, stations: int = 13, seed: int = 0) -> list:
+    """在 root/<ticker>/data.json 写出 companies 家合成公司（与 batch_runner 的目录约定相同），返回目录列表。"""
+    root = Path(root)
+    dirs = []
+    for c in range(companies):
+        d = root / f"synthetic{c:04d}"
+        d.mkdir(parents=True, exist_ok=True)
+        with (d / "data.json").open("w", encoding="utf-8") as f:
+            json.dump(generate_company(years, stations, seed=seed + c), f, ensure_ascii=False)
+        dirs.append(d)
+    return dirs
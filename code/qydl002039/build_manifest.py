@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+
+from output_writer import current_writer, dumps_pretty, write_bytes_if_changed
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 输出目录下的增量构建清单：记录每个阶段依赖字段的哈希与每张图的描述哈希
+MANIFEST_NAME = ".qydl_manifest.json"
+# 计算方式变化时递增，使旧清单全部失效
+MANIFEST_VERSION = 2
+
+_lock = threading.Lock()
+_manifests = {}
+
+
+def fields_hash(store, deps) -> str:
+    """
+    计算 store 中 deps 对应字段的内容哈希（年份索引 + 每列数值/掩码/是否存在）。
+
+    deps 中的每一项既可以是完整指标路径（如 "total_liabilities"），也可以是节点前缀
+    （如 "subsidiaries"，匹配其下所有字段）。字段按名字排序，与 JSON 键顺序无关。
+    """
+    names = sorted(
+        name for name in store.columns
+        if any(name == d or name.startswith(d + ".") for d in deps)
+    )
+    h = hashlib.sha1(f"v{MANIFEST_VERSION}".encode("utf-8"))
+    h.update(store.years.tobytes())
+    for name in names:
+        h.update(name.encode("utf-8"))
+        h.update(store.columns[name].tobytes())
+        h.update(store.masks[name].tobytes())
+        h.update(store.present[name].tobytes())
+    return h.hexdigest()
+
+
+def spec_hash(spec) -> str:
+    """图表描述（ChartSpec）的内容哈希；描述相同则渲染结果相同。"""
+    return hashlib.sha1(f"v{MANIFEST_VERSION}:{spec!r}".encode("utf-8")).hexdigest()
+
+
+def _manifest(out_dir: Path) -> dict:
+    key = str(Path(out_dir).resolve())
+    if key not in _manifests:
+        path = Path(out_dir) / MANIFEST_NAME
+        data = {}
+        try:
+            if path.exists():
+                with path.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+        except Exception:
+            logger.exception(f"Failed to read manifest {path}; rebuilding everything")
+            data = {}
+        if data.get("version") != MANIFEST_VERSION:
+            data = {"version": MANIFEST_VERSION, "stages": {}, "charts": {}}
+        _manifests[key] = data
+    return _manifests[key]
+
+
+def get_entry(out_dir: Path, section: str, name: str):
+    """读取清单条目（section 为 "stages" 或 "charts"），不存在时返回 None。"""
+    with _lock:
+        return _manifest(out_dir)[section].get(name)
+
+
+def set_entry(out_dir: Path, section: str, name: str, value):
+    """更新清单条目（仅内存中，调用 save_manifest 写盘）。"""
+    with _lock:
+        _manifest(out_dir)[section][name] = value
+
+
+def reset_manifest(out_dir: Path):
+    """清空某个输出目录的清单（强制全部重新生成）。"""
+    with _lock:
+        _manifests[str(Path(out_dir).resolve())] = {"version": MANIFEST_VERSION, "stages": {}, "charts": {}}
+
+
+def save_manifest(out_dir: Path):
+    """把清单写回输出目录。"""
+    path = Path(out_dir) / MANIFEST_NAME
+    with _lock:
+        data = json.dumps(_manifest(out_dir), ensure_ascii=False, indent=2, sort_keys=True)
+    try:
+        write_text_if_changed(path, data)
+    except Exception:
+        logger.exception(f"Failed to write manifest {path}")
+
+
+def write_text_if_changed(path: Path, text: str):
+    """
+    内容与磁盘上一致时不写（保留 mtime），否则原子写入（临时文件 + 改名），返回是否实际写入。
+
+    在 output_writer.async_writes 块内时交给后台线程写出，立即返回 None（已提交、结果未知）；
+    调用方只在返回 True 时记录 "Saved"，实际写入的文件由 writer 线程记录日志。
+    """
+    writer = current_writer()
+    if writer is not None:
+        writer.submit_bytes(path, text.encode("utf-8"))
+        return None
+    return write_bytes_if_changed(path, text.encode("utf-8"))
+
+
+def write_json_if_changed(path: Path, obj):
+    """
+    按原有格式（indent=2, ensure_ascii=False）序列化，内容不变时跳过写入；返回值同 write_text_if_changed，
+    后台写出时序列化也在后台进行。
+    """
+    writer = current_writer()
+    if writer is not None:
+        writer.submit_json(path, obj)
+        return None
+    return write_bytes_if_changed(path, dumps_pretty(obj))
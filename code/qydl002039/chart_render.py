@@ -0,0 +1,472 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from build_manifest import get_entry, set_entry, spec_hash
+from tracing import add_bytes, add_event, span, tracing_enabled
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 关闭后 render_charts 不再绘图（也不导入 matplotlib），用于只需要数值结果的快速模式
+_plotting_enabled = True
+
+
+def set_plotting(enabled: bool) -> bool:
+    """打开/关闭绘图，返回之前的状态。"""
+    global _plotting_enabled
+    previous = _plotting_enabled
+    _plotting_enabled = bool(enabled)
+    return previous
+
+
+def plotting_enabled() -> bool:
+    return _plotting_enabled
+
+
+def _matplotlib():
+    """按需导入 matplotlib 的 Agg 画布（首次调用约数百毫秒，之后直接取模块缓存）。"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    return Figure, FigureCanvasAgg
+
+
+@dataclass
+class LineSpec:
+    """一条折线；y 中的 None 表示缺口。"""
+
+    x: list
+    y: list
+    label: str = None
+    marker: str = "o"
+
+
+@dataclass
+class HLineSpec:
+    """水平参考线（例如多年均值）。"""
+
+    y: float
+    color: str = "gray"
+    linestyle: str = "--"
+    linewidth: float = 1
+
+
+@dataclass
+class TextSpec:
+    """数据坐标下的文字标注，style 直接传给 Axes.text（fontsize/color/va/ha/bbox 等）。"""
+
+    x: float
+    y: float
+    text: str
+    style: dict = field(default_factory=dict)
+
+
+@dataclass
+class HeatmapSpec:
+    """二维数值网格（行对应 y_labels，列对应 x_labels），NaN 显示为空白。"""
+
+    data: list
+    x_labels: list = field(default_factory=list)
+    y_labels: list = field(default_factory=list)
+    cmap: str = "viridis"
+    colorbar_label: str = ""
+
+
+@dataclass
+class ChartSpec:
+    """一张图的纯数据描述，可 pickle 后交给渲染进程。"""
+
+    path: str
+    figsize: tuple = (10, 5)
+    lines: list = field(default_factory=list)
+    hlines: list = field(default_factory=list)
+    texts: list = field(default_factory=list)
+    xlabel: str = "Year"
+    ylabel: str = ""
+    title: str = ""
+    grid: bool = True
+    legend: bool = False
+    # False 时先做 tight_layout 再加参考线与标注，标注不参与布局（单站点图沿用此顺序）
+    layout_annotations: bool = True
+    heatmap: HeatmapSpec = None
+
+
+@dataclass
+class SmallMultiplesSpec:
+    """
+    一组小图（panels，每个是 ChartSpec，只用到线、参考线、标注与标题/坐标轴文字）按 ncols 列排成网格，
+    共用一张图、一次布局、一次绘制。path 为网格图；crop_paths 与 panels 一一对应，给出时从绘制好的
+    像素中裁出该面板单独保存（None 表示不单独保存）。面板超过 max_panels 时分页，第 k 页（k ≥ 2）
+    的网格图保存为 "<stem>_<k><suffix>"。
+    """
+
+    path: str
+    panels: list = field(default_factory=list)
+    crop_paths: list = field(default_factory=list)
+    ncols: int = 4
+    panel_size: tuple = (5, 3)
+    max_panels: int = 48
+    dpi: float = 100
+
+
+def output_paths(spec) -> list:
+    """一个图表描述会写出的全部文件。"""
+    if not isinstance(spec, SmallMultiplesSpec):
+        return [spec.path]
+    path = Path(spec.path)
+    pages = -(-len(spec.panels) // spec.max_panels) if spec.panels else 1
+    grids = [spec.path] + [str(path.with_name(f"{path.stem}_{k}{path.suffix}")) for k in range(2, pages + 1)]
+    return grids + [p for p in spec.crop_paths if p is not None]
+
+
+def point_labels(x_vals, y_vals, fmt="{:.3f}") -> list:
+    """为每个数据点生成数值标注（跳过缺失值）。"""
+    return [
+        TextSpec(xi, yi, fmt.format(yi), {"fontsize": 8, "color": "black", "va": "bottom", "ha": "center"})
+        for xi, yi in zip(x_vals, y_vals)
+        if yi is not None
+    ]
+
+
+def _annotate(ax, spec: ChartSpec) -> list:
+    """添加参考线与文字标注，返回新增的 artist（模板复用时据此移除）。"""
+    artists = []
+    for h in spec.hlines:
+        artists.append(ax.axhline(h.y, color=h.color, linestyle=h.linestyle, linewidth=h.linewidth))
+    for t in spec.texts:
+        artists.append(ax.text(t.x, t.y, t.text, **t.style))
+    return artists
+
+
+def _label_axes(ax, spec: ChartSpec):
+    ax.set_xlabel(spec.xlabel)
+    ax.set_ylabel(spec.ylabel)
+    ax.set_title(spec.title)
+    ax.grid(spec.grid)
+    if spec.legend:
+        ax.legend()
+
+
+def _tick_positions(n: int, max_ticks: int = 20) -> list:
+    step = max(1, -(-n // max_ticks))
+    return list(range(0, n, step))
+
+
+def _draw_heatmap(fig, ax, hm: HeatmapSpec):
+    im = ax.imshow(hm.data, aspect="auto", origin="lower", cmap=hm.cmap)
+    if hm.x_labels:
+        ticks = _tick_positions(len(hm.x_labels))
+        ax.set_xticks(ticks, [hm.x_labels[i] for i in ticks], rotation=45, ha="right")
+    if hm.y_labels:
+        ticks = _tick_positions(len(hm.y_labels))
+        ax.set_yticks(ticks, [hm.y_labels[i] for i in ticks])
+    fig.colorbar(im, ax=ax, label=hm.colorbar_label)
+
+
+class _Template:
+    """可复用的单图模板：一张 Figure/Axes 与固定数量的 Line2D，渲染新图时只替换数据与文字。"""
+
+    def __init__(self, figsize, n_lines):
+        Figure, FigureCanvasAgg = _matplotlib()
+        self.fig = Figure(figsize=figsize)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        # 依次取默认颜色循环，与逐次 ax.plot 的配色一致
+        self.lines = [self.ax.plot([], [])[0] for _ in range(n_lines)]
+        self.artists = []
+        # tight_layout 从当前子图参数出发；每次渲染前恢复初始参数，布局与新建 Figure 逐像素一致
+        self._subplotpars = vars(self.fig.subplotpars).copy()
+
+    def render(self, spec: ChartSpec):
+        ax = self.ax
+        for artist in self.artists:
+            artist.remove()
+        self.artists = []
+        legend = ax.get_legend()
+        if legend is not None:
+            legend.remove()
+        for i, (line, data) in enumerate(zip(self.lines, spec.lines)):
+            line.set_data(data.x, np.asarray(data.y, dtype=float))
+            line.set_marker(data.marker)
+            line.set_label(data.label if data.label is not None else f"_child{i}")
+
+        if spec.layout_annotations:
+            self.artists += _annotate(ax, spec)
+        ax.relim()
+        ax.autoscale_view()
+        _label_axes(ax, spec)
+        self.fig.subplots_adjust(**self._subplotpars)
+        self.fig.tight_layout()
+        if not spec.layout_annotations:
+            self.artists += _annotate(ax, spec)
+            ax.relim()
+            ax.autoscale_view()
+        self.fig.savefig(spec.path)
+
+
+# 本进程中的单图模板，按 (figsize, 折线数) 区分
+_templates = {}
+
+
+def render_chart(spec) -> str:
+    """用面向对象的 Agg API 渲染一张图并保存，不触碰 pyplot 全局状态。返回输出路径。
+
+    普通折线图复用本进程中同尺寸、同折线数的模板 Figure（只替换数据），省去每张图的画布与坐标轴创建；
+    带热力图的图每次新建。SmallMultiplesSpec 交给 render_small_multiples。
+    """
+
+    if isinstance(spec, SmallMultiplesSpec):
+        render_small_multiples(spec)
+        return spec.path
+    if spec.heatmap is None:
+        key = (tuple(spec.figsize), len(spec.lines))
+        if key not in _templates:
+            _templates[key] = _Template(spec.figsize, len(spec.lines))
+        _templates[key].render(spec)
+        return spec.path
+
+    Figure, FigureCanvasAgg = _matplotlib()
+    fig = Figure(figsize=spec.figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    for line in spec.lines:
+        ax.plot(line.x, line.y, marker=line.marker, label=line.label)
+    _draw_heatmap(fig, ax, spec.heatmap)
+    if spec.layout_annotations:
+        _annotate(ax, spec)
+    _label_axes(ax, spec)
+    fig.tight_layout()
+    if not spec.layout_annotations:
+        _annotate(ax, spec)
+    fig.savefig(spec.path)
+    return spec.path
+
+
+def _text_size(renderer, text: str, size, dpi: float):
+    """按 rcParams 字号测量一段文字的 (宽, 高) 像素。"""
+    from matplotlib.font_manager import FontProperties
+
+    w, h, _ = renderer.get_text_width_height_descent(text, FontProperties(size=size), ismath=False)
+    return w, h
+
+
+def _grid_layout(fig, axes, panels, nrows: int, ncols: int, dpi: float):
+    """
+    一次算出整页布局：所有面板同尺寸、同结构，边距只取决于标题/轴标签字号与最宽的刻度标签，
+    因此只测量这几段文字（刻度标签由各轴的 locator/formatter 生成字符串，不创建 Text 对象），
+    再把每个坐标轴放进各自单元格内的同一位置。与逐轴测量的 tight_layout 相比，代价不随面板数增长。
+    """
+    from matplotlib import rcParams
+
+    renderer = fig.canvas.get_renderer()
+    px = dpi / 72.0
+    widest_y, widest_x = "0", "0"
+    for ax in axes:
+        for axis, attr in ((ax.yaxis, "y"), (ax.xaxis, "x")):
+            labels = axis.get_major_formatter().format_ticks(axis.get_majorticklocs())
+            longest = max(labels, key=len, default="0")
+            if attr == "y" and len(longest) > len(widest_y):
+                widest_y = longest
+            elif attr == "x" and len(longest) > len(widest_x):
+                widest_x = longest
+    has_title = any(p.title for p in panels)
+    has_xlabel = any(p.xlabel for p in panels)
+    has_ylabel = any(p.ylabel for p in panels)
+
+    pad = 1.08 * rcParams["font.size"] * px
+    ytick_w, _ = _text_size(renderer, widest_y, rcParams["ytick.labelsize"], dpi)
+    xtick_w, xtick_h = _text_size(renderer, widest_x, rcParams["xtick.labelsize"], dpi)
+    _, label_h = _text_size(renderer, "Ag", rcParams["axes.labelsize"], dpi)
+    _, title_h = _text_size(renderer, "Ag", rcParams["axes.titlesize"], dpi)
+    ytick_room = (rcParams["ytick.major.size"] + rcParams["ytick.major.pad"]) * px + ytick_w
+    xtick_room = (rcParams["xtick.major.size"] + rcParams["xtick.major.pad"]) * px + xtick_h
+    label_room = rcParams["axes.labelpad"] * px + label_h
+
+    left = pad + ytick_room + (label_room if has_ylabel else 0)
+    bottom = pad + xtick_room + (label_room if has_xlabel else 0)
+    top = pad + (rcParams["axes.titlepad"] * px + title_h if has_title else 0)
+    right = pad + xtick_w / 2
+
+    width, height = fig.bbox.width, fig.bbox.height
+    cell_w, cell_h = width / ncols, height / nrows
+    boxes = []
+    for k, ax in enumerate(axes):
+        r, c = divmod(k, ncols)
+        x0, y_top = c * cell_w, r * cell_h
+        ax.set_position([
+            (x0 + left) / width, 1.0 - (y_top + cell_h - bottom) / height,
+            max(cell_w - left - right, 1.0) / width, max(cell_h - top - bottom, 1.0) / height,
+        ])
+        boxes.append((int(round(y_top)), int(round(y_top + cell_h)), int(round(x0)), int(round(x0 + cell_w))))
+    return boxes
+
+
+def render_small_multiples(spec: SmallMultiplesSpec) -> list:
+    """
+    每页只建一张 Figure、做一次布局（见 _grid_layout）、绘制一次；网格图与各面板裁图（即各自的
+    网格单元）都直接从绘制好的 RGBA 像素编码为 PNG，不再逐面板建图、布局与重绘。返回写出的文件列表。
+    """
+
+    Figure, FigureCanvasAgg = _matplotlib()
+    from matplotlib.image import imsave
+
+    grids = output_paths(spec)
+    crops = list(spec.crop_paths) + [None] * (len(spec.panels) - len(spec.crop_paths))
+    written = []
+    for page, start in enumerate(range(0, max(len(spec.panels), 1), spec.max_panels)):
+        panels = spec.panels[start:start + spec.max_panels]
+        ncols = max(1, min(spec.ncols, len(panels)))
+        nrows = max(1, -(-len(panels) // ncols))
+        w, h = spec.panel_size
+        fig = Figure(figsize=(w * ncols, h * nrows), dpi=spec.dpi)
+        canvas = FigureCanvasAgg(fig)
+        axes = fig.subplots(nrows, ncols, squeeze=False).ravel()
+        for ax, panel in zip(axes, panels):
+            for line in panel.lines:
+                ax.plot(line.x, line.y, marker=line.marker, label=line.label)
+            # 标注裁剪到所在面板，不会画进相邻面板；layout_annotations=False 时不参与布局
+            for artist in _annotate(ax, panel):
+                artist.set_clip_on(True)
+                artist.set_in_layout(panel.layout_annotations)
+            _label_axes(ax, panel)
+        for ax in axes[len(panels):]:
+            ax.set_visible(False)
+        boxes = _grid_layout(fig, axes[:len(panels)], panels, nrows, ncols, spec.dpi)
+        canvas.draw()
+        pixels = np.asarray(canvas.buffer_rgba())
+
+        imsave(grids[page], pixels)
+        written.append(grids[page])
+        for (top, bottom, left, right), crop in zip(boxes, crops[start:start + spec.max_panels]):
+            if crop is not None:
+                imsave(crop, pixels[top:bottom, left:right])
+                written.append(crop)
+    return written
+
+
+def _render_timed(spec: ChartSpec):
+    """在渲染进程中绘图，返回 (路径, 开始时间戳, 墙钟秒, CPU 秒, pid)，供主进程记入 trace。"""
+    start, cpu0 = time.time(), time.process_time()
+    path = render_chart(spec)
+    return path, start, time.time() - start, time.process_time() - cpu0, os.getpid()
+
+
+_pool = None
+_pool_pid = None
+
+
+def get_render_pool(max_workers=None) -> ProcessPoolExecutor:
+    """返回本进程共享的渲染进程池（首次调用时创建并预热）。
+
+    在 Linux 上使用 fork，建池前先导入 matplotlib，worker 直接继承；预热会立即拉起全部
+    worker，应在启动其他线程之前调用，避免在多线程状态下 fork。调用时已有其他线程在运行
+    （例如 async_writes 的后台 writer）则改用 forkserver，worker 各自导入 matplotlib。
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        ctx = None
+        if os.name == "posix":
+            if threading.active_count() > 1:
+                logger.warning("Other threads are running; starting the render pool with forkserver instead of fork")
+                ctx = multiprocessing.get_context("forkserver")
+            else:
+                _matplotlib()
+                ctx = multiprocessing.get_context("fork")
+        _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx)
+        _pool_pid = os.getpid()
+        _pool.submit(int).result()
+    return _pool
+
+
+def shutdown_render_pool():
+    """关闭共享渲染进程池。"""
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown()
+    _pool = None
+    _pool_pid = None
+
+
+atexit.register(shutdown_render_pool)
+
+
+def render_charts(specs, parallel: bool = True, incremental: bool = True) -> list:
+    """
+    渲染一组 ChartSpec。parallel=True 时提交到共享进程池，所有图并行渲染；
+    否则（或当前已是子进程时）在当前进程中依次渲染。单张图失败只记录日志，不影响其他图。
+    set_plotting(False) 时直接返回空列表。
+
+    incremental=True 时，输出目录清单中描述哈希未变且文件仍存在的图直接跳过，
+    文件保持原 mtime。清单由调用方在运行结束时 save_manifest 写盘。
+
+    返回本次实际保存的路径列表（顺序与 specs 一致，SmallMultiplesSpec 展开为网格图与各裁图）。
+    """
+
+    specs = list(specs)
+    if not _plotting_enabled:
+        logger.info(f"Plotting disabled; skipping {len(specs)} chart(s)")
+        return []
+    hashes = {}
+    if incremental:
+        todo = []
+        for spec in specs:
+            path = Path(spec.path)
+            h = spec_hash(spec)
+            fresh = all(Path(p).exists() for p in output_paths(spec))
+            if fresh and get_entry(path.parent, "charts", path.name) == h:
+                logger.info(f"Chart {path.name} unchanged; skipping render")
+                continue
+            hashes[spec.path] = h
+            todo.append(spec)
+        specs = todo
+    if not specs:
+        return []
+
+    # 已经在子进程（例如进程池中的阶段）里时直接在本进程渲染，不再嵌套进程池
+    if parallel and multiprocessing.parent_process() is None:
+        pool = get_render_pool()
+        futures = [pool.submit(_render_timed, spec) for spec in specs]
+        outcomes = []
+        for spec, fut in zip(specs, futures):
+            try:
+                path, start, dur, cpu, pid = fut.result()
+                outcomes.append(path)
+                if tracing_enabled():
+                    size = sum(Path(p).stat().st_size for p in output_paths(spec))
+                    add_bytes(size)
+                    add_event(f"render {Path(path).name}", "render", start, dur, pid=pid, tid=pid,
+                              args={"cpu_ms": round(cpu * 1000, 3), "bytes_written": size})
+            except Exception:
+                logger.exception(f"Failed to render chart {spec.path}")
+                outcomes.append(None)
+    else:
+        outcomes = []
+        for spec in specs:
+            try:
+                with span(f"render {Path(spec.path).name}", "render"):
+                    outcomes.append(render_chart(spec))
+                    if tracing_enabled():
+                        add_bytes(sum(Path(p).stat().st_size for p in output_paths(spec)))
+            except Exception:
+                logger.exception(f"Failed to render chart {spec.path}")
+                outcomes.append(None)
+
+    saved = []
+    for spec, p in zip(specs, outcomes):
+        if p is None:
+            continue
+        for out in output_paths(spec):
+            logger.info(f"Saved plot to {out}")
+            saved.append(out)
+        if p in hashes:
+            set_entry(Path(p).parent, "charts", Path(p).name, hashes[p])
+    return saved
@@ -0,0 +1,195 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+# 算法说明中视为逐年上升、按线性拟合的成本项
+COST_METRICS = (
+    "administrative_expenses",
+    "cash_paid_to_and_for_employees",
+    "operating_cost",
+    "taxes_and_surcharges",
+)
+TREND_MODELS = ("linear", "log_linear", "piecewise")
+# 各模型的参数个数（线性 a + b·t；对数线性 ln y = a + b·t；分段 a + b·t + c·max(0, t - k)）
+MODEL_PARAMS = {"linear": 2, "log_linear": 2, "piecewise": 3}
+# 分段模型拐点两侧各至少需要的有效年份数
+MIN_SEGMENT_POINTS = 2
+
+
+@dataclass
+class TrendFits:
+    """
+    一批序列（行）在三种趋势模型下的拟合结果，数组第一维对应 TREND_MODELS。
+
+    - labels: 各序列的标签（例如指标名或 (ticker, 指标名)）
+    - years / future_years: 拟合用的年份轴 / 预测年份
+    - coef[m, s]: [a, b, c]，t = 年份 - years[0]；线性与对数线性模型 c 为 0
+    - knot[s]: 分段模型选出的拐点年份（没有可用拐点时为 NaN）
+    - n[m, s]: 参与拟合的年份数（对数线性只用正值）
+    - fitted[m, s, t] / projection[m, s, h]: 拟合值与预测值（原始单位，对数线性已取指数）
+    - resid_std[m, s]: 原始单位下的残差标准差 sqrt(SSE / (n - p))，自由度不足时为 NaN
+    """
+
+    labels: list
+    years: np.ndarray
+    future_years: np.ndarray
+    coef: np.ndarray
+    knot: np.ndarray
+    n: np.ndarray
+    fitted: np.ndarray
+    projection: np.ndarray
+    resid_std: np.ndarray
+
+    def to_rows(self, ndigits: int = 4) -> dict:
+        """{标签: {模型: {coef, resid_std, projection, ...}}}，缺失值为 None。"""
+
+        def num(v):
+            return None if not np.isfinite(v) else round(float(v), ndigits)
+
+        out = {}
+        for s, label in enumerate(self.labels):
+            fits = {}
+            for m, model in enumerate(TREND_MODELS):
+                p = MODEL_PARAMS[model]
+                fits[model] = {
+                    "coef": [num(c) for c in self.coef[m, s, :p]],
+                    "n": int(self.n[m, s]),
+                    "resid_std": num(self.resid_std[m, s]),
+                    "projection": {int(y): num(v) for y, v in zip(self.future_years, self.projection[m, s])},
+                }
+            knot = self.knot[s]
+            fits["piecewise"]["knot"] = None if np.isnan(knot) else int(knot)
+            out[label] = fits
+        return out
+
+
+def _design(t: np.ndarray, knots: np.ndarray) -> np.ndarray:
+    """
+    全部候选模型的设计矩阵，形状 (1 + 1 + K, len(t), 3)：线性、对数线性（第三列补 0）
+    与每个候选拐点 k 的分段模型。
+    """
+    ones = np.ones_like(t)
+    plain = np.stack([ones, t, np.zeros_like(t)], axis=-1)
+    hinge = np.stack(np.broadcast_arrays(ones, t, np.maximum(0.0, t[None, :] - knots[:, None])), axis=-1)
+    return np.concatenate([plain[None], plain[None], hinge], axis=0)
+
+
+def fit_trends(years, values, mask, horizon: int = 3, labels=None) -> TrendFits:
+    """
+    对 values（序列 × 年份，mask 为有效值）同时拟合三种趋势并预测 horizon 年。
+
+    所有序列、所有模型与分段模型的全部候选拐点堆叠成一批 3×3 加权正规方程
+    A = Σ w·x·xᵀ, b = Σ w·x·y，一次批量求解（缺失年份权重为 0）；分段模型再按 SSE
+    为每个序列选拐点。有效年份不足的序列系数为 NaN。
+    """
+    years = np.asarray(years, dtype=np.int64)
+    values = np.asarray(values, dtype=float).reshape(-1, len(years))
+    mask = np.asarray(mask, dtype=bool).reshape(values.shape) & np.isfinite(values)
+    n_series, n_years = values.shape
+    labels = list(range(n_series)) if labels is None else list(labels)
+    t = (years - years[0]).astype(float) if n_years else np.zeros(0)
+
+    # 拐点候选：内部年份
+    knots = t[1:-1] if n_years > 2 else np.zeros(0)
+    X = _design(t, knots)
+
+    positive = mask & (values > 0)
+    y_lin = np.where(mask, values, 0.0)
+    y_log = np.where(positive, np.log(np.where(positive, values, 1.0)), 0.0)
+    # 每个模型一层：(M, S, T)
+    Y = np.concatenate([y_lin[None], y_log[None], np.broadcast_to(y_lin, (len(knots), n_series, n_years))], axis=0)
+    W = np.concatenate([mask[None], positive[None], np.broadcast_to(mask, (len(knots), n_series, n_years))], axis=0)
+    W = W.astype(float)
+
+    # 拐点两侧都要有足够的点，否则该候选无效
+    if len(knots):
+        before = np.cumsum(mask, axis=1)[:, 1:-1].T
+        after = mask.sum(axis=1)[None, :] - before
+        usable = (before >= MIN_SEGMENT_POINTS) & (after >= MIN_SEGMENT_POINTS)
+    else:
+        usable = np.zeros((0, n_series), dtype=bool)
+    n = W.sum(axis=-1).astype(np.int64)
+    solvable = np.concatenate([n[:2] >= 2, usable], axis=0)
+
+    # Σ_t w·x·xᵀ 与 Σ_t w·x·y 写成 (S × T) @ (T × 9) / (T × 3) 的批量矩阵乘法
+    XX = (X[..., :, None] * X[..., None, :]).reshape(len(X), n_years, 9)
+    A = (W @ XX).reshape(len(X), n_series, 3, 3)
+    b = (W * Y) @ X
+    # 线性与对数线性补的第三列全为 0：对角置 1 使方程组可解且 c 恰为 0；不可解的方程组换成单位阵
+    A[:2, :, 2, 2] = 1.0
+    A[~solvable] = np.eye(3)
+    coef = np.linalg.solve(A, b[..., None])[..., 0]
+
+    # 分段模型：取 SSE 最小的可用拐点
+    if len(knots):
+        resid = np.where(W[2:] > 0, Y[2:] - coef[2:] @ X[2:].transpose(0, 2, 1), 0.0)
+        piece_sse = np.where(usable, (resid ** 2).sum(axis=-1), np.inf)
+        best = np.argmin(piece_sse, axis=0)
+        has_knot = usable.any(axis=0)
+        cols = np.arange(n_series)
+        piece_coef = np.where(has_knot[:, None], coef[2:][best, cols], np.nan)
+        knot_t = np.where(has_knot, knots[best], np.nan)
+    else:
+        piece_coef = np.full((n_series, 3), np.nan)
+        knot_t = np.full(n_series, np.nan)
+
+    coef = np.stack([coef[0], coef[1], piece_coef])
+    n = np.stack([n[0], n[1], np.where(np.isnan(knot_t), 0, n[0])])
+    params = np.array([MODEL_PARAMS[m] for m in TREND_MODELS])[:, None]
+    coef[:2] = np.where(solvable[:2, :, None], coef[:2], np.nan)
+
+    future = np.arange(1, horizon + 1, dtype=np.int64) + (years[-1] if n_years else 0)
+
+    def evaluate(tt):
+        hinge = np.maximum(0.0, tt[None, :] - knot_t[:, None])
+        linear = coef[0, :, :1] + coef[0, :, 1:2] * tt
+        log_linear = np.exp(coef[1, :, :1] + coef[1, :, 1:2] * tt)
+        piecewise = coef[2, :, :1] + coef[2, :, 1:2] * tt + coef[2, :, 2:3] * hinge
+        return np.stack([linear, log_linear, piecewise])
+
+    fitted = evaluate(t)
+    projection = evaluate((future - (years[0] if n_years else 0)).astype(float))
+
+    # 残差标准差统一在原始单位上计算，三种模型可直接比较
+    sse_raw = np.where(mask[None], (values[None] - fitted) ** 2, 0.0).sum(axis=-1)
+    dof = n - params
+    with np.errstate(invalid="ignore", divide="ignore"):
+        resid_std = np.where((dof > 0) & np.isfinite(sse_raw), np.sqrt(sse_raw / np.maximum(dof, 1)), np.nan)
+
+    return TrendFits(
+        labels=labels,
+        years=years,
+        future_years=future,
+        coef=coef,
+        knot=knot_t + (years[0] if n_years else 0),
+        n=n,
+        fitted=fitted,
+        projection=projection,
+        resid_std=resid_std,
+    )
+
+
+def fit_store(store, metrics=COST_METRICS, horizon: int = 3) -> TrendFits:
+    """单家公司（YearStore）的各成本项，标签为指标名。"""
+    values = np.vstack([store.col(m) for m in metrics]).reshape(len(metrics), len(store.years))
+    mask = np.vstack([store.mask(m) for m in metrics]).reshape(values.shape)
+    return fit_trends(store.years, values, mask, horizon=horizon, labels=list(metrics))
+
+
+def fit_universe(universe, metrics=COST_METRICS, horizon: int = 3) -> TrendFits:
+    """
+    多公司数据集（universe.Universe）中全部公司 × 成本项一次拟合，标签为 (ticker, 指标名)。
+
+    数据集中没有的指标跳过；各公司年份不同时缺失年份权重为 0。
+    """
+    metrics = [m for m in metrics if m in universe.manifest["company_metrics"]]
+    values, mask, labels = [], [], []
+    for m in metrics:
+        v, k, _ = universe.metric(m)
+        values.append(np.asarray(v))
+        mask.append(np.asarray(k))
+        labels.extend((ticker, m) for ticker in universe.tickers)
+    shape = (len(labels), len(universe.years))
+    values = np.concatenate(values).reshape(shape) if values else np.zeros(shape)
+    mask = np.concatenate(mask).reshape(shape) if mask else np.zeros(shape, dtype=bool)
+    return fit_trends(universe.years, values, mask, horizon=horizon, labels=labels)
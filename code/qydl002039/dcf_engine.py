@@ -0,0 +1,258 @@
+from dataclasses import dataclass, field, fields, replace
+
+import numpy as np
+
+from cost_trends import TREND_MODELS, fit_store
+from price_scenarios import _latest, base_scenarios
+from revenue_engine import CONSOLIDATION_THRESHOLD
+from station_registry import StationRegistry
+
+# 计入现金流的成本项（利润表口径；cash_paid_to_and_for_employees 已含在营业成本/管理费用中，不重复扣除）
+DCF_COST_METRICS = (
+    "operating_cost",
+    "taxes_and_surcharges",
+    "administrative_expenses",
+)
+
+
+@dataclass(frozen=True)
+class DCFAssumptions:
+    """
+    现金流预测的假设。
+
+    - rate: 折现率（None 时取 data.json 顶层 expected_rate）
+    - horizon: 预测年数；terminal=True 时最后一年的现金流按永续年金计入终值
+    - price_growth: 上网电价年增长率
+    - exclude_years: 计算多年平均发电量时排除的年份
+    - cost_metrics / cost_model: 扣除的公司成本项及其趋势模型（TREND_MODELS 之一，见 cost_trends）
+    - price_overrides / generation_overrides / share_overrides: 按电站名覆盖最新电价（元/千瓦时）、
+      多年平均发电量（亿千瓦时）、持股比例（%）
+    """
+
+    rate: float = None
+    horizon: int = 20
+    price_growth: float = 0.0
+    exclude_years: tuple = ()
+    cost_metrics: tuple = DCF_COST_METRICS
+    cost_model: str = "linear"
+    terminal: bool = True
+    price_overrides: dict = field(default_factory=dict, hash=False)
+    generation_overrides: dict = field(default_factory=dict, hash=False)
+    share_overrides: dict = field(default_factory=dict, hash=False)
+
+
+# 中间结果 -> (直接依赖的假设, 直接依赖的中间结果)；某个假设变化时只丢弃依赖它的中间结果
+_NODES = {
+    "generation": (("exclude_years", "generation_overrides"), ()),
+    "price": (("price_overrides",), ()),
+    "growth": (("price_growth", "horizon"), ()),
+    "revenue": ((), ("generation", "price", "growth")),
+    "share": (("share_overrides",), ()),
+    "cost_fits": (("cost_metrics", "horizon"), ()),
+    "costs": (("cost_model",), ("cost_fits",)),
+    "cash_flow": ((), ("revenue", "share", "costs")),
+    "discount": (("rate", "horizon", "terminal"), ()),
+    "station_npv": ((), ("cash_flow", "discount")),
+}
+
+
+def _affected(changed) -> set:
+    """受 changed 中任一假设影响的中间结果（含间接依赖）。"""
+    out = set()
+    grew = True
+    while grew:
+        grew = False
+        for node, (params, parents) in _NODES.items():
+            if node not in out and (set(params) & set(changed) or set(parents) & out):
+                out.add(node)
+                grew = True
+    return out
+
+
+def discount_factors(rates, horizon: int, terminal: bool = True) -> np.ndarray:
+    """
+    折现因子矩阵（折现率 × 年份），第 h 年（从 1 起）为 (1 + r)^-h；terminal=True 时
+    最后一年再加上永续终值 1/r，NPV 即现金流与该矩阵的一次点积。
+    """
+    rates = np.atleast_1d(np.asarray(rates, dtype=float))
+    h = np.arange(1, horizon + 1, dtype=float)
+    factors = (1.0 + rates[:, None]) ** -h[None, :]
+    if terminal and horizon:
+        with np.errstate(divide="ignore"):
+            factors[:, -1] *= 1.0 + 1.0 / rates
+    return factors
+
+
+class DCFModel:
+    """
+    电站级现金流折现模型：
+
+    - 营收[i, h] = 电站 i 多年平均发电量 × 最新上网电价 × (1 + price_growth)^h
+    - 公司成本[h] = cost_metrics 各项按 cost_model 趋势外推之和（见 cost_trends，负值截为 0）
+    - 成本按营收比例分摊：成本率[h] = 公司成本[h] / 并入电站（持股 ≥ CONSOLIDATION_THRESHOLD）营收合计，
+      每个电站的成本 = 营收 × 成本率
+    - 现金流[i, h] = 营收 − 成本；按持股比例汇总为归属现金流，一次点积折现
+
+    中间数组按 _NODES 缓存；update() 只让受影响的中间结果失效，例如改折现率只重算折现因子与电站 NPV，
+    改某个电站的电价只重算营收及其下游，成本趋势拟合不重做。
+    """
+
+    def __init__(self, stations: StationRegistry, store, assumptions: DCFAssumptions = None):
+        self.stations = stations
+        self.store = store
+        assumptions = assumptions or DCFAssumptions()
+        self.default_rate = float(store.meta.get("expected_rate", float("nan")))
+        if assumptions.rate is None:
+            assumptions = replace(assumptions, rate=self.default_rate)
+        self.assumptions = assumptions
+        self._cache = {}
+        # 与假设无关的基准量只算一次
+        self._base_price = base_scenarios(stations, store).row("latest")
+        self._base_share = np.nan_to_num(_latest(stations.shareholding, stations.shareholding_mask)[0], nan=100.0)
+
+    def update(self, **changes) -> "DCFModel":
+        """修改假设（同 DCFAssumptions 字段），丢弃受影响的中间结果。"""
+        names = {f.name for f in fields(DCFAssumptions)}
+        unknown = set(changes) - names
+        if unknown:
+            raise TypeError(f"Unknown DCF assumptions: {sorted(unknown)}")
+        changed = [k for k, v in changes.items() if getattr(self.assumptions, k) != v]
+        if changed:
+            self.assumptions = replace(self.assumptions, **changes)
+            for node in _affected(changed):
+                self._cache.pop(node, None)
+        return self
+
+    def _get(self, node: str):
+        if node not in self._cache:
+            self._cache[node] = getattr(self, f"_compute_{node}")()
+        return self._cache[node]
+
+    def _by_station(self, base: np.ndarray, overrides: dict) -> np.ndarray:
+        if not overrides:
+            return base
+        out = base.copy()
+        for name, value in overrides.items():
+            out[self.stations.index(name)] = value
+        return out
+
+    def _compute_generation(self):
+        a = self.assumptions
+        valid = self.stations.generation_mask & ~np.isin(self.stations.years, a.exclude_years)[None, :]
+        counts = valid.sum(axis=1)
+        total = np.where(valid, self.stations.generation, 0.0).sum(axis=1)
+        generation = np.where(counts > 0, total / np.maximum(counts, 1), 0.0)
+        return self._by_station(generation, a.generation_overrides)
+
+    def _compute_price(self):
+        return self._by_station(self._base_price, self.assumptions.price_overrides)
+
+    def _compute_growth(self):
+        a = self.assumptions
+        return (1.0 + a.price_growth) ** np.arange(1, a.horizon + 1, dtype=float)
+
+    def _compute_revenue(self):
+        return (self._get("generation") * self._get("price"))[:, None] * self._get("growth")[None, :]
+
+    def _compute_share(self):
+        share = self._by_station(self._base_share, self.assumptions.share_overrides)
+        consolidated = np.where(share < CONSOLIDATION_THRESHOLD, 0.0, 1.0)
+        return share / 100.0, consolidated
+
+    def _compute_cost_fits(self):
+        a = self.assumptions
+        return fit_store(self.store, a.cost_metrics, horizon=a.horizon)
+
+    def _compute_costs(self):
+        fits = self._get("cost_fits")
+        projection = fits.projection[TREND_MODELS.index(self.assumptions.cost_model)]
+        # 无法拟合的成本项按最近一年的值持平（从未有过数值的记为 0）
+        metrics = self.assumptions.cost_metrics
+        values = np.vstack([self.store.col(m) for m in metrics]).reshape(len(metrics), -1)
+        mask = np.vstack([self.store.mask(m) for m in metrics]).reshape(values.shape)
+        latest, _ = _latest(values, mask)
+        projection = np.where(np.isfinite(projection), projection, np.nan_to_num(latest)[:, None])
+        return np.maximum(projection, 0.0).sum(axis=0)
+
+    def _compute_cash_flow(self):
+        revenue = self._get("revenue")
+        _, consolidated = self._get("share")
+        base = consolidated @ revenue
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cost_ratio = np.where(base > 0, self._get("costs") / base, 0.0)
+        return revenue * (1.0 - cost_ratio)[None, :]
+
+    def _compute_discount(self):
+        a = self.assumptions
+        return discount_factors(a.rate, a.horizon, a.terminal)[0]
+
+    def _compute_station_npv(self):
+        return self._get("cash_flow") @ self._get("discount")
+
+    @property
+    def cash_flow(self) -> np.ndarray:
+        """电站 × 预测年份的现金流（亿元，未按持股比例折算）。"""
+        return self._get("cash_flow")
+
+    @property
+    def station_npv(self) -> np.ndarray:
+        return self._get("station_npv")
+
+    def npv(self, rates=None) -> np.ndarray:
+        """
+        归属 NPV：rates 为 None 时用当前假设的折现率（返回标量数组），否则对一组折现率一次矩阵乘法求值。
+        """
+        share, _ = self._get("share")
+        if rates is None:
+            return np.asarray(share @ self.station_npv)
+        a = self.assumptions
+        return (share @ self.cash_flow) @ discount_factors(rates, a.horizon, a.terminal).T
+
+    def valuation(self, curr_net: float = None, shares: float = None) -> dict:
+        """
+        估值汇总（合并口径）：curr_net = total_liabilities − cash 是合并报表的净负债，因此先从
+        合并 NPV（并表电站 100%）中扣除，再扣除少数股东权益，最后加上不并表电站的归属 NPV：
+
+        - minority_interest: (consolidated_npv − curr_net) × 并表电站 NPV 中不归属母公司的比例
+          （没有子公司层面的负债数据，净负债按 NPV 贡献分摊给少数股东）
+        - associates_npv: 不并表电站按持股比例计的 NPV（其负债不在合并净负债中）
+        - equity_value = consolidated_npv − curr_net − minority_interest + associates_npv，
+          除以总股本得到每股价值（缺少对应输入时为 None）
+
+        全部电站 100% 持股时 equity_value = npv − curr_net。
+        """
+        share, consolidated = self._get("share")
+        npv = float(self.npv())
+        consolidated_npv = float(consolidated @ self.station_npv)
+        associates_npv = float(((1.0 - consolidated) * share) @ self.station_npv)
+        minority_npv = float(((1.0 - share) * consolidated) @ self.station_npv)
+        minority_ratio = minority_npv / consolidated_npv if consolidated_npv > 0 else 0.0
+        if curr_net is not None:
+            minority_interest = (consolidated_npv - curr_net) * minority_ratio
+            equity = consolidated_npv - curr_net - minority_interest + associates_npv
+        else:
+            minority_interest = equity = None
+        per_share = equity / shares if equity is not None and shares not in (0, None) else None
+        return {
+            "rate": self.assumptions.rate,
+            "horizon": self.assumptions.horizon,
+            "terminal": self.assumptions.terminal,
+            "npv": npv,
+            "consolidated_npv": consolidated_npv,
+            "associates_npv": associates_npv,
+            "minority_interest": minority_interest,
+            "equity_value": equity,
+            "per_share_value": per_share,
+            "costs": self._get("costs").tolist(),
+            "stations": {
+                name: {
+                    "generation": float(g),
+                    "price": float(p),
+                    "share": float(s),
+                    "npv": float(v),
+                }
+                for name, g, p, s, v in zip(
+                    self.stations.names, self._get("generation"), self._get("price"), share, self.station_npv
+                )
+            },
+        }
@@ -0,0 +1,130 @@
+import logging
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 每个分块的抽样数；分块 i 固定使用 SeedSequence(seed).spawn 的第 i 个子流，
+# 因此同一 seed 下结果与 deadline 无关地可复现（截止时间只决定用了多少块）
+CHUNK_SIZE = 250_000
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+@dataclass
+class Dist:
+    """
+    一个输入变量的分布描述。
+
+    - kind: "fixed"（常数 loc）、"normal"（loc, scale）、"lognormal"（均值 loc、标准差 scale
+      的对数正态）、"uniform"（low, high）、"triangular"（low, loc 为众数, high）、
+      "empirical"（从 values 中有放回抽样）
+    - low / high: 对 normal/lognormal 抽样结果截断（clip）；uniform/triangular 的区间
+    """
+
+    kind: str = "fixed"
+    loc: float = None
+    scale: float = 0.0
+    low: float = None
+    high: float = None
+    values: list = field(default_factory=list)
+
+    def sample(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        """抽取 n 个样本（float64 数组）。"""
+        if self.kind == "fixed":
+            return np.full(n, float(self.loc))
+        if self.kind == "normal":
+            out = rng.normal(self.loc, self.scale, n) if self.scale else np.full(n, float(self.loc))
+        elif self.kind == "lognormal":
+            # 由目标均值/标准差换算对数正态参数
+            var = np.log1p((self.scale / self.loc) ** 2)
+            out = rng.lognormal(np.log(self.loc) - var / 2, np.sqrt(var), n)
+        elif self.kind == "uniform":
+            return rng.uniform(self.low, self.high, n)
+        elif self.kind == "triangular":
+            return rng.triangular(self.low, self.loc, self.high, n)
+        elif self.kind == "empirical":
+            if not self.values:
+                raise ValueError("empirical distribution needs non-empty values")
+            return rng.choice(np.asarray(self.values, dtype=float), n)
+        else:
+            raise ValueError(f"unknown distribution kind: {self.kind}")
+        if self.low is not None or self.high is not None:
+            out = np.clip(out, self.low, self.high)
+        return out
+
+
+def evaluate_market_value(recognized, rate, ratio, curr_net=None, shares=None):
+    """
+    批量计算估值公式（与 qydl_get_market_value 相同）：
+    market_value = (recognized / rate - curr_net) * ratio，per_share = market_value / shares。
+
+    rate <= 0 的抽样记为 NaN。返回 (market_value, per_share)，per_share 在无股本时为 None。
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mv = np.where(rate > 0, recognized / rate, np.nan)
+    if curr_net is not None:
+        mv -= curr_net
+    mv *= ratio
+    per_share = mv / shares if shares not in (0, None) else None
+    return mv, per_share
+
+
+def summarize(samples: np.ndarray, percentiles=DEFAULT_PERCENTILES, ndigits=3) -> dict:
+    """样本的均值、标准差与分位数（忽略 NaN）。"""
+    valid = samples[np.isfinite(samples)]
+    if valid.size == 0:
+        return {"mean": None, "std": None, "percentiles": {}}
+    qs = np.percentile(valid, percentiles)
+    return {
+        "mean": round(float(valid.mean()), ndigits),
+        "std": round(float(valid.std()), ndigits),
+        "percentiles": {f"p{p:g}": round(float(q), ndigits) for p, q in zip(percentiles, qs)},
+    }
+
+
+def run_monte_carlo(dists: dict, n_draws: int = 1_000_000, seed: int = 0, deadline_s: float = None,
+                    curr_net=None, shares=None, percentiles=DEFAULT_PERCENTILES) -> dict:
+    """
+    分块抽样并批量估值。
+
+    - dists: {"recognized": Dist, "rate": Dist, "ratio": Dist}
+    - deadline_s: 墙钟预算（秒）；超时后不再开始新的分块，用已完成的样本给出当前最佳估计
+      （至少完成一块）。结果中的 complete 表示是否完成全部 n_draws。
+
+    返回 {"n_draws", "requested_draws", "complete", "elapsed_s", "market_value", "per_share_value"}。
+    """
+    start = time.perf_counter()
+    n_chunks = max(1, -(-n_draws // CHUNK_SIZE))
+    streams = np.random.SeedSequence(seed).spawn(n_chunks)
+    mv_parts, ps_parts = [], []
+    done = 0
+    for i, ss in enumerate(streams):
+        if i and deadline_s is not None and time.perf_counter() - start >= deadline_s:
+            logger.info(f"Monte Carlo deadline reached after {done} draws")
+            break
+        n = min(CHUNK_SIZE, n_draws - i * CHUNK_SIZE)
+        rng = np.random.default_rng(ss)
+        mv, ps = evaluate_market_value(
+            dists["recognized"].sample(rng, n),
+            dists["rate"].sample(rng, n),
+            dists["ratio"].sample(rng, n),
+            curr_net=curr_net,
+            shares=shares,
+        )
+        mv_parts.append(mv)
+        if ps is not None:
+            ps_parts.append(ps)
+        done += n
+
+    mv_all = np.concatenate(mv_parts)
+    return {
+        "n_draws": done,
+        "requested_draws": n_draws,
+        "complete": done == n_draws,
+        "elapsed_s": round(time.perf_counter() - start, 3),
+        "market_value": summarize(mv_all, percentiles),
+        "per_share_value": summarize(np.concatenate(ps_parts), percentiles, 6) if ps_parts else None,
+    }
@@ -0,0 +1,193 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from tracing import add_bytes, span
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 单文件结果包：第一行为清单（紧凑 JSON），之后依次是各结果表的紧凑 JSON
+BUNDLE_NAME = "qydl_results.bundle"
+BUNDLE_VERSION = 1
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """先写同目录下的临时文件再 os.replace：读者要么看到旧文件，要么看到完整的新文件。"""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp.open("wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def write_bytes_if_changed(path: Path, data: bytes) -> bool:
+    """内容与磁盘上一致时不写（保留 mtime），否则原子写入；返回是否实际写入。"""
+    path = Path(path)
+    with span(f"write {path.name}", "io"):
+        try:
+            if path.exists() and path.read_bytes() == data:
+                return False
+        except OSError:
+            pass
+        atomic_write_bytes(path, data)
+        add_bytes(len(data))
+    return True
+
+
+def dumps_pretty(obj) -> bytes:
+    """各阶段 JSON 文件的原有格式（indent=2, ensure_ascii=False）。"""
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def bundle_bytes(tables: dict) -> bytes:
+    """
+    把 {name: obj} 编码为结果包：第一行是清单 {"version", "tables": {name: [offset, length]}}，
+    offset 相对清单行之后；各表为紧凑 JSON，可只读取需要的表（见 read_bundle）。
+    """
+    blobs = [(name, json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+             for name, obj in sorted(tables.items())]
+    index, offset = {}, 0
+    for name, blob in blobs:
+        index[name] = [offset, len(blob)]
+        offset += len(blob)
+    header = json.dumps({"version": BUNDLE_VERSION, "tables": index}, ensure_ascii=False, separators=(",", ":"))
+    return header.encode("utf-8") + b"\n" + b"".join(blob for _, blob in blobs)
+
+
+def read_bundle(path: Path, names=None) -> dict:
+    """读取结果包中的表（names 为 None 时读取全部），返回 {name: obj}。"""
+    with Path(path).open("rb") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != BUNDLE_VERSION:
+            raise ValueError(f"Unsupported bundle version in {path}: {header.get('version')}")
+        base = f.tell()
+        out = {}
+        for name in (header["tables"] if names is None else names):
+            offset, length = header["tables"][name]
+            f.seek(base + offset)
+            out[name] = json.loads(f.read(length))
+    return out
+
+
+class OutputWriter:
+    """
+    后台写出线程：submit 只把 (路径, 对象) 放进队列，序列化、比较与原子写入在后台线程中进行，
+    与后续计算重叠。同一队列按提交顺序写出（例如增量清单总在它记录的产物之后落盘）。
+    提交时还不知道内容是否变化，因此由后台线程为实际写入的文件记录 "Saved" 日志。
+
+    bundle=True 时 JSON 结果同时收入所在输出目录的结果包；bundle_only=True 时只写结果包，
+    不再逐个写小文件（此时增量清单无法据文件判断新鲜度，相关阶段每次都会重新计算）。
+    """
+
+    def __init__(self, bundle: bool = False, bundle_only: bool = False):
+        self.bundle = bundle or bundle_only
+        self.bundle_only = bundle_only
+        self.errors = []
+        self._queue = queue.Queue()
+        self._bundles = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="qydl-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, payload = item
+                try:
+                    data = payload() if callable(payload) else payload
+                    if write_bytes_if_changed(path, data):
+                        logger.info(f"Saved {path}")
+                except Exception as e:
+                    logger.exception(f"Failed to write {path}")
+                    self.errors.append((str(path), f"{type(e).__name__}: {e}"))
+            finally:
+                self._queue.task_done()
+
+    def submit_json(self, path: Path, obj):
+        """提交一个 JSON 结果（提交后调用方不应再修改 obj）。"""
+        path = Path(path)
+        if self.bundle:
+            with self._lock:
+                self._bundles.setdefault(path.parent, {})[path.stem] = obj
+            if self.bundle_only:
+                return
+        self._queue.put((path, lambda: dumps_pretty(obj)))
+
+    def submit_bytes(self, path: Path, data: bytes):
+        self._queue.put((Path(path), data))
+
+    def flush(self) -> list:
+        """写出结果包并等待队列清空，返回本 writer 至今的写入失败列表 [(path, error), ...]。"""
+        with self._lock:
+            bundles, self._bundles = self._bundles, {}
+        for out_dir, tables in bundles.items():
+            self._queue.put((out_dir / BUNDLE_NAME, lambda tables=tables, out_dir=out_dir: _merged_bundle_bytes(out_dir, tables)))
+        self._queue.join()
+        return list(self.errors)
+
+    def close(self) -> list:
+        errors = self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        return errors
+
+
+def _merged_bundle_bytes(out_dir: Path, tables: dict) -> bytes:
+    # 已有结果包时合并（未重新计算的阶段保留上次的表）
+    path = Path(out_dir) / BUNDLE_NAME
+    merged = {}
+    if path.exists():
+        try:
+            merged = read_bundle(path)
+        except Exception:
+            logger.exception(f"Ignoring unreadable bundle {path}")
+    merged.update(tables)
+    return bundle_bytes(merged)
+
+
+_writer = None
+
+
+def current_writer():
+    """当前启用的后台 writer；未启用时返回 None（写入同步进行）。"""
+    return _writer
+
+
+@contextmanager
+def async_writes(bundle: bool = False, bundle_only: bool = False):
+    """
+    在 with 块内把 JSON 写入交给后台线程；退出时写出结果包并等待全部写完。
+
+    已在某个 async_writes 块内时直接复用外层 writer。
+    """
+    global _writer
+    if _writer is not None:
+        yield _writer
+        return
+    _writer = OutputWriter(bundle, bundle_only)
+    try:
+        yield _writer
+    finally:
+        writer, _writer = _writer, None
+        errors = writer.close()
+        if errors:
+            logger.warning(f"{len(errors)} output(s) failed to write: {[p for p, _ in errors]}")
+
+
+@atexit.register
+def _flush_at_exit():
+    if _writer is not None:
+        _writer.flush()
@@ -0,0 +1,172 @@
+import itertools
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from revenue_engine import CONSOLIDATION_THRESHOLD, subsidiary_matrix
+from station_registry import StationRegistry
+
+COMPOSITION_PRICE = {
+    "hydro": "revenue_composition.hydro_price_yuan_per_kwh",
+    "pv": "revenue_composition.pv_price_yuan_per_kwh",
+}
+AVG_PRICE = "avg_on_grid_price"
+
+
+@dataclass
+class PriceScenarios:
+    """
+    一组上网电价情景：prices[s, i] 是情景 names[s] 下电站 stations[i] 的电价（元/千瓦时）。
+
+    sources 记录各基准电价的来源（例如某电站最新电价缺失时改用 revenue_composition 的分类电价）。
+    """
+
+    names: list
+    stations: list
+    prices: np.ndarray
+    sources: dict = field(default_factory=dict)
+
+    def __len__(self):
+        return len(self.names)
+
+    def row(self, name: str) -> np.ndarray:
+        return self.prices[self.names.index(name)]
+
+    def extend(self, names, prices) -> "PriceScenarios":
+        return PriceScenarios(
+            names=self.names + list(names),
+            stations=self.stations,
+            prices=np.vstack([self.prices, np.asarray(prices, dtype=float).reshape(-1, len(self.stations))]),
+            sources=self.sources,
+        )
+
+
+@dataclass
+class ScenarioRevenue:
+    """
+    各情景的预测营收（亿元）：total[s] 为合并口径总营收，by_subsidiary[s, j] 为一级子公司 subsidiaries[j] 的营收。
+
+    generation 为各电站的预测发电量（多年平均，亿千瓦时），weight 为并入权重（持股比例低于
+    CONSOLIDATION_THRESHOLD 的子公司为 0）。
+    """
+
+    scenarios: PriceScenarios
+    subsidiaries: list
+    generation: np.ndarray
+    weight: np.ndarray
+    total: np.ndarray
+    by_subsidiary: np.ndarray
+
+    def to_rows(self, ndigits: int = 3) -> list:
+        rows = []
+        for s, name in enumerate(self.scenarios.names):
+            rows.append({
+                "scenario": name,
+                "revenue": round(float(self.total[s]), ndigits),
+                "subsidiary_revenues": {
+                    sub: round(float(self.by_subsidiary[s, j]), ndigits) for j, sub in enumerate(self.subsidiaries)
+                },
+            })
+        return rows
+
+
+def _latest(values: np.ndarray, mask: np.ndarray):
+    """按行取最后一个有效值：返回 (值, 是否存在)。"""
+    has = mask.any(axis=1)
+    last = mask.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1)
+    return np.where(has, values[np.arange(len(values)), last], np.nan), has
+
+
+def latest_column(store, name: str) -> float:
+    """store 中某指标最近一年的有效值；没有时为 NaN。"""
+    mask = store.mask(name)
+    return float(store.col(name)[mask][-1]) if mask.any() else float("nan")
+
+
+def base_scenarios(stations: StationRegistry, store) -> PriceScenarios:
+    """
+    两个基准情景：
+
+    - "latest": 每个电站最新的 on_grid_price（算法说明“上网电价只取最新值”）；从未有过电价的电站
+      依次用 revenue_composition 中对应类型（水电/光伏）的最新电价、avg_on_grid_price 代替
+    - "composition": 每个电站都用 revenue_composition 中对应类型的最新电价
+    """
+    kind_price = {kind: latest_column(store, path) for kind, path in COMPOSITION_PRICE.items()}
+    avg = latest_column(store, AVG_PRICE)
+    for kind, price in kind_price.items():
+        if np.isnan(price):
+            kind_price[kind] = avg
+    composition = np.array([kind_price.get(kind, avg) for kind in stations.kinds], dtype=float)
+
+    latest, has = _latest(stations.price, stations.price_mask)
+    latest = np.where(has, latest, composition)
+    sources = {
+        "latest_fallback": [n for n, ok in zip(stations.names, has.tolist()) if not ok],
+        "composition_prices": kind_price,
+        "avg_on_grid_price": avg,
+    }
+    return PriceScenarios(
+        names=["latest", "composition"],
+        stations=list(stations.names),
+        prices=np.vstack([latest, composition]).reshape(2, len(stations)),
+        sources=sources,
+    )
+
+
+def tariff_shocks(base: PriceScenarios, shocks: dict, kinds: list, base_name: str = "latest") -> PriceScenarios:
+    """
+    按相对变化生成情景：shocks = {名称: {键: 变化率}}，键可以是 "hydro"、"pv"、"all" 或电站名
+    （电站名优先于类型，类型优先于 "all"），例如 {"hydro-5%": {"hydro": -0.05}}。
+    也可用 {"base": "composition"} 指定在哪个基准情景上施加变化。
+    """
+    names, rows = [], []
+    for name, spec in shocks.items():
+        spec = dict(spec)
+        start = base.row(spec.pop("base", base_name))
+        change = np.array([
+            spec.get(station, spec.get(kind, spec.get("all", 0.0)))
+            for station, kind in zip(base.stations, kinds)
+        ], dtype=float)
+        names.append(name)
+        rows.append(start * (1.0 + change))
+    return base.extend(names, rows) if names else base
+
+
+def shock_grid(base: PriceScenarios, kinds: list, hydro=(0.0,), pv=(0.0,), base_name: str = "latest") -> PriceScenarios:
+    """水电 × 光伏相对变化的笛卡尔网格（每个组合一个情景，名称如 "hydro-5%/pv+10%"），一次广播生成。"""
+    hydro = np.asarray(hydro, dtype=float)
+    pv = np.asarray(pv, dtype=float)
+    is_pv = np.array([k == "pv" for k in kinds])
+    h, p = (a.ravel() for a in np.meshgrid(hydro, pv, indexing="ij"))
+    change = np.where(is_pv[None, :], p[:, None], h[:, None])
+    prices = base.row(base_name)[None, :] * (1.0 + change)
+    names = [f"hydro{a * 100:+g}%/pv{b * 100:+g}%" for a, b in itertools.product(hydro.tolist(), pv.tolist())]
+    return base.extend(names, prices)
+
+
+def project_revenue(stations: StationRegistry, scenarios: PriceScenarios, subsidiaries: list,
+                    share: np.ndarray = None) -> ScenarioRevenue:
+    """
+    用各电站多年平均发电量与并入权重，一次矩阵乘法算出全部情景的营收。
+
+    share: 各电站所属一级子公司的最新持股比例（%），默认取 stations.shareholding 最近的有效值；
+    低于 CONSOLIDATION_THRESHOLD 的不并入，缺失视为全资。
+    """
+    valid = stations.generation_mask
+    counts = valid.sum(axis=1)
+    generation = np.where(counts > 0, np.where(valid, stations.generation, 0.0).sum(axis=1) / np.maximum(counts, 1), 0.0)
+    if share is None:
+        share, _ = _latest(stations.shareholding, stations.shareholding_mask)
+    weight = np.where(np.nan_to_num(share, nan=100.0) < CONSOLIDATION_THRESHOLD, 0.0, 1.0)
+
+    weighted = generation * weight
+    total = scenarios.prices @ weighted
+    by_subsidiary = (scenarios.prices * weighted[None, :]) @ subsidiary_matrix(stations, subsidiaries).T
+    return ScenarioRevenue(
+        scenarios=scenarios,
+        subsidiaries=list(subsidiaries),
+        generation=generation,
+        weight=weight,
+        total=total,
+        by_subsidiary=by_subsidiary,
+    )
@@ -1,12 +1,31 @@
+import time
+
+_IMPORT_START = time.perf_counter()
+
+import argparse
+import hashlib
 import json
 import logging
 import math
+import sys
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field, fields as dataclass_fields
 from pathlib import Path
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+import numpy as np
+
+# 模块级只导入读取数据与调度各阶段所需的部分；绘图、估值等功能模块在用到它们的函数内导入，
+# 只做计算或只查询一部分结果时不为其余功能付出导入时间
+from build_manifest import fields_hash, get_entry, reset_manifest, save_manifest, set_entry, write_json_if_changed
+from cost_trends import COST_METRICS
+from output_writer import BUNDLE_NAME, async_writes, current_writer
+from stage_scheduler import Stage, prune_fresh, run_stages
+from station_registry import StationRegistry, build_station_registry
+from store_snapshot import read_snapshot, registry_from_snapshot, source_digest, write_snapshot
+from tracing import SUMMARY_NAME as TRACE_SUMMARY_NAME, TRACE_NAME, span, start_tracing, start_tracing_from_env, stop_tracing
 
 DATA_FILE = Path(__file__).parent / "data.json"
+# 各阶段默认输出目录（与 data.json 同目录）
+OUT_DIR = DATA_FILE.parent
 
 logging.basicConfig(format="%(asctime)s %(levelname)s %(funcName)s: %(message)s")
 logger = logging.getLogger(__name__)
@@ -17,151 +36,252 @@ def load_json(path: Path):
     """从 JSON 文件读取并返回 Python 对象。"""
     with path.open("r", encoding="utf-8") as f:
         return json.load(f)
-    
 
-def qydl_extract_generation_output(json_data):
-    """提取子公司各年的 generation_output 数据。"""
-
-
-    puding_generation_output = {}
-    yinzidu_generation_output = {}
-    guangzhao_generation_output = {}
-    dongjing_generation_output = {}
-    mamaya_generation_output = {}
-    shannipo_generation_output = {}
-    yutang_generation_output = {}
-    qingxi_generation_output = {}
-    niudu_generation_output = {}
-    guangzhao_pv_generation_output = {}
-    dongjing_pv_pv_generation_output = {}
-    mamaya_pv_generation_output = {}
-    zhenningbeicao_pv_generation_output = {}
-
-    for key, val in json_data.items():
-        # 跳过非字典项（例如 "expected_rate" 或 "curr"）
-        if not isinstance(val, dict):
-            continue
 
-        subsidiaries = val.get("subsidiaries")
-        if not isinstance(subsidiaries, dict):
+@dataclass
+class YearStore:
+    """data.json 的列式视图：排序后的年份索引 + 每个指标一列 float64。
+
+    - years: 排序后的年份 (int64)
+    - columns: 指标路径 -> float64 数组，缺失或 "NA" 记为 NaN
+    - masks: 指标路径 -> bool 数组，True 表示该年是有效数值
+    - present: 指标路径 -> bool 数组，True 表示该年存在该字段（包括 "NA"）
+    - meta: 非年份的顶层字段（例如 "expected_rate"、"curr"）
+
+    指标路径用 "." 连接嵌套键，例如 "subsidiaries.beipanjiang.guangzhao.generation_output"。
+    """
+
+    years: np.ndarray
+    columns: dict = field(default_factory=dict)
+    masks: dict = field(default_factory=dict)
+    present: dict = field(default_factory=dict)
+    meta: dict = field(default_factory=dict)
+    # 由本 store 派生、可复用的结构（例如电站索引），见 qydl_station_registry
+    derived: dict = field(default_factory=dict, repr=False, compare=False)
+
+    def col(self, name: str) -> np.ndarray:
+        """返回指标列；不存在的指标返回全 NaN。"""
+        c = self.columns.get(name)
+        if c is None:
+            return np.full(len(self.years), np.nan)
+        return c
+
+    def mask(self, name: str) -> np.ndarray:
+        """返回指标的有效值掩码；不存在的指标返回全 False。"""
+        m = self.masks.get(name)
+        if m is None:
+            return np.zeros(len(self.years), dtype=bool)
+        return m
+
+    def is_present(self, name: str) -> np.ndarray:
+        """返回字段在各年是否存在（包括 "NA"）；不存在的指标返回全 False。"""
+        p = self.present.get(name)
+        if p is None:
+            return np.zeros(len(self.years), dtype=bool)
+        return p
+
+    def to_list(self, name: str, ndigits=None) -> list:
+        """转换为 JSON 友好的列表，缺失值为 None，可选保留 ndigits 位小数。"""
+        out = []
+        for v, ok in zip(self.col(name).tolist(), self.mask(name).tolist()):
+            if not ok:
+                out.append(None)
+            else:
+                out.append(round(v, ndigits) if ndigits is not None else v)
+        return out
+
+    def children(self, prefix: str) -> list:
+        """按首次出现顺序返回 prefix 下一层的键名。"""
+        head = prefix + "."
+        names = {}
+        for path in self.columns:
+            if path.startswith(head):
+                names.setdefault(path[len(head):].split(".", 1)[0], None)
+        return list(names)
+
+    def node_present(self, prefix: str) -> np.ndarray:
+        """返回 prefix 节点在各年是否存在（其下任意字段存在即可）。"""
+        head = prefix + "."
+        out = np.zeros(len(self.years), dtype=bool)
+        for path, p in self.present.items():
+            if path == prefix or path.startswith(head):
+                out |= p
+        return out
+
+
+def build_year_store(json_data) -> YearStore:
+    """一次遍历 data.json，解析年份键并做类型检查，构建 YearStore。"""
+
+    entries = []
+    meta = {}
+    for k, v in json_data.items():
+        try:
+            y = int(k)
+        except Exception:
+            meta[k] = v
             continue
+        entries.append((y, v))
+    entries.sort(key=lambda t: t[0])
 
-        puding = subsidiaries.get("puding")
-        yinzidu = subsidiaries.get("yinzidu")
-
-        # 提取 puding 忽略 "NA" 或 None
-        if isinstance(puding, dict):
-            puding_gen = puding.get("generation_output")
-            if puding_gen is not None and puding_gen != "NA":
-                # 保存为 year -> generation_output
-                puding_generation_output[str(key)] = puding_gen
-
-        # 同时提取 yinzidu（如果存在且非 "NA"）
-        if isinstance(yinzidu, dict):
-            yinzidu_gen = yinzidu.get("generation_output")
-            if yinzidu_gen is not None and yinzidu_gen != "NA":
-                yinzidu_generation_output[str(key)] = yinzidu_gen
-
-        beipanjiang = subsidiaries.get("beipanjiang")
-        if isinstance(beipanjiang, dict):
-            guangzhao = beipanjiang.get("guangzhao")
-            if isinstance(guangzhao, dict):
-                guangzhao_gen = guangzhao.get("generation_output")
-                if guangzhao_gen is not None and guangzhao_gen != "NA":
-                    guangzhao_generation_output[str(key)] = guangzhao_gen
-                
-            dongjing = beipanjiang.get("dongjing")
-            if isinstance(dongjing, dict):
-                dongjing_gen = dongjing.get("generation_output")
-                if dongjing_gen is not None and dongjing_gen != "NA":
-                    dongjing_generation_output[str(key)] = dongjing_gen
-
-            mamaya = beipanjiang.get("mamaya")
-            if isinstance(mamaya, dict):
-                mamaya_gen = mamaya.get("generation_output")
-                if mamaya_gen is not None and mamaya_gen != "NA":
-                    mamaya_generation_output[str(key)] = mamaya_gen
-
-        xiyuan = subsidiaries.get("xiyuan")
-        if isinstance(xiyuan, dict):
-            shannipo = xiyuan.get("shannipo")
-            if isinstance(shannipo, dict):
-                shannipo_gen = shannipo.get("generation_output")
-                if shannipo_gen is not None and shannipo_gen != "NA":
-                    shannipo_generation_output[str(key)] = shannipo_gen
-
-        beiyuan = subsidiaries.get("beiyuan")
-        if isinstance(beiyuan, dict):
-            yutang = beiyuan.get("yutang")
-            if isinstance(yutang, dict):
-                yutang_gen = yutang.get("generation_output")
-                if yutang_gen is not None and yutang_gen != "NA":
-                    yutang_generation_output[str(key)] = yutang_gen
-
-            qingxi = beiyuan.get("qingxi")
-            if isinstance(qingxi, dict):
-                qingxi_gen = qingxi.get("generation_output")
-                if qingxi_gen is not None and qingxi_gen != "NA":
-                    qingxi_generation_output[str(key)] = qingxi_gen
-
-            niudu = beiyuan.get("niudu")
-            if isinstance(niudu, dict):
-                niudu_gen = niudu.get("generation_output")
-                if niudu_gen is not None and niudu_gen != "NA":
-                    niudu_generation_output[str(key)] = niudu_gen
-
-        pv_power_plant = subsidiaries.get("pv_power_plant")
-        if isinstance(pv_power_plant, dict):
-            guangzhao_pv = pv_power_plant.get("guangzhao_pv")
-            if isinstance(guangzhao_pv, dict):
-                guangzhao_pv_gen = guangzhao_pv.get("generation_output")
-                if guangzhao_pv_gen is not None and guangzhao_pv_gen != "NA":
-                    guangzhao_pv_generation_output[str(key)] = guangzhao_pv_gen
-
-            dongjing_pv = pv_power_plant.get("dongjing_pv")
-            if isinstance(dongjing_pv, dict):
-                dongjing_pv_gen = dongjing_pv.get("generation_output")
-                if dongjing_pv_gen is not None and dongjing_pv_gen != "NA":
-                    dongjing_pv_pv_generation_output[str(key)] = dongjing_pv_gen
-
-            mamaya_pv = pv_power_plant.get("mamaya_pv")
-            if isinstance(mamaya_pv, dict):
-                mamaya_pv_gen = mamaya_pv.get("generation_output")
-                if mamaya_pv_gen is not None and mamaya_pv_gen != "NA":
-                    mamaya_pv_generation_output[str(key)] = mamaya_pv_gen
-
-            zhenningbeicao_pv = pv_power_plant.get("zhenningbeicao_pv")
-            if isinstance(zhenningbeicao_pv, dict):
-                zhenningbeicao_pv_gen = zhenningbeicao_pv.get("generation_output")
-                if zhenningbeicao_pv_gen is not None and zhenningbeicao_pv_gen != "NA":
-                    zhenningbeicao_pv_generation_output[str(key)] = zhenningbeicao_pv_gen
-
-    combined = {
-        "puding": puding_generation_output,
-        "yinzidu": yinzidu_generation_output,
-        "guangzhao": guangzhao_generation_output,
-        "dongjing": dongjing_generation_output,
-        "mamaya": mamaya_generation_output,
-        "shannipo": shannipo_generation_output,
-        "yutang": yutang_generation_output,
-        "qingxi": qingxi_generation_output,
-        "niudu": niudu_generation_output,
-        "guangzhao_pv": guangzhao_pv_generation_output,
-        "dongjing_pv": dongjing_pv_pv_generation_output,
-        "mamaya_pv": mamaya_pv_generation_output,
-        "zhenningbeicao_pv": zhenningbeicao_pv_generation_output,
-    }
+    n = len(entries)
+    columns = {}
+    masks = {}
+    present = {}
+
+    def walk(node, prefix, i):
+        for k, v in node.items():
+            path = f"{prefix}.{k}" if prefix else k
+            if isinstance(v, dict):
+                walk(v, path, i)
+                continue
+            if path not in columns:
+                columns[path] = np.full(n, np.nan)
+                masks[path] = np.zeros(n, dtype=bool)
+                present[path] = np.zeros(n, dtype=bool)
+            present[path][i] = True
+            if isinstance(v, (int, float)):
+                columns[path][i] = float(v)
+                masks[path][i] = True
+
+    for i, (_, entry) in enumerate(entries):
+        if isinstance(entry, dict):
+            walk(entry, "", i)
+
+    years = np.array([y for y, _ in entries], dtype=np.int64)
+    return YearStore(years=years, columns=columns, masks=masks, present=present, meta=meta)
+
+
+def as_year_store(data) -> YearStore:
+    """接受 YearStore 或原始 JSON 对象，统一返回 YearStore。"""
+    if isinstance(data, YearStore):
+        return data
+    return build_year_store(data)
+
+
+def load_store(path: Path, snapshot: bool = True) -> YearStore:
+    """
+    读取 data.json 并构建 YearStore。
+
+    snapshot=True 时优先使用二进制快照（见 store_snapshot）：源文件未变则不解析 JSON，
+    各列与电站矩阵都是只读 mmap 视图；源文件变化后重新解析并自动重建快照。
+    """
+    path = Path(path)
+    if snapshot:
+        loaded = read_snapshot(path)
+        if loaded is not None:
+            header, arrays = loaded
+            years = arrays["years"]
+            names = header["columns"]
+            store = YearStore(
+                years=years,
+                columns={name: arrays["values"][i] for i, name in enumerate(names)},
+                masks={name: arrays["masks"][i] for i, name in enumerate(names)},
+                present={name: arrays["present"][i] for i, name in enumerate(names)},
+                meta=header["meta"],
+            )
+            store.derived["stations"] = registry_from_snapshot(header, arrays, years)
+            return store
+
+    st = path.stat()
+    raw = path.read_bytes()
+    store = build_year_store(json.loads(raw))
+    if snapshot:
+        try:
+            write_snapshot(path, st, source_digest(raw), store, qydl_station_registry(store))
+        except Exception:
+            logger.exception(f"Failed to write snapshot for {path}")
+    return store
+
+
+def qydl_station_registry(json_data) -> StationRegistry:
+    """返回电站索引（每个 store 只构建一次，各站点级阶段共用）。"""
+    store = as_year_store(json_data)
+    if "stations" not in store.derived:
+        store.derived["stations"] = build_station_registry(store)
+    return store.derived["stations"]
+
+
+
+def qydl_extract_generation_output(json_data):
+    """提取各电站各年的 generation_output 数据（电站由 data.json 推导，见 station_registry）。"""
+
+    stations = qydl_station_registry(json_data)
+    years = stations.years.tolist()
+
+    combined = {}
+    for i, station in enumerate(stations.names):
+        # 忽略 "NA" 或缺失，保存为 year -> generation_output
+        combined[station] = {
+            str(y): v
+            for y, v, ok in zip(years, stations.generation[i].tolist(), stations.generation_mask[i].tolist())
+            if ok
+        }
     return combined
 
 
-def analyze_and_plot_combined(combined: dict, out_dir: Path, show: bool = False):
-    """对 combined 数据绘制折线图并计算每个站点的平均/最大/最小值。
+STREAM_STATE_NAME = "generation_output_stream_state.json"
+# 各站点发电量小图网格（单站点 PNG 由此裁出）
+STATION_GRID_NAME = "generation_output_grid.png"
+
+
+def qydl_save_station_stream_state(streams: dict, out_dir: Path):
+    """保存各电站的流式统计状态（含 5 / 10 / 全部 窗口的当前摘要），供后续只折入新数据时使用。"""
+    out_file = Path(out_dir) / STREAM_STATE_NAME
+    state = {
+        station: {"summary": stream.summary(), "state": stream.to_dict()}
+        for station, stream in streams.items()
+    }
+    try:
+        if write_json_if_changed(out_file, state):
+            logger.info(f"Saved station stream state to {out_file}")
+    except Exception:
+        logger.exception(f"Failed to write station stream state to {out_file}")
+
+
+def qydl_load_station_stream_state(out_dir: Path) -> dict:
+    """读取已保存的流式统计状态：station -> StationStats；文件不存在时返回空 dict。"""
+    from streaming_stats import StationStats
+
+    path = Path(out_dir) / STREAM_STATE_NAME
+    writer = current_writer()
+    if writer is not None:
+        # 状态文件可能还在后台写出队列中
+        writer.flush()
+    if not path.exists():
+        return {}
+    return {station: StationStats.from_dict(d["state"]) for station, d in load_json(path).items()}
+
+
+def qydl_update_station_stats(new_values: dict, out_dir: Path = OUT_DIR) -> dict:
+    """
+    把新一期（年度或季度）的发电量折入已保存的统计状态，不读取 data.json、不回看历史。
+
+    - new_values: {station: {period: value}}，period 如 "2025" 或 "2025Q1"，按时间顺序排列
+    - 年度与季度数据分别进入各自的滚动窗口（summary 中的 windows 与 quarterly）
+    - 新出现的电站从空状态开始；已折入过的 period 忽略
+
+    返回 {station: summary}，并写回状态文件。
+    """
+    from streaming_stats import StationStats
+
+    streams = qydl_load_station_stream_state(out_dir)
+    for station, periods in new_values.items():
+        stream = streams.setdefault(station, StationStats.create())
+        for period, value in periods.items():
+            if not stream.push(period, value):
+                logger.info(f"{station} {period} already folded in; skipping")
+    qydl_save_station_stream_state(streams, out_dir)
+    return {station: stream.summary() for station, stream in streams.items()}
+
+
+def qydl_station_stats(combined: dict):
+    """
+    计算每个站点的平均/标准差/最大/最小值（不写文件、不绘图）。
 
     - combined: dict, 形如 {station: {year_str: value, ...}, ...}
-    - out_dir: Path, 输出文件夹
-    - show: bool, 是否调用 plt.show()
-    返回: stats dict, 每个站点对应 mean/max/min/values
+    返回 (sorted_years, stats, streams)；没有年份数据时返回 None。
     """
+    from streaming_stats import StationStats
 
     # 收集所有年份（数字）并排序
     years = set()
@@ -173,14 +293,13 @@ def analyze_and_plot_combined(combined: dict, out_dir: Path, show: bool = False)
                 except Exception:
                     continue
     if not years:
-        logger.info("No year data found in combined; skipping analysis")
-        return {}
+        return None
 
     sorted_years = sorted(years)
     year_labels = [str(y) for y in sorted_years]
 
     stats = {}
-    plot_data = {}
+    streams = {}
     for station, d in combined.items():
         vals = []
         for y in year_labels:
@@ -192,225 +311,143 @@ def analyze_and_plot_combined(combined: dict, out_dir: Path, show: bool = False)
             else:
                 vals.append(math.nan)
 
-        numeric = [v for v in vals if not math.isnan(v)]
-        if numeric:
-            mean_raw = sum(numeric) / len(numeric)
-            avg = round(mean_raw, 3)
-            mx = max(numeric)
-            mn = min(numeric)
-            # population standard deviation
-            try:
-                var = sum((v - mean_raw) ** 2 for v in numeric) / len(numeric)
-                std = round(math.sqrt(var), 3)
-            except Exception:
-                std = None
-        else:
-            avg = mx = mn = std = None
+        # 流式统计：逐年折入，全部历史窗口即原先的 mean/std/max/min（总体标准差）
+        stream = StationStats.create()
+        for y, v in zip(year_labels, vals):
+            stream.push(y, v)
+        streams[station] = stream
+        summary = stream.windows["all"].summary()
+
+        stats[station] = {"mean": summary["mean"], "std": summary["std"], "max": summary["max"], "min": summary["min"], "values": vals}
+
+    return sorted_years, stats, streams
+
+
+def analyze_and_plot_combined(combined: dict, out_dir: Path, show: bool = False):
+    """对 combined 数据绘制折线图并计算每个站点的平均/最大/最小值。
+
+    - combined: dict, 形如 {station: {year_str: value, ...}, ...}
+    - out_dir: Path, 输出文件夹
+    - show: bool, 保留以兼容旧调用；图表由 Agg 渲染池生成，不会弹出窗口
+    返回: stats dict, 每个站点对应 mean/max/min/values
+    """
+    from chart_render import ChartSpec, HLineSpec, LineSpec, SmallMultiplesSpec, TextSpec, render_charts
 
-        stats[station] = {"mean": avg, "std": std, "max": mx, "min": mn, "values": vals}
-        plot_data[station] = vals
+    computed = qydl_station_stats(combined)
+    if computed is None:
+        logger.info("No year data found in combined; skipping analysis")
+        return {}
+    sorted_years, stats, streams = computed
+    plot_data = {station: st["values"] for station, st in stats.items()}
 
     # 写出统计 JSON
     out_stats = out_dir / "generation_output_stats.json"
     try:
-        with out_stats.open("w", encoding="utf-8") as f:
-            json.dump(stats, f, ensure_ascii=False, indent=2)
-        logger.info(f"Saved generation stats to {out_stats}")
+        if write_json_if_changed(out_stats, stats):
+            logger.info(f"Saved generation stats to {out_stats}")
     except Exception:
         logger.exception(f"Failed to write stats to {out_stats}")
+    qydl_save_station_stream_state(streams, out_dir)
+
+    # 生成图表描述：总图 + 各站点小图网格（跳过没有数值的站点），交给渲染池绘制；
+    # 各站点的单独 PNG 从网格中裁出，站点再多也只建一张图、做一次布局
+    x = sorted_years
+    specs = [
+        ChartSpec(
+            path=str(out_dir / "generation_output_lines.png"),
+            figsize=(10, 6),
+            lines=[
+                LineSpec(x, [v if not math.isnan(v) else None for v in vals], label=station)
+                for station, vals in plot_data.items()
+            ],
+            ylabel="Generation Output",
+            title="Generation Output by Station",
+            legend=True,
+        )
+    ]
+    grid = SmallMultiplesSpec(path=str(out_dir / STATION_GRID_NAME))
+    for station, vals in plot_data.items():
+        numeric_vals = [v for v in vals if not math.isnan(v)]
+        if not numeric_vals:
+            logger.info(f"No numeric data for station {station}; skipping plot.")
+            continue
 
-    # 尝试绘图（若 matplotlib 可用）
-    try:
-        plt.figure(figsize=(10, 6))
-        x = sorted_years
-        for station, vals in plot_data.items():
-            yvals = [v if not math.isnan(v) else None for v in vals]
-            plt.plot(x, yvals, marker="o", label=station)
-
-        plt.xlabel("Year")
-        plt.ylabel("Generation Output")
-        plt.title("Generation Output by Station")
-        plt.grid(True)
-        plt.legend()
-        plt.tight_layout()
-
-        out_png = out_dir / "generation_output_lines.png"
-        plt.savefig(out_png)
-        logger.info(f"Saved plot to {out_png}")
-        if show:
-            plt.show()
-        plt.close()
-
-        # Also save one plot per station (skip stations with no numeric data)
-        for station, vals in plot_data.items():
-            try:
-                # if there is no numeric (non-NaN) data, skip
-                has_numeric = any((not math.isnan(v)) for v in vals)
-                if not has_numeric:
-                    logger.info(f"No numeric data for station {station}; skipping plot.")
-                    continue
-
-                fig, ax = plt.subplots(figsize=(8, 4))
-                yvals = [v if not math.isnan(v) else None for v in vals]
-                ax.plot(x, yvals, marker="o")
-                ax.set_xlabel("Year")
-                ax.set_ylabel("Generation Output")
-                ax.set_title(f"Generation Output - {station}")
-                ax.grid(True)
-                plt.tight_layout()
-
-                # sanitize station name for filename
-                safe = "".join(c if (c.isalnum() or c in ("-", "_")) else "_" for c in station)
-                out_png_station = out_dir / f"generation_output_{safe}.png"
-
-                # draw multi-year mean as dashed horizontal line and annotate
-                try:
-                    numeric_vals = [v for v in vals if not math.isnan(v)]
-                    if numeric_vals:
-                        mean_val = sum(numeric_vals) / len(numeric_vals)
-                        ax.axhline(mean_val, color="gray", linestyle="--", linewidth=1)
-                        # place annotation near the right edge
-                        try:
-                            # place annotation near the middle of the x range and center-align
-                            x_mid = (x[0] + x[-1]) / 2.0
-                            ax.text(x_mid, mean_val, f"mean={mean_val:.3f}", va="center", ha="center", color="gray", fontsize=8)
-                        except Exception:
-                            pass
-                except Exception as e:
-                    logger.debug(f"Failed to compute/plot mean line for {station}: {e}")
-
-                fig.savefig(out_png_station)
-                logger.info(f"Saved plot for {station} to {out_png_station}")
-                if show:
-                    fig.show()
-                plt.close(fig)
-            except Exception as e:
-                logger.warning(f"Failed to plot station {station}: {e}")
-    except Exception as e:
-        logger.warning(f"Matplotlib plotting skipped or failed: {e}")
+        # sanitize station name for filename
+        safe = "".join(c if (c.isalnum() or c in ("-", "_")) else "_" for c in station)
+        spec = ChartSpec(
+            path=str(out_dir / f"generation_output_{safe}.png"),
+            lines=[LineSpec(x, [v if not math.isnan(v) else None for v in vals])],
+            ylabel="Generation Output",
+            title=f"Generation Output - {station}",
+        )
+        # draw multi-year mean as dashed horizontal line and annotate near the middle of the x range
+        mean_val = sum(numeric_vals) / len(numeric_vals)
+        spec.hlines.append(HLineSpec(mean_val))
+        x_mid = (x[0] + x[-1]) / 2.0
+        spec.texts.append(TextSpec(x_mid, mean_val, f"mean={mean_val:.3f}", {"va": "center", "ha": "center", "color": "gray", "fontsize": 8}))
+        grid.panels.append(spec)
+        grid.crop_paths.append(spec.path)
+    specs.append(grid)
+
+    render_charts(specs)
 
     return stats
 
 
-def qydl_operating_revenue_and_generation_output_analysis(json_data):
+def qydl_revenue_comparison(json_data) -> dict:
     """
-    从 `data.json` 中提取各年子公司电站的 `generation_output` 与 `on_grid_price`,
-    计算站点营收 = generation_output * on_grid_price, 汇总到子公司与公司层面。
-
-    规则：
-    - 如果某一年任意一个站点的 `on_grid_price` 为 "NA" 或缺失，或该站点的
-      `generation_output` 不是数字，则该年不参与比较（跳过）。
-    - 计算使用原始数值相乘，结果保留 3 位小数。
-
-    输出：将比较结果写入 `operating_revenue_theory_comparison.json`，格式示例：
-    {
-      "2019": {
-        "subsidiary_revenues": {"puding": 12.345, ...},
-        "theoretical_operating_revenue": 123.456,
-        "actual_operating_revenue": 119.00,
-        "difference": 4.456,
-        "pct_diff": 3.74
-      },
-      ...
-    }
+    计算各年理论营收与实际营收的对比（不写文件），规则与输出格式见
+    qydl_operating_revenue_and_generation_output_analysis。
     """
+    from revenue_engine import CONSOLIDATION_THRESHOLD, theoretical_revenue
 
-    out_file = Path(__file__).parent / "operating_revenue_theory_comparison.json"
     results = {}
 
-    def gather_station_values(node):
-        """递归搜集 node 下所有含有 generation_output 与 on_grid_price 的记录。
-        返回列表 of (generation_output, on_grid_price) 或空列表。"""
-        pairs = []
-        if not isinstance(node, dict):
-            return pairs
-        # if this node looks like a station
-        if "generation_output" in node and "on_grid_price" in node:
-            pairs.append((node.get("generation_output"), node.get("on_grid_price")))
-            return pairs
-
-        # otherwise descend into children
-        for v in node.values():
-            if isinstance(v, dict):
-                pairs.extend(gather_station_values(v))
-        return pairs
-
-    # iterate years
-    for year, data in json_data.items():
-        # skip non-year keys
-        try:
-            int(year)
-        except Exception:
-            continue
-
-        subsidiaries = data.get("subsidiaries")
-        if not isinstance(subsidiaries, dict):
+    store = as_year_store(json_data)
+    stations = qydl_station_registry(store)
+
+    sub_names = store.children("subsidiaries")
+    n_years = len(store.years)
+    subs_present = store.node_present("subsidiaries")
+    sub_present = np.vstack([store.node_present(f"subsidiaries.{sub}") for sub in sub_names]) if sub_names else np.zeros((0, n_years), dtype=bool)
+    share_keys = [f"subsidiaries.{sub}.shareholding_ratio" for sub in sub_names]
+    share = np.vstack([store.col(k) for k in share_keys]) if sub_names else np.zeros((0, n_years))
+    share_ok = np.vstack([store.mask(k) for k in share_keys]) if sub_names else np.zeros((0, n_years), dtype=bool)
+    excluded = share_ok & (np.nan_to_num(share) < CONSOLIDATION_THRESHOLD)
+    for j, sub in enumerate(sub_names):
+        years_excluded = store.years[excluded[j] & sub_present[j]].tolist()
+        if years_excluded:
+            logger.info(f"Skipping subsidiary {sub} in {years_excluded} (shareholding_ratio < {CONSOLIDATION_THRESHOLD:g}%)")
+
+    rev = theoretical_revenue(stations, sub_names, excluded)
+    missing = rev.included & ~rev.covered
+    actual = store.col("operating_revenue")
+    actual_ok = store.mask("operating_revenue")
+
+    for i, y in enumerate(store.years.tolist()):
+        year = str(y)
+        if not subs_present[i]:
             logger.info(f"Year {year}: no subsidiaries data; skipping")
             continue
-
-        skip_year = False
-        subsidiary_revenues = {}
-        # for each top-level subsidiary, gather its station pairs and compute revenue
-        for sub_name, sub_node in subsidiaries.items():
-            if not isinstance(sub_node, dict):
-                continue
-            # skip top-level subsidiaries where shareholding_ratio < 50%
-            share = sub_node.get("shareholding_ratio")
-            share_val = None
-            if isinstance(share, (int, float)): 
-                share_val = float(share)
-            else:
-                try:
-                    share_val = float(share)
-                except Exception:
-                    share_val = None
-            if share_val is not None and share_val < 50.0:
-                logger.info(f"Year {year}: skipping subsidiary {sub_name} (shareholding_ratio={share_val} < 50%)")
-                continue
-            pairs = gather_station_values(sub_node)
-            if not pairs:
-                # no station info under this subsidiary -> treat as zero
-                subsidiary_revenues[sub_name] = 0.0
-                continue
-
-            rev_sum = 0.0
-            for gen, price in pairs:
-                # if price is explicitly "NA" or missing -> skip entire year
-                if price == "NA" or price is None:
-                    logger.info(f"Year {year}: station under {sub_name} missing on_grid_price; skipping year")
-                    skip_year = True
-                    break
-                # require generation_output numeric
-                if not isinstance(gen, (int, float)):
-                    logger.info(f"Year {year}: generation_output for station under {sub_name} is not numeric; skipping year")
-                    skip_year = True
-                    break
-
-                try:
-                    rev_sum += float(gen) * float(price)
-                except Exception:
-                    logger.exception(f"Year {year}: failed to compute revenue for station under {sub_name}")
-                    skip_year = True
-                    break
-
-            if skip_year:
-                break
-
-            subsidiary_revenues[sub_name] = round(rev_sum, 3)
-
-        if skip_year:
+        if not rev.covered[:, i].any():
+            logger.info(f"Year {year}: no station with both generation_output and on_grid_price; skipping")
             continue
 
+        subsidiary_revenues = {
+            sub: round(float(rev.subsidiary_revenue[j, i]), 3)
+            for j, sub in enumerate(sub_names)
+            if sub_present[j, i] and not excluded[j, i]
+        }
         theoretical_total = round(sum(subsidiary_revenues.values()), 3)
-        actual_rev = data.get("operating_revenue")
-        if isinstance(actual_rev, (int, float)):
-            actual_rev_val = round(float(actual_rev), 3)
+        coverage = float(rev.coverage[i]) if not np.isnan(rev.coverage[i]) else None
+        missing_stations = [stations.names[r] for r in np.flatnonzero(missing[:, i])]
+        if missing_stations:
+            logger.info(f"Year {year}: {len(missing_stations)} station(s) without price or generation: {missing_stations}")
+
+        if actual_ok[i]:
+            actual_rev_val = round(float(actual[i]), 3)
             diff = round(theoretical_total - actual_rev_val, 3)
-            pct = None
-            try:
-                pct = round((diff / actual_rev_val) * 100, 2) if actual_rev_val != 0 else None
-            except Exception:
-                pct = None
+            pct = round((diff / actual_rev_val) * 100, 2) if actual_rev_val != 0 else None
         else:
             actual_rev_val = None
             diff = None
@@ -422,16 +459,55 @@ def qydl_operating_revenue_and_generation_output_analysis(json_data):
             "actual_operating_revenue": actual_rev_val,
             "difference": diff,
             "pct_diff": pct,
+            "coverage": round(coverage, 4) if coverage is not None else None,
+            "missing_stations": missing_stations,
+            "estimated_operating_revenue": round(theoretical_total / coverage, 3) if coverage else None,
         }
+    return results
+
+
+def qydl_operating_revenue_and_generation_output_analysis(json_data, out_dir: Path = OUT_DIR):
+    """
+    从 `data.json` 中提取各年子公司电站的 `generation_output` 与 `on_grid_price`,
+    计算站点营收 = generation_output * on_grid_price, 汇总到子公司与公司层面。
+
+    计算由 revenue_engine 对电站 × 年份矩阵一次完成（掩码相乘 + 按子公司矩阵乘法归约）。
+
+    规则：
+    - 持股比例低于 50% 的一级子公司不并入。
+    - 某站点的 `on_grid_price` 或 `generation_output` 为 "NA"/缺失时，只是该站点不计入，
+      该年仍参与比较，并报告覆盖率 coverage（已覆盖站点的预期营收占全部计入站点预期营收的比例，
+      预期营收 = 多年平均发电量 × 最新电价）、
+      未覆盖站点 missing_stations 与按覆盖率外推的 estimated_operating_revenue。
+      没有任何站点被覆盖的年份不输出。
+    - 计算使用原始数值相乘，结果保留 3 位小数。
+
+    输出：将比较结果写入 `operating_revenue_theory_comparison.json`，格式示例：
+    {
+      "2019": {
+        "subsidiary_revenues": {"puding": 12.345, ...},
+        "theoretical_operating_revenue": 123.456,
+        "actual_operating_revenue": 119.00,
+        "difference": 4.456,
+        "pct_diff": 3.74,
+        "coverage": 1.0,
+        "missing_stations": [],
+        "estimated_operating_revenue": 123.456
+      },
+      ...
+    }
+    """
+
+    out_file = Path(out_dir) / "operating_revenue_theory_comparison.json"
+    results = qydl_revenue_comparison(json_data)
 
     try:
-        with out_file.open("w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        logger.info(f"Saved operating revenue comparison to {out_file}")
+        if write_json_if_changed(out_file, results):
+            logger.info(f"Saved operating revenue comparison to {out_file}")
     except Exception:
         logger.exception(f"Failed to write operating revenue comparison to {out_file}")
 
-def qydl_operating_revenue_and_cash_flow_analysis(json_data):
+def qydl_operating_revenue_and_cash_flow_analysis(json_data, out_dir: Path = OUT_DIR):
     """
     Extract `operating_revenue` and `cash_received_from_sales_and_services` per year,
     save them to JSON and plot both series in a single chart (PNG).
@@ -440,48 +516,16 @@ def qydl_operating_revenue_and_cash_flow_analysis(json_data):
     - `operating_revenue_vs_cash_received.json`
     - `operating_revenue_vs_cash_received.png`
     """
+    from chart_render import ChartSpec, LineSpec, render_charts
 
-    out_json = Path(__file__).parent / "operating_revenue_vs_cash_received.json"
-    out_png = Path(__file__).parent / "operating_revenue_vs_cash_received.png"
+    out_json = Path(out_dir) / "operating_revenue_vs_cash_received.json"
+    out_png = Path(out_dir) / "operating_revenue_vs_cash_received.png"
 
-    years = []
-    op_vals = []
-    cash_vals = []
-    net_cash_vals = []
-
-    # collect numeric years and values
-    for k, v in json_data.items():
-        try:
-            y = int(k)
-        except Exception:
-            continue
-        years.append(y)
-    years = sorted(years)
-
-    for y in years:
-        entry = json_data.get(str(y), {})
-        op = entry.get("operating_revenue")
-        cash = entry.get("cash_received_from_sales_and_services")
-
-        if isinstance(op, (int, float)):
-            opv = round(float(op), 3)
-        else:
-            opv = None
-
-        if isinstance(cash, (int, float)):
-            cashv = round(float(cash), 3)
-        else:
-            cashv = None
-
-        net = entry.get("net_cash_flow_operating")
-        if isinstance(net, (int, float)):
-            netv = round(float(net), 3)
-        else:
-            netv = None
-
-        op_vals.append(opv)
-        cash_vals.append(cashv)
-        net_cash_vals.append(netv)
+    store = as_year_store(json_data)
+    years = store.years.tolist()
+    op_vals = store.to_list("operating_revenue", 3)
+    cash_vals = store.to_list("cash_received_from_sales_and_services", 3)
+    net_cash_vals = store.to_list("net_cash_flow_operating", 3)
 
     results = {
         "years": years,
@@ -491,269 +535,33 @@ def qydl_operating_revenue_and_cash_flow_analysis(json_data):
     }
 
     try:
-        with out_json.open("w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        logger.info(f"Saved operating vs cash data to {out_json}")
+        if write_json_if_changed(out_json, results):
+            logger.info(f"Saved operating vs cash data to {out_json}")
     except Exception:
         logger.exception(f"Failed to write operating vs cash JSON to {out_json}")
 
     # plot both series on same chart
-    try:
-        if not years:
-            logger.info("No year data for operating vs cash analysis; skipping plot")
-            return
-
-        x = years
-        # matplotlib supports None as gap in data
-        y1 = [v if v is not None else None for v in op_vals]
-        y2 = [v if v is not None else None for v in cash_vals]
-        y3 = [v if v is not None else None for v in net_cash_vals]
-
-        plt.figure(figsize=(10, 6))
-        plt.plot(x, y1, marker="o", label="operating_revenue")
-        plt.plot(x, y2, marker="o", label="cash_received_from_sales_and_services")
-        plt.plot(x, y3, marker="o", label="net_cash_flow_operating")
-        plt.xlabel("Year")
-        plt.ylabel("Amount")
-        plt.title("Operating Revenue vs Cash Received from Sales and Services")
-        plt.grid(True)
-        plt.legend()
-        plt.tight_layout()
-        plt.savefig(out_png)
-        logger.info(f"Saved operating vs cash plot to {out_png}")
-        plt.close()
-    except Exception as e:
-        logger.exception(f"Failed to plot operating vs cash: {e}")
-
-
-def qydl_total_liabilities_and_cash_and_dividends_analysis(json_data):
-    """
-    Plot yearly `total_liabilities`, `cash_and_cash_equivalents`, `total_dividends_paid`.
-
-    Also compute "认可产生价值" for each year as:
-      (prev_total_liabilities - curr_total_liabilities)
-      + (curr_cash - prev_cash)
-      + prev_total_dividends_paid
-      + curr_financial_expenses  # include current year's financial_expenses
-
-    Outputs (in script folder):
-    - `liabilities_cash_dividends.json` (years + the three series + recognized_value + mean/std)
-    - `total_liabilities.png` (annotated points)
-    - `cash_and_cash_equivalents.png`
-    - `total_dividends_paid.png` (annotated points)
-    - `recognized_value.png` (mean & std centered on plot)
-    """
-
-    out_dir = Path(__file__).parent
-    out_json = out_dir / "liabilities_cash_dividends.json"
-    png_liabilities = out_dir / "total_liabilities.png"
-    png_cash = out_dir / "cash_and_cash_equivalents.png"
-    png_dividends = out_dir / "total_dividends_paid.png"
-    png_recognized = out_dir / "recognized_value.png"
-
-    years = []
-    for k in json_data.keys():
-        try:
-            y = int(k)
-        except Exception:
-            continue
-        years.append(y)
     if not years:
-        logger.info("No yearly data found for liabilities/cash/dividends analysis; skipping")
+        logger.info("No year data for operating vs cash analysis; skipping plot")
         return
-    years = sorted(years)
-
-    liabilities = []
-    cash = []
-    dividends = []
-
-    for y in years:
-        entry = json_data.get(str(y), {})
-        tl = entry.get("total_liabilities")
-        ca = entry.get("cash_and_cash_equivalents")
-        td = entry.get("total_dividends_paid")
-
-        liabilities.append(round(float(tl), 3) if isinstance(tl, (int, float)) else None)
-        cash.append(round(float(ca), 3) if isinstance(ca, (int, float)) else None)
-        dividends.append(round(float(td), 3) if isinstance(td, (int, float)) else None)
-
-    # compute recognized value series including current year's financial_expenses
-    recognized = []
-    for i in range(len(years)):
-        if i == 0:
-            # cannot compute for first year (no previous) -> None
-            recognized.append(None)
-            continue
-        prev_i = i - 1
-        prev_tl = liabilities[prev_i]
-        curr_tl = liabilities[i]
-        prev_cash = cash[prev_i]
-        curr_cash = cash[i]
-        prev_div = dividends[prev_i]
-        # include current year's financial_expenses in recognized value
-        curr_entry = json_data.get(str(years[i]), {})
-        curr_fin = curr_entry.get("financial_expenses")
-
-        if any(v is None for v in (prev_tl, curr_tl, prev_cash, curr_cash, prev_div, curr_fin)):
-            recognized.append(None)
-            continue
-
-        try:
-            fin_val = float(curr_fin)
-        except Exception:
-            recognized.append(None)
-            continue
-
-        val = (prev_tl - curr_tl) + (curr_cash - prev_cash) + prev_div + fin_val
-        try:
-            recognized.append(round(float(val), 3))
-        except Exception:
-            recognized.append(None)
-
-    # compute mean & std for recognized (population std)
-    numeric_recog = [v for v in recognized if v is not None]
-    recog_mean = None
-    recog_std = None
-    if numeric_recog:
-        m_raw = sum(numeric_recog) / len(numeric_recog)
-        recog_mean = round(m_raw, 3)
-        try:
-            var = sum((v - m_raw) ** 2 for v in numeric_recog) / len(numeric_recog)
-            recog_std = round(math.sqrt(var), 3)
-        except Exception:
-            recog_std = None
 
-    results = {
-        "years": years,
-        "total_liabilities": liabilities,
-        "cash_and_cash_equivalents": cash,
-        "total_dividends_paid": dividends,
-        "recognized_value": recognized,
-        "recognized_mean": recog_mean,
-        "recognized_std": recog_std,
-    }
-
-    try:
-        with out_json.open("w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        logger.info(f"Saved liabilities/cash/dividends data to {out_json}")
-    except Exception:
-        logger.exception("Failed to write liabilities/cash/dividends JSON to {out_json}")
-
-    # helper to annotate points on a given axis
-    def annotate_points(ax, x_vals, y_vals, fmt="{:.3f}"):
-        for xi, yi in zip(x_vals, y_vals):
-            if yi is None:
-                continue
-            try:
-                ax.text(xi, yi, fmt.format(yi), fontsize=8, color="black", va="bottom", ha="center")
-            except Exception:
-                pass
-
-    # plot total_liabilities with point annotations
-    try:
-        x = years
-        yvals = [v if v is not None else None for v in liabilities]
-        plt.figure(figsize=(10, 5))
-        plt.plot(x, yvals, marker="o", label="total_liabilities")
-        ax = plt.gca()
-        annotate_points(ax, x, yvals)
-        plt.xlabel("Year")
-        plt.ylabel("Total Liabilities")
-        plt.title("Total Liabilities by Year")
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(png_liabilities)
-        logger.info(f"Saved total liabilities plot to {png_liabilities}")
-        plt.close()
-    except Exception:
-        logger.exception("Failed to plot total liabilities")
-
-    # plot cash (no point labels requested but we generate the plot)
-    try:
-        x = years
-        yvals = [v if v is not None else None for v in cash]
-        plt.figure(figsize=(10, 5))
-        plt.plot(x, yvals, marker="o", label="cash_and_cash_equivalents")
-        plt.xlabel("Year")
-        plt.ylabel("Cash and Cash Equivalents")
-        plt.title("Cash and Cash Equivalents by Year")
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(png_cash)
-        logger.info(f"Saved cash and cash equivalents plot to {png_cash}")
-        plt.close()
-    except Exception:
-        logger.exception("Failed to plot cash and cash equivalents")
-
-    # plot dividends with point annotations
-    try:
-        x = years
-        yvals = [v if v is not None else None for v in dividends]
-        plt.figure(figsize=(10, 5))
-        plt.plot(x, yvals, marker="o", label="total_dividends_paid")
-        ax = plt.gca()
-        annotate_points(ax, x, yvals)
-        plt.xlabel("Year")
-        plt.ylabel("Total Dividends Paid")
-        plt.title("Total Dividends Paid by Year")
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(png_dividends)
-        logger.info(f"Saved total dividends plot to {png_dividends}")
-        plt.close()
-    except Exception:
-        logger.exception("Failed to plot total dividends")
-
-    # plot recognized value with mean & std displayed in the middle
-    try:
-        x = years
-        yvals = [v if v is not None else None for v in recognized]
-        plt.figure(figsize=(10, 5))
-        plt.plot(x, yvals, marker="o", label="recognized_value")
-        ax = plt.gca()
-        # annotate each point's value
-        annotate_points(ax, x, yvals, fmt="{:.3f}")
-        if recog_mean is not None:
-            plt.axhline(recog_mean, color="gray", linestyle="--", linewidth=1)
-            # center annotate with mean and std
-            try:
-                x_mid = (x[0] + x[-1]) / 2.0
-                txt = f"mean={recog_mean:.3f}  std={recog_std if recog_std is not None else 'NA'}"
-                plt.text(x_mid, recog_mean, txt, va="center", ha="center", color="gray", fontsize=9, bbox=dict(facecolor="white", alpha=0.7, edgecolor="none"))
-            except Exception:
-                pass
-
-        # plot adjusted recognized stats (exclude 2020 & 2021) if available
-        try:
-            adj_mean, adj_std = qydl_get_adj_recognized_value(json_data, exclude_years=(2020, 2021))
-        except Exception:
-            adj_mean = adj_std = None
-
-        if adj_mean is not None:
-            # use a different color to distinguish
-            plt.axhline(adj_mean, color="tab:blue", linestyle="--", linewidth=1)
-            try:
-                x_mid = (x[0] + x[-1]) / 2.0
-                txt2 = f"adj_mean={adj_mean:.3f}  adj_std={adj_std if adj_std is not None else 'NA'}"
-                # place slightly below the adjusted mean line to avoid overlap
-                plt.text(x_mid, adj_mean, txt2, va="bottom", ha="center", color="tab:blue", fontsize=9, bbox=dict(facecolor="white", alpha=0.7, edgecolor="none"))
-            except Exception:
-                pass
-
-        plt.xlabel("Year")
-        plt.ylabel("Recognized Value")
-        plt.title("Recognized Value (认可产生价值) by Year")
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(png_recognized)
-        logger.info(f"Saved recognized value plot to {png_recognized}")
-        plt.close()
-    except Exception:
-        logger.exception("Failed to plot recognized value")
-
-
-def qydl_generation_output_history(json_data):
+    render_charts([
+        ChartSpec(
+            path=str(out_png),
+            figsize=(10, 6),
+            lines=[
+                LineSpec(years, op_vals, label="operating_revenue"),
+                LineSpec(years, cash_vals, label="cash_received_from_sales_and_services"),
+                LineSpec(years, net_cash_vals, label="net_cash_flow_operating"),
+            ],
+            ylabel="Amount",
+            title="Operating Revenue vs Cash Received from Sales and Services",
+            legend=True,
+        )
+    ])
+
+
+def qydl_generation_output_history(json_data, out_dir: Path = OUT_DIR):
     """
     Extract top-level `generation_output` from each year in `data.json`,
     save to JSON and draw a line chart with a dashed mean line.
@@ -762,32 +570,18 @@ def qydl_generation_output_history(json_data):
     - `generation_output_history.json`
     - `generation_output_history.png`
     """
+    from chart_render import ChartSpec, HLineSpec, LineSpec, TextSpec, render_charts
 
-    out_json = Path(__file__).parent / "generation_output_history.json"
-    out_png = Path(__file__).parent / "generation_output_history.png"
-
-    years = []
-    values = []
+    out_json = Path(out_dir) / "generation_output_history.json"
+    out_png = Path(out_dir) / "generation_output_history.png"
 
-    # collect numeric years
-    for k in json_data.keys():
-        try:
-            y = int(k)
-        except Exception:
-            continue
-        years.append(y)
+    store = as_year_store(json_data)
+    years = store.years.tolist()
     if not years:
         logger.info("No yearly data found for generation output history; skipping")
         return
-    years = sorted(years)
 
-    for y in years:
-        entry = json_data.get(str(y), {})
-        go = entry.get("generation_output")
-        if isinstance(go, (int, float)):
-            values.append(round(float(go), 3))
-        else:
-            values.append(None)
+    values = store.to_list("generation_output", 3)
 
     # compute mean over numeric values
     numeric = [v for v in values if v is not None]
@@ -799,137 +593,126 @@ def qydl_generation_output_history(json_data):
     results = {"years": years, "generation_output": values, "mean": mean_val}
 
     try:
-        with out_json.open("w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        logger.info(f"Saved generation output history to {out_json}")
+        if write_json_if_changed(out_json, results):
+            logger.info(f"Saved generation output history to {out_json}")
     except Exception:
         logger.exception(f"Failed to write generation output history to {out_json}")
 
     # plot
-    try:
-        x = years
-        yvals = [v if v is not None else None for v in values]
-
-        plt.figure(figsize=(10, 5))
-        plt.plot(x, yvals, marker="o", label="generation_output")
-        if mean_val is not None:
-            plt.axhline(mean_val, color="gray", linestyle="--", linewidth=1)
-            # annotate near mid x and center-align
-            try:
-                x_mid = (x[0] + x[-1]) / 2.0
-                plt.text(x_mid, mean_val, f"mean={mean_val:.3f}", va="center", ha="center", color="gray", fontsize=9)
-            except Exception:
-                pass
-
-        plt.xlabel("Year")
-        plt.ylabel("Generation Output")
-        plt.title("Company Generation Output History")
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(out_png)
-        logger.info(f"Saved generation output history plot to {out_png}")
-        plt.close()
-    except Exception:
-        logger.exception("Failed to plot generation output history")
+    spec = ChartSpec(
+        path=str(out_png),
+        lines=[LineSpec(years, values, label="generation_output")],
+        ylabel="Generation Output",
+        title="Company Generation Output History",
+    )
+    if mean_val is not None:
+        # annotate near mid x and center-align
+        spec.hlines.append(HLineSpec(mean_val))
+        x_mid = (years[0] + years[-1]) / 2.0
+        spec.texts.append(TextSpec(x_mid, mean_val, f"mean={mean_val:.3f}", {"va": "center", "ha": "center", "color": "gray", "fontsize": 9}))
+    render_charts([spec])
+
+
+RECOGNIZED_VALUE_FIELDS = (
+    "total_liabilities",
+    "cash_and_cash_equivalents",
+    "total_dividends_paid",
+    "financial_expenses",
+)
+RECOGNIZED_CACHE_SIZE = 128
+_recognized_cache = {}
+
+
+def recognized_value_fingerprint(json_data) -> str:
+    """返回认可产生价值输入（年份 + 相关四列及掩码）的内容指纹。"""
+    store = as_year_store(json_data)
+    h = hashlib.sha1(store.years.tobytes())
+    for name in RECOGNIZED_VALUE_FIELDS:
+        h.update(name.encode("utf-8"))
+        h.update(store.col(name).tobytes())
+        h.update(store.mask(name).tobytes())
+    return h.hexdigest()
+
+
+def _recognized_cache_get(key, compute):
+    if key in _recognized_cache:
+        return _recognized_cache[key]
+    value = compute()
+    if len(_recognized_cache) >= RECOGNIZED_CACHE_SIZE:
+        _recognized_cache.pop(next(iter(_recognized_cache)))
+    _recognized_cache[key] = value
+    return value
+
+
+def qydl_recognized_value(json_data):
+    """
+    计算各年"认可产生价值"序列（向量化的 prev/curr 差分），按输入指纹缓存：
 
+      (prev_total_liabilities - curr_total_liabilities)
+      + (curr_cash - prev_cash)
+      + prev_total_dividends_paid
+      + curr_financial_expenses
 
-def qydl_get_adj_recognized_value(json_data, exclude_years=(2020, 2021)):
+    返回 (years, values, mask)：values 为 float64 数组，首年及任一输入缺失的
+    年份为 NaN，mask 标记有效年份。返回的数组为缓存共享，调用方不应修改。
     """
-    Compute mean and population std of the "recognized value" series excluding
-    the specified years (defaults to 2020 and 2021).
+    store = as_year_store(json_data)
 
-        recognized_value is computed the same way as in
-        `qydl_total_liabilities_and_cash_and_dividends_analysis`:
-            (prev_total_liabilities - curr_total_liabilities)
-            + (curr_cash - prev_cash)
-            + prev_total_dividends_paid
-            + curr_financial_expenses
+    def compute():
+        tl, ca, td, fin = (store.col(name) for name in RECOGNIZED_VALUE_FIELDS)
+        tl_ok, ca_ok, td_ok, fin_ok = (store.mask(name) for name in RECOGNIZED_VALUE_FIELDS)
 
-    Returns (mean, std) both rounded to 3 decimals, or (None, None) if no
-    numeric values remain after exclusion.
+        values = np.full(len(store.years), np.nan)
+        mask = np.zeros(len(store.years), dtype=bool)
+        if len(store.years) > 1:
+            mask[1:] = tl_ok[:-1] & tl_ok[1:] & ca_ok[:-1] & ca_ok[1:] & td_ok[:-1] & fin_ok[1:]
+            diff = (tl[:-1] - tl[1:]) + (ca[1:] - ca[:-1]) + td[:-1] + fin[1:]
+            values[1:] = np.where(mask[1:], diff, np.nan)
+        return store.years, values, mask
+
+    return _recognized_cache_get(("series", recognized_value_fingerprint(store)), compute)
+
+
+def qydl_recognized_value_stats(json_data, exclude_years=()):
+    """
+    返回排除 exclude_years 后认可产生价值的 (mean, population std)，未取整。
+    结果按 (输入指纹, 排除年份) 缓存；无有效值时返回 (None, None)。
     """
+    store = as_year_store(json_data)
+    key = ("stats", recognized_value_fingerprint(store), tuple(sorted(exclude_years)))
 
-    # collect years and numeric series
-    years = []
-    for k in json_data.keys():
-        try:
-            y = int(k)
-        except Exception:
-            continue
-        years.append(y)
-    if not years:
-        return (None, None)
-    years = sorted(years)
-
-    liabilities = []
-    cash = []
-    dividends = []
-    for y in years:
-        entry = json_data.get(str(y), {})
-        tl = entry.get("total_liabilities")
-        ca = entry.get("cash_and_cash_equivalents")
-        td = entry.get("total_dividends_paid")
-
-        liabilities.append(float(tl) if isinstance(tl, (int, float)) else None)
-        cash.append(float(ca) if isinstance(ca, (int, float)) else None)
-        dividends.append(float(td) if isinstance(td, (int, float)) else None)
-
-    recognized = []
-    for i in range(len(years)):
-        if i == 0:
-            recognized.append(None)
-            continue
-        prev_i = i - 1
-        prev_tl = liabilities[prev_i]
-        curr_tl = liabilities[i]
-        prev_cash = cash[prev_i]
-        curr_cash = cash[i]
-        prev_div = dividends[prev_i]
-        # include current year's financial_expenses in recognized value
-        curr_entry = json_data.get(str(years[i]), {})
-        curr_fin = curr_entry.get("financial_expenses")
-
-        if any(v is None for v in (prev_tl, curr_tl, prev_cash, curr_cash, prev_div, curr_fin)):
-            recognized.append(None)
-            continue
+    def compute():
+        years, values, mask = qydl_recognized_value(store)
+        keep = mask & ~np.isin(years, list(exclude_years))
+        if not keep.any():
+            return (None, None)
+        filtered = values[keep]
+        mean_raw = float(filtered.mean())
+        std_raw = float(np.sqrt(((filtered - mean_raw) ** 2).mean()))
+        return (mean_raw, std_raw)
 
-        try:
-            fin_val = float(curr_fin)
-        except Exception:
-            recognized.append(None)
-            continue
+    return _recognized_cache_get(key, compute)
 
-        val = (prev_tl - curr_tl) + (curr_cash - prev_cash) + prev_div + fin_val
-        try:
-            recognized.append(float(val))
-        except Exception:
-            recognized.append(None)
 
-    # filter out excluded years and None
-    filtered = []
-    for y, v in zip(years, recognized):
-        if y in exclude_years:
-            continue
-        if v is None:
-            continue
-        filtered.append(v)
+def qydl_get_adj_recognized_value(json_data, exclude_years=(2020, 2021)):
+    """
+    Compute mean and population std of the "recognized value" series excluding
+    the specified years (defaults to 2020 and 2021).
 
-    if not filtered:
-        return (None, None)
+    Served from the cached `qydl_recognized_value_stats` engine, so repeated
+    calls on the same inputs do not recompute the series.
 
-    mean_raw = sum(filtered) / len(filtered)
-    try:
-        var = sum((v - mean_raw) ** 2 for v in filtered) / len(filtered)
-        std_raw = math.sqrt(var)
-    except Exception:
-        std_raw = None
+    Returns (mean, std) both rounded to 3 decimals, or (None, None) if no
+    numeric values remain after exclusion.
+    """
 
-    mean = round(mean_raw, 3)
-    std = round(std_raw, 3) if std_raw is not None else None
-    return (mean, std)
+    mean_raw, std_raw = qydl_recognized_value_stats(json_data, exclude_years)
+    if mean_raw is None:
+        return (None, None)
+    return (round(mean_raw, 3), round(std_raw, 3))
 
 
-def qydl_total_liabilities_and_cash_and_dividends_analysis(json_data):
+def qydl_total_liabilities_and_cash_and_dividends_analysis(json_data, out_dir: Path = OUT_DIR):
     """
     Plot yearly `total_liabilities`, `cash_and_cash_equivalents`, `total_dividends_paid`.
 
@@ -937,6 +720,7 @@ def qydl_total_liabilities_and_cash_and_dividends_analysis(json_data):
       (prev_total_liabilities - curr_total_liabilities)
       + (curr_cash - prev_cash)
       + prev_total_dividends_paid
+      + curr_financial_expenses  # include current year's financial_expenses
 
     Outputs (in script folder):
     - `liabilities_cash_dividends.json` (years + the three series + recognized_value + mean/std)
@@ -945,85 +729,33 @@ def qydl_total_liabilities_and_cash_and_dividends_analysis(json_data):
     - `total_dividends_paid.png` (annotated points)
     - `recognized_value.png` (mean & std centered on plot)
     """
+    from chart_render import ChartSpec, HLineSpec, LineSpec, TextSpec, point_labels, render_charts
 
-    out_dir = Path(__file__).parent
+    out_dir = Path(out_dir)
     out_json = out_dir / "liabilities_cash_dividends.json"
     png_liabilities = out_dir / "total_liabilities.png"
     png_cash = out_dir / "cash_and_cash_equivalents.png"
     png_dividends = out_dir / "total_dividends_paid.png"
     png_recognized = out_dir / "recognized_value.png"
 
-    years = []
-    for k in json_data.keys():
-        try:
-            y = int(k)
-        except Exception:
-            continue
-        years.append(y)
+    store = as_year_store(json_data)
+    years = store.years.tolist()
     if not years:
         logger.info("No yearly data found for liabilities/cash/dividends analysis; skipping")
         return
-    years = sorted(years)
-
-    liabilities = []
-    cash = []
-    dividends = []
-
-    for y in years:
-        entry = json_data.get(str(y), {})
-        tl = entry.get("total_liabilities")
-        ca = entry.get("cash_and_cash_equivalents")
-        td = entry.get("total_dividends_paid")
-
-        liabilities.append(round(float(tl), 3) if isinstance(tl, (int, float)) else None)
-        cash.append(round(float(ca), 3) if isinstance(ca, (int, float)) else None)
-        dividends.append(round(float(td), 3) if isinstance(td, (int, float)) else None)
-
-    # compute recognized value series
-    recognized = []
-    for i in range(len(years)):
-        if i == 0:
-            # cannot compute for first year (no previous) -> None
-            recognized.append(None)
-            continue
-        prev_i = i - 1
-        prev_tl = liabilities[prev_i]
-        curr_tl = liabilities[i]
-        prev_cash = cash[prev_i]
-        curr_cash = cash[i]
-        prev_div = dividends[prev_i]
-        # include current year's financial_expenses in recognized value
-        curr_entry = json_data.get(str(years[i]), {})
-        curr_fin = curr_entry.get("financial_expenses")
-
-        if any(v is None for v in (prev_tl, curr_tl, prev_cash, curr_cash, prev_div, curr_fin)):
-            recognized.append(None)
-            continue
 
-        try:
-            fin_val = float(curr_fin)
-        except Exception:
-            recognized.append(None)
-            continue
+    liabilities = store.to_list("total_liabilities", 3)
+    cash = store.to_list("cash_and_cash_equivalents", 3)
+    dividends = store.to_list("total_dividends_paid", 3)
 
-        val = (prev_tl - curr_tl) + (curr_cash - prev_cash) + prev_div + fin_val
-        try:
-            recognized.append(round(float(val), 3))
-        except Exception:
-            recognized.append(None)
-
-    # compute mean & std for recognized (population std)
-    numeric_recog = [v for v in recognized if v is not None]
-    recog_mean = None
-    recog_std = None
-    if numeric_recog:
-        m_raw = sum(numeric_recog) / len(numeric_recog)
-        recog_mean = round(m_raw, 3)
-        try:
-            var = sum((v - m_raw) ** 2 for v in numeric_recog) / len(numeric_recog)
-            recog_std = round(math.sqrt(var), 3)
-        except Exception:
-            recog_std = None
+    # recognized value series and stats come from the shared cached engine
+    _, recog_values, recog_mask = qydl_recognized_value(store)
+    recognized = [round(v, 3) if ok else None for v, ok in zip(recog_values.tolist(), recog_mask.tolist())]
+
+    recog_mean, recog_std = qydl_recognized_value_stats(store)
+    if recog_mean is not None:
+        recog_mean = round(recog_mean, 3)
+        recog_std = round(recog_std, 3)
 
     results = {
         "years": years,
@@ -1036,198 +768,313 @@ def qydl_total_liabilities_and_cash_and_dividends_analysis(json_data):
     }
 
     try:
-        with out_json.open("w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        logger.info(f"Saved liabilities/cash/dividends data to {out_json}")
+        if write_json_if_changed(out_json, results):
+            logger.info(f"Saved liabilities/cash/dividends data to {out_json}")
     except Exception:
         logger.exception(f"Failed to write liabilities/cash/dividends JSON to {out_json}")
 
-    # helper to annotate points on a given axis
-    def annotate_points(ax, x_vals, y_vals, fmt="{:.3f}"):
-        for xi, yi in zip(x_vals, y_vals):
-            if yi is None:
-                continue
-            try:
-                ax.text(xi, yi, fmt.format(yi), fontsize=8, color="black", va="bottom", ha="center")
-            except Exception:
-                pass
-
-    # plot total_liabilities with point annotations
+    x = years
+    # total_liabilities / dividends with point annotations, cash without
+    specs = [
+        ChartSpec(
+            path=str(png_liabilities),
+            lines=[LineSpec(x, liabilities, label="total_liabilities")],
+            texts=point_labels(x, liabilities),
+            ylabel="Total Liabilities",
+            title="Total Liabilities by Year",
+        ),
+        ChartSpec(
+            path=str(png_cash),
+            lines=[LineSpec(x, cash, label="cash_and_cash_equivalents")],
+            ylabel="Cash and Cash Equivalents",
+            title="Cash and Cash Equivalents by Year",
+        ),
+        ChartSpec(
+            path=str(png_dividends),
+            lines=[LineSpec(x, dividends, label="total_dividends_paid")],
+            texts=point_labels(x, dividends),
+            ylabel="Total Dividends Paid",
+            title="Total Dividends Paid by Year",
+        ),
+    ]
+
+    # recognized value with mean & std displayed in the middle
+    recog_spec = ChartSpec(
+        path=str(png_recognized),
+        lines=[LineSpec(x, recognized, label="recognized_value")],
+        texts=point_labels(x, recognized),
+        ylabel="Recognized Value",
+        title="Recognized Value (认可产生价值) by Year",
+    )
+    x_mid = (x[0] + x[-1]) / 2.0
+    box = dict(facecolor="white", alpha=0.7, edgecolor="none")
+    if recog_mean is not None:
+        recog_spec.hlines.append(HLineSpec(recog_mean))
+        txt = f"mean={recog_mean:.3f}  std={recog_std if recog_std is not None else 'NA'}"
+        recog_spec.texts.append(TextSpec(x_mid, recog_mean, txt, {"va": "center", "ha": "center", "color": "gray", "fontsize": 9, "bbox": box}))
+
+    # adjusted recognized stats (exclude 2020 & 2021) if available, in a different color
     try:
-        x = years
-        yvals = [v if v is not None else None for v in liabilities]
-        plt.figure(figsize=(10, 5))
-        plt.plot(x, yvals, marker="o", label="total_liabilities")
-        ax = plt.gca()
-        annotate_points(ax, x, yvals)
-        plt.xlabel("Year")
-        plt.ylabel("Total Liabilities")
-        plt.title("Total Liabilities by Year")
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(png_liabilities)
-        logger.info(f"Saved total liabilities plot to {png_liabilities}")
-        plt.close()
+        adj_mean, adj_std = qydl_get_adj_recognized_value(store, exclude_years=(2020, 2021))
     except Exception:
-        logger.exception("Failed to plot total liabilities")
+        adj_mean = adj_std = None
 
-    # plot cash (no point labels requested but we generate the plot)
-    try:
-        x = years
-        yvals = [v if v is not None else None for v in cash]
-        plt.figure(figsize=(10, 5))
-        plt.plot(x, yvals, marker="o", label="cash_and_cash_equivalents")
-        plt.xlabel("Year")
-        plt.ylabel("Cash and Cash Equivalents")
-        plt.title("Cash and Cash Equivalents by Year")
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(png_cash)
-        logger.info(f"Saved cash and cash equivalents plot to {png_cash}")
-        plt.close()
-    except Exception:
-        logger.exception("Failed to plot cash and cash equivalents")
+    if adj_mean is not None:
+        recog_spec.hlines.append(HLineSpec(adj_mean, color="tab:blue"))
+        txt2 = f"adj_mean={adj_mean:.3f}  adj_std={adj_std if adj_std is not None else 'NA'}"
+        recog_spec.texts.append(TextSpec(x_mid, adj_mean, txt2, {"va": "bottom", "ha": "center", "color": "tab:blue", "fontsize": 9, "bbox": box}))
+    specs.append(recog_spec)
 
-    # plot dividends with point annotations
-    try:
-        x = years
-        yvals = [v if v is not None else None for v in dividends]
-        plt.figure(figsize=(10, 5))
-        plt.plot(x, yvals, marker="o", label="total_dividends_paid")
-        ax = plt.gca()
-        annotate_points(ax, x, yvals)
-        plt.xlabel("Year")
-        plt.ylabel("Total Dividends Paid")
-        plt.title("Total Dividends Paid by Year")
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(png_dividends)
-        logger.info(f"Saved total dividends plot to {png_dividends}")
-        plt.close()
-    except Exception:
-        logger.exception("Failed to plot total dividends")
+    render_charts(specs)
+
+
+def qydl_cost_trends(json_data, out_dir: Path = OUT_DIR, horizon: int = 3):
+    """
+    成本项（COST_METRICS）的趋势拟合：线性、对数线性与分段线性三种模型一次批量最小二乘求解，
+    给出系数、残差标准差与未来 horizon 年的预测，见 cost_trends。
+
+    Outputs:
+    - `cost_trends.json`
+    - `cost_trend_<metric>.png`: 实际值与三种模型的拟合/预测曲线
+    """
+    from chart_render import ChartSpec, LineSpec, render_charts
+    from cost_trends import TREND_MODELS, fit_store
+
+    out_json = Path(out_dir) / "cost_trends.json"
+
+    store = as_year_store(json_data)
+    if not len(store.years):
+        logger.info("No yearly data found for cost trends; skipping")
+        return
+    fits = fit_store(store, COST_METRICS, horizon=horizon)
 
-    # plot recognized value with mean & std displayed in the middle
+    results = {
+        "years": store.years.tolist(),
+        "future_years": fits.future_years.tolist(),
+        "metrics": fits.to_rows(),
+    }
     try:
-        x = years
-        yvals = [v if v is not None else None for v in recognized]
-        plt.figure(figsize=(10, 5))
-        plt.plot(x, yvals, marker="o", label="recognized_value")
-        ax = plt.gca()
-        # annotate each point's value
-        annotate_points(ax, x, yvals, fmt="{:.3f}")
-        if recog_mean is not None:
-            plt.axhline(recog_mean, color="gray", linestyle="--", linewidth=1)
-            # center annotate with mean and std
-            try:
-                x_mid = (x[0] + x[-1]) / 2.0
-                txt = f"mean={recog_mean:.3f}  std={recog_std if recog_std is not None else 'NA'}"
-                plt.text(x_mid, recog_mean, txt, va="center", ha="center", color="gray", fontsize=9, bbox=dict(facecolor="white", alpha=0.7, edgecolor="none"))
-            except Exception:
-                pass
-
-        # plot adjusted recognized stats (exclude 2020 & 2021) if available
-        try:
-            adj_mean, adj_std = qydl_get_adj_recognized_value(json_data, exclude_years=(2020, 2021))
-        except Exception:
-            adj_mean = adj_std = None
-
-        if adj_mean is not None:
-            # use a different color to distinguish
-            plt.axhline(adj_mean, color="tab:blue", linestyle="--", linewidth=1)
-            try:
-                x_mid = (x[0] + x[-1]) / 2.0
-                txt2 = f"adj_mean={adj_mean:.3f}  adj_std={adj_std if adj_std is not None else 'NA'}"
-                # place slightly below the adjusted mean line to avoid overlap
-                plt.text(x_mid, adj_mean, txt2, va="bottom", ha="center", color="tab:blue", fontsize=9, bbox=dict(facecolor="white", alpha=0.7, edgecolor="none"))
-            except Exception:
-                pass
-
-        plt.xlabel("Year")
-        plt.ylabel("Recognized Value")
-        plt.title("Recognized Value (认可产生价值) by Year")
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(png_recognized)
-        logger.info(f"Saved recognized value plot to {png_recognized}")
-        plt.close()
+        if write_json_if_changed(out_json, results):
+            logger.info(f"Saved cost trends to {out_json}")
     except Exception:
-        logger.exception("Failed to plot recognized value")
+        logger.exception(f"Failed to write cost trends to {out_json}")
+
+    years = store.years.tolist()
+    axis = years + fits.future_years.tolist()
+    specs = []
+    for s, metric in enumerate(COST_METRICS):
+        spec = ChartSpec(
+            path=str(Path(out_dir) / f"cost_trend_{metric}.png"),
+            lines=[LineSpec(years, store.to_list(metric, 3), label=metric)],
+            ylabel=metric,
+            title=f"{metric} trend",
+            legend=True,
+        )
+        for m, model in enumerate(TREND_MODELS):
+            curve = np.concatenate([fits.fitted[m, s], fits.projection[m, s]])
+            if np.isfinite(curve).any():
+                ys = [round(float(v), 3) if np.isfinite(v) else None for v in curve]
+                spec.lines.append(LineSpec(axis, ys, label=model, marker=""))
+        specs.append(spec)
+    render_charts(specs)
+
+
+def qydl_save_generation_output(json_data, out_dir: Path = OUT_DIR):
+    """提取子公司各年 generation_output 并写出 `subsidiaries_generation_output.json`。"""
 
+    combined = qydl_extract_generation_output(json_data)
 
+    out_path_dict = Path(out_dir) / "subsidiaries_generation_output.json"
+    if write_json_if_changed(out_path_dict, combined):
+        logger.info(f"Saved combined data to {out_path_dict}")
+    return combined
 
-def qydl_generation_output_analysis(json_data):
-    """提取并分析子公司各年的 generation_output 数据。"""
-    
-    # 提取数据
-    combined = qydl_extract_generation_output(json_data)
 
-    # logger.info(combined)
+# 各阶段声明输入/输出，由 stage_scheduler 按依赖并发调度，每次运行每个阶段只执行一次；
+# deps 为阶段读取的 data.json 字段，依赖字段哈希未变且产物都在时跳过该阶段
+QYDL_STAGES = [
+    # 提取子公司各年 generation_output
+    Stage(
+        "extract_generation_output", qydl_save_generation_output, ("store", "out_dir"), ("combined",),
+        deps=("subsidiaries",), artifacts=("subsidiaries_generation_output.json",),
+    ),
+    # 生成站点统计并绘图
+    Stage(
+        "station_stats", analyze_and_plot_combined, ("combined", "out_dir"), ("station_stats",),
+        deps=("subsidiaries",),
+        artifacts=("generation_output_stats.json", STREAM_STATE_NAME, "generation_output_lines.png", STATION_GRID_NAME),
+    ),
+    # 生成公司层面年度 generation_output 历史图
+    Stage(
+        "generation_output_history", qydl_generation_output_history, ("store", "out_dir"),
+        deps=("generation_output",), artifacts=("generation_output_history.json", "generation_output_history.png"),
+    ),
+    # 生成基于 generation_output 与 on_grid_price 的理论营收对比
+    Stage(
+        "revenue_comparison", qydl_operating_revenue_and_generation_output_analysis, ("store", "out_dir"),
+        deps=("subsidiaries", "operating_revenue"), artifacts=("operating_revenue_theory_comparison.json",),
+    ),
+    # 生成 operating_revenue 与销售收到现金的对比图
+    Stage(
+        "cash_flow_chart", qydl_operating_revenue_and_cash_flow_analysis, ("store", "out_dir"),
+        deps=("operating_revenue", "cash_received_from_sales_and_services", "net_cash_flow_operating"),
+        artifacts=("operating_revenue_vs_cash_received.json", "operating_revenue_vs_cash_received.png"),
+    ),
+    # 生成 total_liabilities / cash / dividends 分析图
+    Stage(
+        "liabilities_chart", qydl_total_liabilities_and_cash_and_dividends_analysis, ("store", "out_dir"),
+        deps=RECOGNIZED_VALUE_FIELDS,
+        artifacts=(
+            "liabilities_cash_dividends.json", "total_liabilities.png", "cash_and_cash_equivalents.png",
+            "total_dividends_paid.png", "recognized_value.png",
+        ),
+    ),
+    # 生成成本项趋势拟合与预测
+    Stage(
+        "cost_trends", qydl_cost_trends, ("store", "out_dir"),
+        deps=COST_METRICS,
+        artifacts=("cost_trends.json", *(f"cost_trend_{m}.png" for m in COST_METRICS)),
+    ),
+    # 生成修正后的认可产生价值（返回供外部调用，每次都计算）
+    Stage("adj_recognized_value", qydl_get_adj_recognized_value, ("store",), ("adj_recognized_value", "adj_std")),
+]
 
-    out_path_dict = Path(__file__).parent / "subsidiaries_generation_output.json"
-    with out_path_dict.open("w", encoding="utf-8") as f:
-        json.dump(combined, f, ensure_ascii=False, indent=2)
-    logger.info(f"Saved combined data to {out_path_dict}")
 
-    # 生成统计并绘图（若可用）
-    try:
-        analyze_and_plot_combined(combined, out_path_dict.parent)
-    except Exception as e:
-        logger.exception(f"Failed to analyze/plot combined data: {e}")
+def _is_chart(artifact: str) -> bool:
+    return artifact.endswith(".png")
 
-    # 生成公司层面年度 generation_output 历史图
-    try:
-        qydl_generation_output_history(json_data)
-    except Exception:
-        logger.exception("Failed to run generation output history analysis")
 
-    # 生成基于 generation_output 历年数据，并画成折线图
-    try:
-        qydl_generation_output_history(json_data)
-    except Exception:
-        logger.exception("Failed to run checking generation output history")
+def _plan_stages(store, out_dir: Path, plots: bool):
+    """按增量清单判断本次要跳过的阶段，返回 (阶段依赖哈希, 跳过的阶段名集合)。"""
+    stage_hashes = {st.name: fields_hash(store, st.deps) for st in QYDL_STAGES if st.deps}
 
-    # 生成基于 generation_output 与 on_grid_price 的理论营收对比
-    try:
-        qydl_operating_revenue_and_generation_output_analysis(json_data)
-    except Exception:
-        logger.exception("Failed to run operating revenue vs generation_output analysis")
+    def is_fresh(st):
+        if st.name not in stage_hashes:
+            return False
+        if get_entry(out_dir, "stages", st.name) != stage_hashes[st.name]:
+            return False
+        return all((out_dir / name).exists() for name in st.artifacts if plots or not _is_chart(name))
 
-    # 生成基于 generation_output 与 on_grid_price 的理论营收对比
-    try:
-        qydl_operating_revenue_and_cash_flow_analysis(json_data)
-    except Exception:
-        logger.exception("Failed to run operating revenue vs cash flow analysis")
+    return stage_hashes, prune_fresh(QYDL_STAGES, is_fresh, ("store", "out_dir"))
 
-    # 生成 total_liabilities / cash / dividends 分析图
-    try:
-        qydl_total_liabilities_and_cash_and_dividends_analysis(json_data)
-    except Exception:
-        logger.exception("Failed to run liabilities/cash/dividends analysis")
 
-    # 生成 total_liabilities / cash / dividends 的分析图
+def _charts_pending(skip) -> bool:
+    """是否有要运行的阶段会绘图（需要渲染进程池）。"""
+    return any(st.name not in skip and any(_is_chart(a) for a in st.artifacts) for st in QYDL_STAGES)
+
+
+def qydl_start_render_pool(json_data, force: bool = False, out_dir: Path = OUT_DIR) -> bool:
+    """
+    有阶段需要绘图时拉起共享渲染进程池，返回是否已拉起。
+
+    渲染池用 fork 创建，须在启动任何线程（例如 async_writes 的后台 writer）之前调用；
+    之后的 qydl_generation_output_analysis 直接复用这个池。子进程中不建池。
+    """
+    import multiprocessing
+    from chart_render import get_render_pool
+
+    if multiprocessing.parent_process() is not None:
+        return False
+    if not force:
+        _, skip = _plan_stages(as_year_store(json_data), Path(out_dir), True)
+        if not _charts_pending(skip):
+            return False
+    get_render_pool()
+    return True
+
+
+def qydl_generation_output_analysis(json_data, executor: str = "thread", force: bool = False, out_dir: Path = OUT_DIR,
+                                    plots: bool = True):
+    """提取并分析子公司各年的 generation_output 数据。
+
+    各阶段由 `run_stages` 按依赖调度（executor: "thread" / "process" / "serial"），
+    每个阶段的耗时写入日志。阶段本身只做计算与写 JSON，图表提交到共享的
+    渲染进程池并行绘制。
+
+    增量构建：输出目录中的 `.qydl_manifest.json` 记录每个阶段依赖字段的哈希，
+    未变化的阶段直接跳过；运行的阶段里描述未变的图也不重绘，内容未变的 JSON
+    不重写。force=True 时忽略清单全部重新生成。所有产物写入 out_dir（默认脚本目录）。
+    plots=False 时只计算与写 JSON，不导入 matplotlib、不绘图；这些阶段的清单条目
+    不更新，之后带图运行时会补画。
+    返回 (adj_recognized_value, adj_std)。
+    """
+    import multiprocessing
+    from chart_render import get_render_pool, set_plotting
+
+    # 只解析一次，后续各阶段共用同一个 YearStore
+    store = as_year_store(json_data)
+    out_dir = Path(out_dir)
+    if force:
+        reset_manifest(out_dir)
+
+    stage_hashes, skip = _plan_stages(store, out_dir, plots)
+
+    # 有需要绘图的阶段时，在启动阶段线程之前拉起渲染进程池（子进程中直接渲染，不建池）；
+    # 与 async_writes 一起使用时应先调用 qydl_start_render_pool，避免在 writer 线程运行时 fork
+    if plots and multiprocessing.parent_process() is None and _charts_pending(skip):
+        get_render_pool()
+
+    previous = set_plotting(plots)
     try:
-        qydl_total_liabilities_and_cash_and_dividends_analysis(json_data)
-    except Exception:
-        logger.exception("Failed to run total liabilities/cash/dividends analysis")
+        with span("generation_output_analysis", "run", executor=executor, skipped=sorted(skip)):
+            ctx, timings = run_stages(
+                QYDL_STAGES, {"store": store, "out_dir": out_dir}, executor=executor, skip=skip
+            )
+    finally:
+        set_plotting(previous)
+    logger.info(f"Stage timings (s): { {k: round(v, 3) for k, v in timings.items()} }")
+
+    drew = {st.name for st in QYDL_STAGES if plots or not any(_is_chart(a) for a in st.artifacts)}
+    for name in timings:
+        if name in stage_hashes and name in drew:
+            set_entry(out_dir, "stages", name, stage_hashes[name])
+    save_manifest(out_dir)
+
+    return ctx.get("adj_recognized_value"), ctx.get("adj_std")
+
+def qydl_curr_position(json_data):
+    """
+    读取顶层 `curr`：返回 (total_liabilities, cash_and_cash_equivalents, net, total_shares_outstanding)，
+    字段缺失或非数值时全部为 None。
+    """
 
-    # 生成修正后的认可产生价值（返回供外部调用）
-    adj_recongize_value = None
-    adj_std = None
+    curr = as_year_store(json_data).meta.get("curr")
+    curr_total_liabilities = None
+    curr_cash = None
+    curr_net = None
+    curr_shares = None
     try:
-        res = qydl_get_adj_recognized_value(json_data)
-        if isinstance(res, tuple) and len(res) == 2:
-            adj_recongize_value, adj_std = res
+        if isinstance(curr, dict):
+            ctl = curr.get("total_liabilities")
+            cc = curr.get("cash_and_cash_equivalents")
+            cs = curr.get("total_shares_outstanding")
+            if isinstance(ctl, (int, float)) and isinstance(cc, (int, float)) and isinstance(cs, (int, float)):
+                curr_total_liabilities = float(ctl)
+                curr_cash = float(cc)
+                curr_net = curr_total_liabilities - curr_cash
+                curr_shares = float(cs)
+            else:
+                logger.info("curr.total_liabilities or curr.cash_and_cash_equivalents missing or non-numeric; skipping subtraction")
         else:
-            logger.info("qydl_get_adj_recognized_value returned unexpected result")
+            logger.info("No 'curr' section found in JSON; skipping subtraction")
     except Exception:
-        logger.exception("Failed to get adj recognized value")
+        logger.exception("Error while reading 'curr' values; skipping subtraction")
+
+    return curr_total_liabilities, curr_cash, curr_net, curr_shares
+
+
+def qydl_parent_profit_ratios(json_data) -> np.ndarray:
+    """各年 net_profit_attributable_to_parent / net_profit（跳过缺失或 net_profit 为 0 的年份）。"""
+    store = as_year_store(json_data)
+    np_total = store.col("net_profit")
+    np_parent = store.col("net_profit_attributable_to_parent")
+    valid = store.mask("net_profit") & store.mask("net_profit_attributable_to_parent") & (np_total != 0)
+    return np_parent[valid] / np_total[valid]
 
-    return adj_recongize_value, adj_std
 
-def qydl_get_market_value(json_data, adj_recognized_value, adj_std_val):
+def qydl_market_value_details(json_data, adj_recognized_value, adj_std_val, expected_rate=None):
     """
-    Compute market value for consolidated company using:
+    Compute market value details for consolidated company using:
 
     - expected_market_value = adj_recognized_value / expected_rate
       (uses `expected_rate` from top-level of `data.json`)
@@ -1237,59 +1084,42 @@ def qydl_get_market_value(json_data, adj_recognized_value, adj_std_val):
     - market_value = expected_market_value * average_ratio
     - std_market_value = market_value * (adj_std_val / adj_recognized_value)
 
-    Returns (market_value, std_market_value), both rounded to 3 decimals when numeric,
-    otherwise (None, None). Also writes `market_value.json` next to the script with
-    details for inspection.
+    Returns the details dict written to `market_value.json` (market_value and
+    std_market_value rounded to 3 decimals), or None when inputs are insufficient.
+    Nothing is written to disk; see qydl_get_market_value.
+
+    expected_rate, when given, overrides the top-level `expected_rate` (e.g. for what-if queries).
     """
 
-    out_file = Path(__file__).parent / "market_value.json"
+    store = as_year_store(json_data)
 
     # validate inputs
     try:
-        expected_rate = json_data.get("expected_rate")
+        if expected_rate is None:
+            expected_rate = store.meta.get("expected_rate")
         if expected_rate is None:
             logger.info("expected_rate missing in JSON; cannot compute market value")
-            return (None, None)
+            return None
         expected_rate = float(expected_rate)
         if expected_rate == 0:
             logger.info("expected_rate is zero; cannot divide")
-            return (None, None)
+            return None
     except Exception:
         logger.exception("Invalid expected_rate in JSON")
-        return (None, None)
+        return None
 
     if adj_recognized_value is None:
         logger.info("adj_recognized_value is None; cannot compute market value")
-        return (None, None)
+        return None
 
     try:
         expected_market_value_raw = float(adj_recognized_value) / expected_rate
     except Exception:
         logger.exception("Failed to compute expected_market_value")
-        return (None, None)
+        return None
 
     # subtract curr (total_liabilities - cash_and_cash_equivalents) if available
-    curr = json_data.get("curr")
-    curr_total_liabilities = None
-    curr_cash = None
-    curr_net = None
-    curr_shares = None
-    try:
-        if isinstance(curr, dict):
-            ctl = curr.get("total_liabilities")
-            cc = curr.get("cash_and_cash_equivalents")
-            cs = curr.get("total_shares_outstanding")
-            if isinstance(ctl, (int, float)) and isinstance(cc, (int, float)) and isinstance(cs, (int, float)):
-                curr_total_liabilities = float(ctl)
-                curr_cash = float(cc)
-                curr_net = curr_total_liabilities - curr_cash
-                curr_shares = float(cs)
-            else:
-                logger.info("curr.total_liabilities or curr.cash_and_cash_equivalents missing or non-numeric; skipping subtraction")
-        else:
-            logger.info("No 'curr' section found in JSON; skipping subtraction")
-    except Exception:
-        logger.exception("Error while reading 'curr' values; skipping subtraction")
+    curr_total_liabilities, curr_cash, curr_net, curr_shares = qydl_curr_position(store)
 
     if curr_net is not None:
         expected_market_value = expected_market_value_raw - curr_net
@@ -1297,27 +1127,11 @@ def qydl_get_market_value(json_data, adj_recognized_value, adj_std_val):
         expected_market_value = expected_market_value_raw
 
     # compute per-year parent/net profit ratios
-    ratios = []
-    for k, v in json_data.items():
-        try:
-            year = int(k)
-        except Exception:
-            continue
-        entry = v if isinstance(v, dict) else {}
-        np_total = entry.get("net_profit")
-        np_parent = entry.get("net_profit_attributable_to_parent")
-        if not isinstance(np_total, (int, float)) or not isinstance(np_parent, (int, float)):
-            continue
-        if np_total == 0:
-            continue
-        try:
-            ratios.append(float(np_parent) / float(np_total))
-        except Exception:
-            continue
+    ratios = qydl_parent_profit_ratios(store).tolist()
 
     if not ratios:
         logger.info("No valid parent/net profit ratios found; cannot compute market_value")
-        return (None, None)
+        return None
 
     avg_ratio = sum(ratios) / len(ratios)
 
@@ -1335,8 +1149,8 @@ def qydl_get_market_value(json_data, adj_recognized_value, adj_std_val):
     mv_out = round(market_value, 3) if isinstance(market_value, (int, float)) else None
     smv_out = round(std_market_value, 3) if isinstance(std_market_value, (int, float)) else None
 
-    expected_stock_value = mv_out / curr_shares if curr_shares not in (0, None) else None
-    std_stock_value = smv_out / curr_shares if curr_shares not in (0, None) else None
+    expected_stock_value = mv_out / curr_shares if curr_shares not in (0, None) and mv_out is not None else None
+    std_stock_value = smv_out / curr_shares if curr_shares not in (0, None) and smv_out is not None else None
 
 
     out = {
@@ -1351,29 +1165,424 @@ def qydl_get_market_value(json_data, adj_recognized_value, adj_std_val):
         "avg_parent_to_total_profit_ratio": round(avg_ratio, 6),
         "market_value": mv_out,
         "std_market_value": smv_out,
-        "expected_stock_value": round(expected_stock_value, 6),
-        "std_stock_value": round(std_stock_value, 6),
+        "expected_stock_value": round(expected_stock_value, 6) if expected_stock_value is not None else None,
+        "std_stock_value": round(std_stock_value, 6) if std_stock_value is not None else None,
     }
+    return out
 
+
+def qydl_get_market_value(json_data, adj_recognized_value, adj_std_val, out_dir: Path = OUT_DIR):
+    """
+    计算市值（见 qydl_market_value_details）并把明细写入 out_dir/market_value.json。
+
+    Returns (market_value, std_market_value), both rounded to 3 decimals when numeric,
+    otherwise (None, None).
+    """
+
+    with span("market_value"):
+        details = qydl_market_value_details(json_data, adj_recognized_value, adj_std_val)
+        if details is None:
+            return (None, None)
+        qydl_save_market_value(details, out_dir)
+
+    return details["market_value"], details["std_market_value"]
+
+
+def qydl_save_market_value(details: dict, out_dir: Path = OUT_DIR):
+    """把 qydl_market_value_details 的结果写入 out_dir/market_value.json（内容不变时不写）。"""
+    out_file = Path(out_dir) / "market_value.json"
     try:
-        with out_file.open("w", encoding="utf-8") as f:
-            json.dump(out, f, ensure_ascii=False, indent=2)
-        logger.info(f"Saved market value details to {out_file}")
+        if write_json_if_changed(out_file, details):
+            logger.info(f"Saved market value details to {out_file}")
     except Exception:
         logger.exception(f"Failed to write market value JSON to {out_file}")
 
-    return mv_out, smv_out
+def qydl_monte_carlo_market_value(json_data, adj_recognized_value, adj_std_val, n_draws: int = 1_000_000,
+                                  seed: int = 0, deadline_s: float = None, distributions: dict = None,
+                                  percentiles=None, out_dir: Path = OUT_DIR):
+    """
+    Monte Carlo 版本的 qydl_get_market_value：对认定值、expected_rate、归母/净利润比例抽样，
+    整批计算 (认定值 / rate - curr 净负债) * 比例 及每股价值，给出分位数。
+
+    默认分布：认定值 ~ Normal(adj_recognized_value, adj_std)，expected_rate 固定为 data.json 中的值，
+    比例从各年实际比例中有放回抽样。distributions 可按键 "recognized" / "rate" / "ratio"
+    传入 monte_carlo.Dist 覆盖其中任意几个。seed 相同则结果相同；deadline_s 为时间预算（秒），
+    超时返回已完成部分的估计。percentiles 默认为 monte_carlo.DEFAULT_PERCENTILES。
+
+    结果写入 out_dir/market_value_monte_carlo.json 并返回；输入不足时返回 None。
+    """
+    from monte_carlo import DEFAULT_PERCENTILES, Dist, run_monte_carlo
+
+    store = as_year_store(json_data)
+    dists = dict(distributions or {})
+    if "recognized" not in dists:
+        if adj_recognized_value is None:
+            logger.info("adj_recognized_value is None; cannot run Monte Carlo valuation")
+            return None
+        dists["recognized"] = Dist("normal", adj_recognized_value, adj_std_val or 0.0)
+    if "rate" not in dists:
+        expected_rate = store.meta.get("expected_rate")
+        if not isinstance(expected_rate, (int, float)) or expected_rate == 0:
+            logger.info("expected_rate missing or zero; cannot run Monte Carlo valuation")
+            return None
+        dists["rate"] = Dist("fixed", float(expected_rate))
+    if "ratio" not in dists:
+        ratios = qydl_parent_profit_ratios(store)
+        if ratios.size == 0:
+            logger.info("No valid parent/net profit ratios found; cannot run Monte Carlo valuation")
+            return None
+        dists["ratio"] = Dist("empirical", values=ratios.tolist())
+
+    _, _, curr_net, curr_shares = qydl_curr_position(store)
+    try:
+        result = run_monte_carlo(
+            dists, n_draws=n_draws, seed=seed, deadline_s=deadline_s,
+            curr_net=curr_net, shares=curr_shares, percentiles=DEFAULT_PERCENTILES if percentiles is None else percentiles,
+        )
+    except Exception:
+        logger.exception("Monte Carlo valuation failed")
+        return None
+    result = {"seed": seed, "distributions": {k: asdict(v) for k, v in dists.items()}, **result}
+    logger.info(f"Monte Carlo: {result['n_draws']} draws in {result['elapsed_s']}s, market_value {result['market_value']['percentiles']}")
+
+    out_file = Path(out_dir) / "market_value_monte_carlo.json"
+    try:
+        if write_json_if_changed(out_file, result):
+            logger.info(f"Saved Monte Carlo valuation to {out_file}")
+    except Exception:
+        logger.exception(f"Failed to write Monte Carlo JSON to {out_file}")
+    return result
+
+def qydl_sensitivity_grid(json_data, rates, exclude_sets=((2020, 2021),), ratios=None,
+                          out_dir: Path = None, heatmap_ratio=None) -> "SensitivityGrid":
+    """
+    在 expected_rate × exclude_years 集合 × 归母比例 的完整笛卡尔网格上计算市值，
+    一次广播完成，不逐格调用 qydl_get_market_value。
+
+    - rates: expected_rate 取值序列
+    - exclude_sets: qydl_get_adj_recognized_value 的候选 exclude_years，每项一个年份集合
+    - ratios: 归母/净利润比例的覆盖值；None 时只用各年实际比例的均值
+    - out_dir: 给出时写 sensitivity_grid.npz 与热力图 sensitivity_heatmap.png
+      （rate × 排除集合，取最接近 heatmap_ratio 的比例切片，默认为实际均值比例）
+
+    返回 SensitivityGrid，market_value[i, j, k] 与 qydl_get_market_value 在相同输入下的结果一致。
+    """
+    from chart_render import ChartSpec, HeatmapSpec, render_charts
+    from sensitivity import SensitivityGrid, evaluate_grid, exclusion_stats
+
+    store = as_year_store(json_data)
+    exclude_sets = [tuple(sorted(s)) for s in exclude_sets]
+    years, values, mask = qydl_recognized_value(store)
+    mean, std = exclusion_stats(years, values, mask, exclude_sets)
+    adj, adj_std = np.round(mean, 3), np.round(std, 3)
+
+    ratio_hist = qydl_parent_profit_ratios(store).tolist()
+    avg_ratio = sum(ratio_hist) / len(ratio_hist) if ratio_hist else float("nan")
+    ratios = np.asarray([avg_ratio] if ratios is None else ratios, dtype=float)
+    rates = np.asarray(rates, dtype=float)
+
+    _, _, curr_net, curr_shares = qydl_curr_position(store)
+    mv, smv, per_share = evaluate_grid(rates, adj, adj_std, ratios, curr_net=curr_net, shares=curr_shares)
+    grid = SensitivityGrid(
+        rates=rates,
+        exclude_sets=exclude_sets,
+        ratios=ratios,
+        adj_recognized_value=adj,
+        adj_std=adj_std,
+        market_value=mv,
+        std_market_value=smv,
+        per_share_value=per_share,
+        meta={"avg_ratio": avg_ratio, "curr_net": curr_net, "total_shares_outstanding": curr_shares},
+    )
+
+    if out_dir is not None:
+        out_dir = Path(out_dir)
+        out_npz = out_dir / "sensitivity_grid.npz"
+        try:
+            np.savez_compressed(
+                out_npz, rates=rates, ratios=ratios, market_value=mv, std_market_value=smv,
+                adj_recognized_value=adj, adj_std=adj_std,
+                exclude_sets=np.array([",".join(map(str, s)) for s in exclude_sets]),
+            )
+            logger.info(f"Saved sensitivity grid {mv.shape} to {out_npz}")
+        except Exception:
+            logger.exception(f"Failed to write sensitivity grid to {out_npz}")
+
+        target = avg_ratio if heatmap_ratio is None else heatmap_ratio
+        k = int(np.nanargmin(np.abs(ratios - target))) if np.isfinite(ratios - target).any() else 0
+        spec = ChartSpec(
+            path=str(out_dir / "sensitivity_heatmap.png"),
+            figsize=(10, 6),
+            xlabel="exclude_years",
+            ylabel="expected_rate",
+            title=f"Market value sensitivity (parent ratio {ratios[k]:.3f})",
+            grid=False,
+            heatmap=HeatmapSpec(
+                data=mv[:, :, k].tolist(),
+                x_labels=[",".join(map(str, s)) or "-" for s in exclude_sets],
+                y_labels=[f"{r:.4f}" for r in rates],
+                colorbar_label="market_value",
+            ),
+        )
+        render_charts([spec], parallel=False, incremental=False)
+
+    return grid
+
+def qydl_exclude_years_search(json_data, max_excluded: int = 2, current=(2020, 2021), out_dir: Path = None) -> dict:
+    """
+    穷举所有不超过 max_excluded 个排除年份的组合，给出每个组合下认定值的均值与总体标准差，
+    并评估估计的稳健性。子集统计由 subset_exclusion_stats 一次算出，不逐个调用
+    qydl_get_adj_recognized_value。
+
+    返回的报告包括：
+    - baseline: 不排除任何年份时的 mean/std
+    - current: 当前使用的 exclude_years（默认 2020、2021）的 mean/std，以及其均值在同样
+      大小的组合中的分位（0 为最低，1 为最高）
+    - by_size: 每个排除个数下组合数、均值的最小/最大/极差/标准差
+    - year_influence: 单独排除某年后均值相对 baseline 的变化
+    - subsets: 全部组合（按排除个数、年份排序）
+
+    out_dir 给出时写入 exclude_years_search.json。
+    """
+    from sensitivity import subset_exclusion_stats
+
+    years, values, mask = qydl_recognized_value(json_data)
+    valid_years = [int(y) for y in years[mask]]
+    masks, counts, mean, std = subset_exclusion_stats(values[mask], max_excluded)
+
+    def decode(m):
+        return [y for i, y in enumerate(valid_years) if (int(m) >> i) & 1]
+
+    def r3(x):
+        return round(float(x), 3) if np.isfinite(x) else None
+
+    by_size = {}
+    for c in range(1, max_excluded + 1):
+        sel = mean[(counts == c) & np.isfinite(mean)]
+        if sel.size == 0:
+            continue
+        by_size[str(c)] = {
+            "n_subsets": int(sel.size),
+            "mean_min": r3(sel.min()),
+            "mean_max": r3(sel.max()),
+            "mean_spread": r3(sel.max() - sel.min()),
+            "mean_std": r3(sel.std()),
+        }
+
+    baseline_mean = mean[0]
+    singles = counts == 1
+    year_influence = {str(decode(m)[0]): r3(mu - baseline_mean) for m, mu in zip(masks[singles], mean[singles])}
+
+    cur_bits = sum(1 << valid_years.index(y) for y in set(current) if y in valid_years)
+    cur_idx = np.flatnonzero(masks == cur_bits)
+    current_report = None
+    if cur_idx.size:
+        i = int(cur_idx[0])
+        peers = mean[(counts == counts[i]) & np.isfinite(mean)]
+        rank = float((peers < mean[i]).sum()) / max(peers.size - 1, 1)
+        current_report = {
+            "exclude_years": decode(masks[i]),
+            "mean": r3(mean[i]),
+            "std": r3(std[i]),
+            "mean_percentile_among_same_size": round(rank, 3),
+        }
+
+    report = {
+        "years": valid_years,
+        "max_excluded": max_excluded,
+        "baseline": {"mean": r3(mean[0]), "std": r3(std[0])},
+        "current": current_report,
+        "by_size": by_size,
+        "year_influence": year_influence,
+        "subsets": [
+            {"exclude_years": decode(m), "mean": r3(mu), "std": r3(sd)}
+            for m, mu, sd in zip(masks, mean, std)
+        ],
+    }
+
+    if out_dir is not None:
+        out_file = Path(out_dir) / "exclude_years_search.json"
+        try:
+            if write_json_if_changed(out_file, report):
+                logger.info(f"Saved exclude-years search to {out_file}")
+        except Exception:
+            logger.exception(f"Failed to write exclude-years search to {out_file}")
+    return report
+
+def qydl_price_scenarios(json_data, shocks: dict = None, hydro=None, pv=None, out_dir: Path = None) -> "ScenarioRevenue":
+    """
+    上网电价情景分析：各电站按多年平均发电量，在多组电价下一次矩阵乘法算出预测营收。
+
+    - 基准情景 "latest"（各电站最新电价）与 "composition"（revenue_composition 的水电/光伏电价），见 price_scenarios
+    - shocks: 自定义相对变化，例如 {"hydro-5%": {"hydro": -0.05}, "guangzhao+2%": {"guangzhao": 0.02}}
+    - hydro / pv: 给出时在 "latest" 上追加 水电 × 光伏 变化率网格
+    - out_dir: 给出时写 price_scenarios.json
+
+    返回 ScenarioRevenue（total[s] 与 by_subsidiary[s, j] 单位为亿元）。
+    """
+    from price_scenarios import base_scenarios, project_revenue, shock_grid, tariff_shocks
+
+    store = as_year_store(json_data)
+    stations = qydl_station_registry(store)
+    scenarios = base_scenarios(stations, store)
+    if shocks:
+        scenarios = tariff_shocks(scenarios, shocks, stations.kinds)
+    if hydro is not None or pv is not None:
+        scenarios = shock_grid(scenarios, stations.kinds, hydro=(0.0,) if hydro is None else hydro,
+                               pv=(0.0,) if pv is None else pv)
+    subsidiaries = list(dict.fromkeys(stations.subsidiaries))
+    result = project_revenue(stations, scenarios, subsidiaries)
+    if scenarios.sources["latest_fallback"]:
+        logger.info(f"No on_grid_price history for {scenarios.sources['latest_fallback']}; using composition prices")
+
+    if out_dir is not None:
+        out_file = Path(out_dir) / "price_scenarios.json"
+        report = {
+            "stations": {
+                name: {
+                    "generation": round(float(g), 3),
+                    "consolidated": bool(w),
+                    "latest_price": round(float(scenarios.prices[0, i]), 4),
+                }
+                for i, (name, g, w) in enumerate(zip(stations.names, result.generation, result.weight))
+            },
+            "sources": scenarios.sources,
+            "scenarios": result.to_rows(),
+        }
+        try:
+            if write_json_if_changed(out_file, report):
+                logger.info(f"Saved {len(scenarios)} price scenarios to {out_file}")
+        except Exception:
+            logger.exception(f"Failed to write price scenarios to {out_file}")
+
+    return result
+
+
+def qydl_dcf_model(json_data, **assumptions) -> "DCFModel":
+    """
+    电站级现金流折现模型（见 dcf_engine）：多年平均发电量 × 最新上网电价 − 趋势外推的公司成本，
+    按持股比例汇总后以 expected_rate 折现。assumptions 为 DCFAssumptions 的字段。
+
+    同一个 store 只保留一个模型（存于 store.derived）：再次调用时按新假设 update，
+    只重算受影响的中间结果（例如只换折现率时不重做成本拟合与营收矩阵）。
+    """
+    from dcf_engine import DCFAssumptions, DCFModel
+
+    store = as_year_store(json_data)
+    requested = DCFAssumptions(**assumptions)
+    model = store.derived.get("dcf_model")
+    if model is None:
+        model = store.derived["dcf_model"] = DCFModel(qydl_station_registry(store), store, requested)
+    else:
+        changes = {f.name: getattr(requested, f.name) for f in dataclass_fields(DCFAssumptions)}
+        if changes["rate"] is None:
+            changes["rate"] = model.default_rate
+        model.update(**changes)
+    return model
+
+
+def qydl_dcf_valuation(json_data, out_dir: Path = None, **assumptions) -> dict:
+    """
+    用 qydl_dcf_model 估值，返回 DCFModel.valuation 的结果（净负债与总股本取自顶层 curr）。
+
+    out_dir 给出时写 dcf_valuation.json（数值保留 3 位小数）。
+    """
+
+    store = as_year_store(json_data)
+    _, _, curr_net, curr_shares = qydl_curr_position(store)
+    with span("dcf_valuation"):
+        result = qydl_dcf_model(store, **assumptions).valuation(curr_net, curr_shares)
+
+    if out_dir is not None:
+        out_file = Path(out_dir) / "dcf_valuation.json"
+
+        def rounded(v, ndigits=3):
+            if isinstance(v, float):
+                return round(v, ndigits) if math.isfinite(v) else None
+            if isinstance(v, dict):
+                return {k: rounded(x, ndigits) for k, x in v.items()}
+            if isinstance(v, list):
+                return [rounded(x, ndigits) for x in v]
+            return v
+
+        try:
+            if write_json_if_changed(out_file, rounded(result)):
+                logger.info(f"Saved DCF valuation to {out_file}")
+        except Exception:
+            logger.exception(f"Failed to write DCF valuation to {out_file}")
+
+    return result
+
+
+def qydl_valuation(data_file: Path = DATA_FILE, out_dir: Path = None, plots: bool = False, force: bool = False) -> dict:
+    """
+    库调用入口：读取 data_file，运行全部分析阶段并计算市值，默认不绘图（不导入 matplotlib）。
+
+    out_dir 默认为 data_file 所在目录。返回 {"adj_recognized_value", "adj_std", "market_value", "std_market_value"}。
+    """
+
+    data_file = Path(data_file)
+    out_dir = data_file.parent if out_dir is None else Path(out_dir)
+    store = load_store(data_file)
+    adj_recognized_value, adj_std_val = qydl_generation_output_analysis(store, force=force, out_dir=out_dir, plots=plots)
+    market_value, std_market_value = qydl_get_market_value(store, adj_recognized_value, adj_std_val, out_dir=out_dir)
+    return {
+        "adj_recognized_value": adj_recognized_value,
+        "adj_std": adj_std_val,
+        "market_value": market_value,
+        "std_market_value": std_market_value,
+    }
+
 
 data_update = True  # 设置为 True 以启用数据更新分析
-def main():
-    # 读取并打印
-    loaded = load_json(DATA_FILE)
+monte_carlo_update = False  # 设置为 True 以额外输出 Monte Carlo 估值分布
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="qydl002039 分析与估值")
+    parser.add_argument("--no-plot", action="store_true", help="只计算与写 JSON，不导入 matplotlib、不绘图")
+    parser.add_argument("--force", action="store_true", help="忽略增量清单，全部重新生成")
+    parser.add_argument("--trace", action="store_true",
+                        help=f"记录各阶段/图表/JSON 写入的 span，输出 {TRACE_NAME}（Chrome/Perfetto）与 {TRACE_SUMMARY_NAME}")
+    parser.add_argument("--profile-stage", default=None, help="对指定阶段开启 cProfile 与 tracemalloc（隐含 --trace）")
+    parser.add_argument("--sync-writes", action="store_true", help="在主线程中同步写 JSON（默认交给后台线程）")
+    parser.add_argument("--bundle", action="store_true", help=f"额外把全部 JSON 结果写入单个 {BUNDLE_NAME}")
+    parser.add_argument("--bundle-only", action="store_true", help=f"只写 {BUNDLE_NAME}，不写单独的 JSON 文件")
+    args = parser.parse_args(argv)
+    # 结果包由后台 writer 汇总写出，同步写入时无处收集
+    if args.sync_writes and (args.bundle or args.bundle_only):
+        parser.error("--bundle/--bundle-only cannot be combined with --sync-writes")
+
+    # 环境变量 QYDL_TRACE / QYDL_PROFILE_STAGE 也可开启，无需修改调用方
+    if args.trace or args.profile_stage:
+        start_tracing(args.profile_stage)
+    else:
+        start_tracing_from_env()
+
+    logger.info(f"Module import took {IMPORT_TIME_S * 1000:.1f} ms; matplotlib loaded: {'matplotlib' in sys.modules}")
+
+    # 读取并构建列式存储
+    loaded = load_store(DATA_FILE)
 
     logger.info("Loaded JSON success.")
 
     if(data_update):
-        adj_recognized_value, adj_std_val = qydl_generation_output_analysis(loaded)
-        market_value, std_market_value = qydl_get_market_value(loaded, adj_recognized_value, adj_std_val)
+        # JSON 的序列化与写盘在后台线程进行，退出 with 时全部写完
+        # 渲染进程池以 fork 创建，须在后台 writer 线程启动之前拉起
+        if not args.no_plot:
+            qydl_start_render_pool(loaded, force=args.force)
+        writes = nullcontext() if args.sync_writes else async_writes(args.bundle, args.bundle_only)
+        with writes:
+            adj_recognized_value, adj_std_val = qydl_generation_output_analysis(loaded, force=args.force, plots=not args.no_plot)
+            market_value, std_market_value = qydl_get_market_value(loaded, adj_recognized_value, adj_std_val)
+            if(monte_carlo_update):
+                qydl_monte_carlo_market_value(loaded, adj_recognized_value, adj_std_val)
+
+    summary = stop_tracing(OUT_DIR)
+    if summary is not None:
+        logger.info(f"Traced run: {summary['wall_ms']} ms; slowest spans: {list(summary['spans'])[:5]}")
+
+
+# 模块导入耗时（从第一行到此处，含 numpy 等依赖）
+IMPORT_TIME_S = time.perf_counter() - _IMPORT_START
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
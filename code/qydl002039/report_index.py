@@ -0,0 +1,327 @@
+import argparse
+import json
+import logging
+import re
+import shutil
+import time
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+from build_manifest import write_json_if_changed
+from report_ingest import CACHE_DIR, REPO_ROOT, extract_reports, file_hash
+
+logging.basicConfig(format="%(asctime)s %(levelname)s %(funcName)s: %(message)s")
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_TICKER_DIR = REPO_ROOT / "info" / "qydl002039"
+INDEX_DIR_NAME = ".report_index"
+MANIFEST_NAME = "index.json"
+INDEX_VERSION = 2
+# 多词查询时各词需出现在同一页、相距不超过 DEFAULT_WINDOW 个字符（去空白后的文本）
+DEFAULT_WINDOW = 30
+SNIPPET_CONTEXT = 40
+PAGE_SEP = "\n"
+CODE_BASE = 0x110000
+
+
+def normalize(text: str) -> str:
+    """NFKC（全角转半角）、小写、去掉所有空白：PDF 中换行断开的“发\\n电量”可以连起来匹配。"""
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text).lower())
+
+
+def bigram_codes(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """字符二元组编码为 int64：ord(a) * 0x110000 + ord(b)，按码排序即按二元组排序。"""
+    return a.astype(np.int64) * CODE_BASE + b.astype(np.int64)
+
+
+def build_segment(pages, seg_dir: Path) -> int:
+    """
+    为一份报告建立位置倒排表，写到 seg_dir（每个数组一个 .npy，可 mmap 打开）：
+
+    - codes: 排序后的二元组编码（见 bigram_codes）
+    - offsets: codes[i] 的位置在 positions[offsets[i]:offsets[i + 1]]
+    - positions: 二元组在 text 中的起始位置（每个二元组内部升序）
+    - page_starts: 各页在 text 中的起始位置
+    - text.txt: 规范化后的全文，各页以 PAGE_SEP 分隔（用于摘要）
+    """
+    texts = [normalize(p["text"]) for p in pages]
+    text = PAGE_SEP.join(texts)
+    page_starts = np.cumsum([0] + [len(t) + 1 for t in texts[:-1]]).astype(np.int64)
+
+    chars = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    sep = ord(PAGE_SEP)
+    keep = (chars[:-1] != sep) & (chars[1:] != sep)
+    pos = np.flatnonzero(keep)
+    codes = bigram_codes(chars[:-1], chars[1:])[keep]
+    order = np.argsort(codes, kind="stable")
+    keys, counts = np.unique(codes[order], return_counts=True)
+
+    tmp = seg_dir.with_name(seg_dir.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    np.save(tmp / "codes.npy", keys)
+    np.save(tmp / "offsets.npy", np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+    np.save(tmp / "positions.npy", pos[order].astype(np.int64))
+    np.save(tmp / "page_starts.npy", page_starts)
+    (tmp / "text.txt").write_text(text, encoding="utf-8")
+    shutil.rmtree(seg_dir, ignore_errors=True)
+    tmp.rename(seg_dir)
+    return len(keys)
+
+
+def merge_segments(index_dir: Path, files: list, digests: list):
+    """
+    把各报告的段合并为一个全局倒排表（index_dir/merged），查询时只需一次查找。
+
+    各报告的位置加上该报告在全局文本中的起点；稳定排序保证同一二元组的位置全局升序。
+    """
+    codes, positions, page_starts, page_doc, doc_starts = [], [], [], [], []
+    start = 0
+    for doc, digest in enumerate(digests):
+        seg_dir = index_dir / "segments" / digest
+        seg_codes = np.load(seg_dir / "codes.npy")
+        counts = np.diff(np.load(seg_dir / "offsets.npy"))
+        starts = np.load(seg_dir / "page_starts.npy")
+        codes.append(np.repeat(seg_codes, counts))
+        positions.append(np.load(seg_dir / "positions.npy") + start)
+        page_starts.append(starts + start)
+        page_doc.append(np.full(len(starts), doc, dtype=np.int32))
+        doc_starts.append(start)
+        start += (seg_dir / "text.txt").stat().st_size + 1  # 上界即可：只需各报告的位置区间互不重叠
+
+    codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int64)
+    positions = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+    order = np.argsort(codes, kind="stable")
+    keys, counts = np.unique(codes[order], return_counts=True)
+
+    merged = index_dir / "merged"
+    tmp = index_dir / "merged.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    np.save(tmp / "codes.npy", keys)
+    np.save(tmp / "offsets.npy", np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+    np.save(tmp / "positions.npy", positions[order])
+    np.save(tmp / "page_starts.npy", np.concatenate(page_starts) if page_starts else np.empty(0, dtype=np.int64))
+    np.save(tmp / "page_doc.npy", np.concatenate(page_doc) if page_doc else np.empty(0, dtype=np.int32))
+    np.save(tmp / "doc_starts.npy", np.array(doc_starts, dtype=np.int64))
+    with (tmp / "docs.json").open("w", encoding="utf-8") as f:
+        json.dump({"files": files, "digests": digests}, f, ensure_ascii=False)
+    shutil.rmtree(merged, ignore_errors=True)
+    tmp.rename(merged)
+
+
+def update_index(ticker_dir: Path = DEFAULT_TICKER_DIR, index_dir: Path = None, cache_dir: Path = CACHE_DIR,
+                 max_workers=None) -> dict:
+    """
+    增量更新 ticker_dir 下所有 PDF 的索引，返回清单。
+
+    大小与修改时间未变的文件直接跳过；变了的文件按内容哈希判断，只有新内容才抽取文本并建段
+    （每份报告一个段），已删除文件的段随之清理。有变化时重新合并全局倒排表（只读各段数组，
+    不重新抽取文本）。
+    """
+    ticker_dir = Path(ticker_dir)
+    index_dir = Path(index_dir or ticker_dir / INDEX_DIR_NAME)
+    manifest_file = index_dir / MANIFEST_NAME
+    manifest = {"version": INDEX_VERSION, "docs": {}}
+    if manifest_file.exists():
+        with manifest_file.open("r", encoding="utf-8") as f:
+            loaded = json.load(f)
+        if loaded.get("version") == INDEX_VERSION:
+            manifest = loaded
+
+    docs = {}
+    to_build = {}
+    for path in sorted(p for p in ticker_dir.rglob("*") if p.suffix.lower() == ".pdf"):
+        rel = path.relative_to(ticker_dir).as_posix()
+        st = path.stat()
+        entry = dict(manifest["docs"].get(rel, {}))
+        if entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+            entry = {"sha256": file_hash(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        docs[rel] = entry
+        if not (index_dir / "segments" / entry["sha256"] / "codes.npy").exists():
+            to_build[path] = rel
+
+    start = time.perf_counter()
+    if to_build:
+        logger.info(f"Indexing {len(to_build)} new or changed report(s) under {ticker_dir}")
+        digests = {path: docs[rel]["sha256"] for path, rel in to_build.items()}
+        for path, (digest, pages) in extract_reports(to_build, cache_dir, max_workers, digests).items():
+            n_keys = build_segment(pages, index_dir / "segments" / digest)
+            docs[to_build[path]]["pages"] = len(pages)
+            logger.info(f"{to_build[path]}: {len(pages)} pages, {n_keys} distinct bigrams")
+
+    live = {e["sha256"] for e in docs.values()}
+    seg_root = index_dir / "segments"
+    for seg in (seg_root.iterdir() if seg_root.exists() else []):
+        if seg.name not in live:
+            shutil.rmtree(seg, ignore_errors=True)
+
+    files = sorted(docs)
+    digests = [docs[f]["sha256"] for f in files]
+    merged_docs = index_dir / "merged" / "docs.json"
+    current = None
+    if merged_docs.exists():
+        with merged_docs.open("r", encoding="utf-8") as f:
+            current = json.load(f)
+    if current != {"files": files, "digests": digests}:
+        merge_segments(index_dir, files, digests)
+
+    manifest = {"version": INDEX_VERSION, "docs": docs}
+    index_dir.mkdir(parents=True, exist_ok=True)
+    write_json_if_changed(manifest_file, manifest)
+    logger.info(f"Index {index_dir}: {len(docs)} reports, {len(to_build)} rebuilt in {time.perf_counter() - start:.1f}s")
+    return manifest
+
+
+def parse_query(query: str) -> list:
+    """引号内为一个短语，其余按空白分词：'"光照电站" 发电量' -> ["光照电站", "发电量"]。"""
+    terms = [normalize(a or b) for a, b in re.findall(r'"([^"]+)"|(\S+)', query)]
+    return [t for t in terms if t]
+
+
+class ReportIndex:
+    """
+    打开 update_index 生成的全局倒排表（数组均 mmap，打开几乎不耗时），供反复查询。
+
+    search 返回按分数排序的命中页：{"file", "page"(1 起), "score", "span", "snippet"}。
+    """
+
+    def __init__(self, index_dir: Path):
+        merged = Path(index_dir) / "merged"
+        with (merged / "docs.json").open("r", encoding="utf-8") as f:
+            docs = json.load(f)
+        self.files = docs["files"]
+        self.segment_dirs = [Path(index_dir) / "segments" / d for d in docs["digests"]]
+        self.codes = np.load(merged / "codes.npy", mmap_mode="r")
+        self.offsets = np.load(merged / "offsets.npy", mmap_mode="r")
+        self.positions = np.load(merged / "positions.npy", mmap_mode="r")
+        self.page_starts = np.load(merged / "page_starts.npy")
+        self.page_doc = np.load(merged / "page_doc.npy")
+        self.doc_starts = np.load(merged / "doc_starts.npy")
+        self.doc_first_page = np.searchsorted(self.page_doc, np.arange(len(self.files)))
+        self._texts = {}
+
+    def text(self, doc: int) -> str:
+        if doc not in self._texts:
+            self._texts[doc] = (self.segment_dirs[doc] / "text.txt").read_text(encoding="utf-8")
+        return self._texts[doc]
+
+    def postings(self, code: int) -> np.ndarray:
+        i = np.searchsorted(self.codes, code)
+        if i == len(self.codes) or self.codes[i] != code:
+            return np.empty(0, dtype=np.int64)
+        return self.positions[self.offsets[i]:self.offsets[i + 1]]
+
+    def term_positions(self, term: str) -> np.ndarray:
+        """词（短语）的所有起始位置：各二元组的位置减去其在词中的偏移后求交。单字按二元组前缀匹配。"""
+        if len(term) == 1:
+            lo = np.searchsorted(self.codes, ord(term) * CODE_BASE)
+            hi = np.searchsorted(self.codes, (ord(term) + 1) * CODE_BASE)
+            return np.sort(self.positions[self.offsets[lo]:self.offsets[hi]])
+        lists = [self.postings(ord(term[i]) * CODE_BASE + ord(term[i + 1])) - i for i in range(len(term) - 1)]
+        lists.sort(key=len)
+        out = lists[0]
+        for other in lists[1:]:
+            if not len(out):
+                break
+            out = out[np.isin(out, other, assume_unique=True)]
+        return out
+
+    def page_of(self, pos: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.page_starts, pos, side="right") - 1
+
+    def search(self, query: str, limit: int = 10, window: int = DEFAULT_WINDOW) -> list:
+        """
+        单个词为短语查询；多个词为邻近查询：以出现最少的词为锚点，其余每个词取同一页内最近的
+        一次出现，最大距离（span）不超过 window 即为一次匹配。每次匹配计分 window / (window + span)，
+        按页累加后排序。
+        """
+        terms = parse_query(query)
+        if not terms:
+            return []
+        plists = [self.term_positions(t) for t in terms]
+        if any(len(p) == 0 for p in plists):
+            return []
+        a = int(np.argmin([len(p) for p in plists]))
+        anchor = plists[a]
+        anchor_page = self.page_of(anchor)
+        span = np.zeros(len(anchor), dtype=np.int64)
+        lo_pos, hi_pos = anchor.copy(), anchor + len(terms[a])
+        for j, plist in enumerate(plists):
+            if j == a:
+                continue
+            idx = np.searchsorted(plist, anchor)
+            best_d = np.full(len(anchor), np.iinfo(np.int64).max)
+            best_p = np.zeros(len(anchor), dtype=np.int64)
+            for cand_idx in (idx - 1, idx):
+                ok = (cand_idx >= 0) & (cand_idx < len(plist))
+                cand = plist[np.clip(cand_idx, 0, len(plist) - 1)]
+                d = np.abs(cand - anchor)
+                better = ok & (self.page_of(cand) == anchor_page) & (d < best_d)
+                best_d = np.where(better, d, best_d)
+                best_p = np.where(better, cand, best_p)
+            span = np.maximum(span, best_d)
+            lo_pos = np.minimum(lo_pos, best_p)
+            hi_pos = np.maximum(hi_pos, best_p + len(terms[j]))
+
+        valid = span <= window
+        if not valid.any():
+            return []
+        span, lo_pos, hi_pos = span[valid], lo_pos[valid], hi_pos[valid]
+        pages, inverse = np.unique(anchor_page[valid], return_inverse=True)
+        scores = np.bincount(inverse, weights=window / (window + span))
+        # 每页取 span 最小的一次匹配做摘要
+        order = np.lexsort((span, inverse))
+        best = order[np.searchsorted(inverse[order], np.arange(len(pages)))]
+        ranked = np.lexsort((pages, -scores))[:limit]
+
+        out = []
+        for k in ranked:
+            page = int(pages[k])
+            doc = int(self.page_doc[page])
+            base = int(self.doc_starts[doc])
+            text = self.text(doc)
+            page_start = int(self.page_starts[page]) - base
+            last = page + 1 == len(self.page_starts) or self.page_doc[page + 1] != doc
+            page_end = len(text) if last else int(self.page_starts[page + 1]) - base - 1
+            lo, hi = int(lo_pos[best[k]]) - base, int(hi_pos[best[k]]) - base
+            out.append({
+                "file": self.files[doc],
+                "page": page - int(self.doc_first_page[doc]) + 1,
+                "score": round(float(scores[k]), 3),
+                "span": int(span[best[k]]),
+                "snippet": text[max(page_start, lo - SNIPPET_CONTEXT):min(page_end, hi + SNIPPET_CONTEXT)],
+            })
+        return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="年报全文倒排索引：建立/增量更新与查询")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_build = sub.add_parser("build", help="建立或增量更新索引")
+    p_build.add_argument("ticker_dir", nargs="?", default=str(DEFAULT_TICKER_DIR))
+    p_build.add_argument("--workers", type=int, default=None, help="抽取文本的进程数（默认 CPU 数）")
+    p_search = sub.add_parser("search", help="查询，例如 \"光照 发电量\"")
+    p_search.add_argument("query")
+    p_search.add_argument("--ticker-dir", default=str(DEFAULT_TICKER_DIR))
+    p_search.add_argument("--limit", type=int, default=10)
+    p_search.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="邻近查询的最大字符距离")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        update_index(Path(args.ticker_dir), max_workers=args.workers)
+        return
+    index = ReportIndex(Path(args.ticker_dir) / INDEX_DIR_NAME)
+    start = time.perf_counter()
+    hits = index.search(args.query, args.limit, args.window)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    for hit in hits:
+        print(f"{hit['score']:7.3f}  {hit['file']} p.{hit['page']}  {hit['snippet']}")
+    logger.info(f"{len(hits)} hit(s) in {elapsed_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+import argparse
+import hashlib
+import json
+import logging
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from build_manifest import write_json_if_changed
+
+logging.basicConfig(format="%(asctime)s %(levelname)s %(funcName)s: %(message)s")
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+# 默认读取的年报目录（其他公司用 ingest(report_dir=...) 或 --report-dir 指定）
+DEFAULT_REPORT_DIR = REPO_ROOT / "info" / "qydl002039" / "qydl"
+# 按文件内容哈希缓存逐页文本：改名不失效，内容变化自动重抽
+CACHE_DIR = Path(__file__).parent / ".report_cache"
+OUT_FILE = Path(__file__).parent / "report_ingest.json"
+
+# 含这些词的页面才抽取表格（抽表比抽文本慢得多）
+TABLE_KEYWORDS = ("合并资产负债表", "合并利润表", "合并现金流量表", "发电量", "上网电价")
+
+# 报表 -> (起始标题, 结束标题, {data.json 字段: [报表项目名, ...]})
+STATEMENTS = {
+    "balance_sheet": ("合并资产负债表", "母公司资产负债表", {
+        "cash_and_cash_equivalents": ["货币资金"],
+        "total_liabilities": ["负债合计"],
+    }),
+    "income_statement": ("合并利润表", "母公司利润表", {
+        "operating_revenue": ["营业收入"],
+        "operating_cost": ["营业成本"],
+        "taxes_and_surcharges": ["税金及附加", "营业税金及附加"],
+        "administrative_expenses": ["管理费用"],
+        "financial_expenses": ["财务费用"],
+        "income_tax_expense": ["所得税费用"],
+        "net_profit": ["净利润"],
+        "net_profit_attributable_to_parent": ["归属于母公司股东的净利润", "归属于母公司所有者的净利润"],
+    }),
+    "cash_flow_statement": ("合并现金流量表", "母公司现金流量表", {
+        "cash_received_from_sales_and_services": ["销售商品、提供劳务收到的现金"],
+        "cash_inflow_operating_activities": ["经营活动现金流入小计"],
+        "cash_paid_for_goods_and_services": ["购买商品、接受劳务支付的现金"],
+        "cash_paid_to_and_for_employees": ["支付给职工以及为职工支付的现金"],
+        "cash_paid_for_taxes_and_fees": ["支付的各项税费"],
+        "total_cash_outflow_operating_activities": ["经营活动现金流出小计"],
+        "net_cash_flow_operating": ["经营活动产生的现金流量净额"],
+        "net_cash_flow_investing": ["投资活动产生的现金流量净额"],
+    }),
+}
+# 报表金额换算为 data.json 使用的“亿元”
+UNIT_TO_YI = {"元": 1e-8, "千元": 1e-5, "万元": 1e-4}
+
+# 年报中的电站中文名 -> data.json 中的电站名
+STATION_NAMES = {
+    "光照光伏": "guangzhao_pv",
+    "董箐光伏": "dongjing_pv",
+    "马马崖光伏": "mamaya_pv",
+    "镇宁坝草一期光伏": "zhenningbeicao_pv",
+    "光照": "guangzhao",
+    "董箐": "dongjing",
+    "马马崖": "mamaya",
+    "善泥坡": "shannipo",
+    "鱼塘": "yutang",
+    "清溪": "qingxi",
+    "牛都": "niudu",
+    "普定": "puding",
+    "引子渡": "yinzidu",
+}
+
+NUM = r"-?\d[\d,]*\.\d+"
+_NUM_LINE = re.compile(rf"^(?P<label>.*?)\s*(?P<nums>{NUM}(?:\s+{NUM})*)$")
+_UNIT = re.compile(r"单位：\s*(千元|万元|元)")
+_STATION = re.compile(
+    "(" + "|".join(sorted(STATION_NAMES, key=len, reverse=True)) + ")"
+    + r"(?:水电站|光伏分公司|光伏电站|分公司|电站|发电公司)\s*。?\s*(?:报告期内?)?\s*(?:完成)?发电量\s*("
+    + NUM + r"|\d[\d,]*)\s*(万|亿)千瓦时"
+)
+_COMPANY_GEN = re.compile(r"上网电量或售电量（亿千瓦时）\s*(" + NUM + ")")
+_COMPANY_PRICE = re.compile(r"平均上网电价或售电价（元/亿?千瓦时?[，,]?\s*(" + NUM + ")")
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def report_period(path: Path):
+    """由文件名推断期间：qydl_2023.PDF -> "2023"，三季度报告 -> "2025Q3"，无年份时返回 None。"""
+    m = re.search(r"(\d{4})", path.name)
+    if not m:
+        return None
+    return f"{m.group(1)}Q3" if "三季度" in path.name else m.group(1)
+
+
+_docs = {}
+
+
+def _extract_page(path: str, index: int) -> dict:
+    """在 worker 中抽取一页的文本（相关页面再抽表格）。每个 worker 对同一文件只打开一次。"""
+    import pdfplumber
+
+    if path not in _docs:
+        # 换文件时关闭上一份文档，常驻 worker 不累积打开的文件句柄
+        for doc in _docs.values():
+            doc.close()
+        _docs.clear()
+        _docs[path] = pdfplumber.open(path)
+    page = _docs[path].pages[index]
+    text = page.extract_text() or ""
+    tables = page.extract_tables() if any(k in text for k in TABLE_KEYWORDS) else []
+    page.close()
+    return {"text": text, "tables": tables}
+
+
+def _page_count(path: Path) -> int:
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_reports(paths, cache_dir: Path = CACHE_DIR, max_workers=None, digests: dict = None) -> dict:
+    """
+    抽取一组 PDF 的逐页文本与表格，返回 {path: (sha256, pages)}。
+
+    缓存命中的文件直接读取；其余文件的所有页面一起提交到进程池，每页一个任务。
+    digests 为调用方已算好的 {path: sha256}，其中有的文件不再重新哈希。
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    digests = {Path(p): d for p, d in (digests or {}).items()}
+    out, todo = {}, []
+    for path in map(Path, paths):
+        digest = digests.get(path) or file_hash(path)
+        cache_file = cache_dir / f"{digest}.json"
+        if cache_file.exists():
+            with cache_file.open("r", encoding="utf-8") as f:
+                out[path] = (digest, json.load(f)["pages"])
+            logger.info(f"{path.name}: cached ({len(out[path][1])} pages)")
+        else:
+            todo.append((path, digest))
+    if not todo:
+        return out
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for path, digest in todo:
+            n = _page_count(path)
+            futures[path] = (digest, [pool.submit(_extract_page, str(path), i) for i in range(n)])
+        for path, (digest, page_futures) in futures.items():
+            pages = [fut.result() for fut in page_futures]
+            with (cache_dir / f"{digest}.json").open("w", encoding="utf-8") as f:
+                json.dump({"file": path.name, "pages": pages}, f, ensure_ascii=False)
+            out[path] = (digest, pages)
+            logger.info(f"{path.name}: extracted {len(pages)} pages")
+    logger.info(f"Extracted {len(todo)} report(s) in {time.perf_counter() - start:.1f}s")
+    return out
+
+
+def _norm_label(label: str) -> str:
+    """去掉序号、“其中：/加：/减：”前缀与括号说明：“四、净利润（净亏损以…” -> “净利润”。"""
+    s = label.strip()
+    s = re.sub(r"^[（(]?[一二三四五六七八九十\d]+[)）、.]\s*", "", s)
+    s = re.sub(r"^(其中|加|减)[：:]", "", s)
+    return re.split(r"[（(]", s)[0].strip()
+
+
+def _label_matches(label: str, names) -> bool:
+    # 跨行的长项目名可能只剩前半截，至少 6 个字才按前缀匹配
+    return any(label == n or (len(label) >= 6 and n.startswith(label)) for n in names)
+
+
+def _statement_lines(pages, title: str, end_title: str):
+    """定位报表：返回 [(页码(1 起), 行文本), ...]，从标题行到结束标题行为止。"""
+    heading = re.compile(rf"^\s*(?:\d+\s*[、.])?\s*{title}\s*$")
+    ending = re.compile(rf"^\s*(?:\d+\s*[、.])?\s*{end_title}")
+    for i, page in enumerate(pages):
+        lines = page["text"].splitlines()
+        for j, line in enumerate(lines):
+            if not heading.match(line):
+                continue
+            out = []
+            for k in range(i, min(i + 6, len(pages))):
+                for line2 in (lines[j + 1:] if k == i else pages[k]["text"].splitlines()):
+                    if ending.match(line2):
+                        return out
+                    out.append((k + 1, line2))
+            return out
+    return []
+
+
+def parse_statement(pages, title: str, end_title: str, fields: dict) -> dict:
+    """从报表行中取各字段本期数（第一列），换算为亿元，返回 {field: {value, page, label}}。"""
+    lines = _statement_lines(pages, title, end_title)
+    scale = UNIT_TO_YI["元"]
+    found = {}
+    pending = ""
+    for page_no, line in lines:
+        unit = _UNIT.search(line)
+        if unit:
+            scale = UNIT_TO_YI[unit.group(1)]
+        m = _NUM_LINE.match(line.strip())
+        if not m:
+            # 没有数字的行可能是跨行项目名的前半部分
+            pending = line.strip()
+            continue
+        label = _norm_label(m.group("label") or pending)
+        pending = ""
+        for field, names in fields.items():
+            if field not in found and _label_matches(label, names):
+                value = float(m.group("nums").split()[0].replace(",", ""))
+                found[field] = {"value": round(value * scale, 2), "page": page_no, "label": label}
+    return found
+
+
+def parse_generation(pages) -> dict:
+    """公司上网电量/平均上网电价（首次出现的“本报告期”数）与各电站发电量（亿千瓦时）。"""
+    found, stations = {}, {}
+    for i, page in enumerate(pages):
+        flat = page["text"].replace("\n", "")
+        if "generation_output" not in found:
+            m = _COMPANY_GEN.search(flat)
+            if m:
+                found["generation_output"] = {"value": float(m.group(1)), "page": i + 1, "label": "上网电量或售电量"}
+        if "avg_on_grid_price" not in found:
+            m = _COMPANY_PRICE.search(flat)
+            if m:
+                found["avg_on_grid_price"] = {"value": float(m.group(1)), "page": i + 1, "label": "平均上网电价或售电价"}
+        for m in _STATION.finditer(flat):
+            station = STATION_NAMES[m.group(1)]
+            if station in stations:
+                continue
+            value = float(m.group(2).replace(",", ""))
+            if m.group(3) == "万":
+                value /= 1e4
+            stations[station] = {"value": round(value, 2), "page": i + 1, "label": m.group(0)[:40]}
+    return {"company": found, "stations": stations}
+
+
+def ingest_report(path: Path, digest: str, pages, station_paths: dict = None) -> dict:
+    """
+    汇总一份报告的抽取结果。
+
+    返回 {"file", "sha256", "period", "pages", "fields", "missing", "unmapped_stations", "data_json"}：
+    fields 为 字段 -> {value, page, label}；data_json 是可直接并入 data.json 对应年份的片段，
+    电站发电量按 station_paths 给出的 subsidiaries 路径写入。station_paths 中没有的电站只列在
+    unmapped_stations（电站 -> {value, page, label}），不写入 data_json。
+    """
+    fields, missing = {}, []
+    for statement, (title, end_title, wanted) in STATEMENTS.items():
+        got = parse_statement(pages, title, end_title, wanted)
+        fields.update(got)
+        missing += [f for f in wanted if f not in got]
+    gen = parse_generation(pages)
+    fields.update(gen["company"])
+
+    patch = {field: info["value"] for field, info in fields.items()}
+    station_paths = station_paths or {}
+    unmapped = {}
+    for station, info in gen["stations"].items():
+        fields[f"station.{station}.generation_output"] = info
+        if station not in station_paths:
+            unmapped[station] = info
+            continue
+        node = patch.setdefault("subsidiaries", {})
+        for key in station_paths[station]:
+            node = node.setdefault(key, {})
+        node["generation_output"] = info["value"]
+
+    return {
+        "file": Path(path).name,
+        "sha256": digest,
+        "period": report_period(Path(path)),
+        "pages": len(pages),
+        "fields": fields,
+        "missing": missing,
+        "unmapped_stations": unmapped,
+        "data_json": patch,
+    }
+
+
+def _station_paths(data_file: Path) -> dict:
+    """现有 data.json 中各电站在 subsidiaries 下的路径：station -> ("beipanjiang", "guangzhao")。"""
+    from qydl002039 import load_store, qydl_station_registry
+
+    if not Path(data_file).exists():
+        return {}
+    registry = qydl_station_registry(load_store(data_file))
+    return {name: tuple(path.split(".")[1:]) for name, path in zip(registry.names, registry.paths)}
+
+
+def ingest(paths=None, out_file: Path = OUT_FILE, cache_dir: Path = CACHE_DIR, max_workers=None,
+           data_file: Path = None, report_dir: Path = DEFAULT_REPORT_DIR) -> dict:
+    """
+    抽取并解析年报，结果按文件名写入 out_file（已有结果中内容哈希未变的报告直接沿用）。
+
+    paths 默认为 report_dir 下全部 PDF。每个文件只哈希一次，抽取时沿用。返回 {file_name: report}。
+    """
+    paths = sorted(map(Path, paths or [p for p in Path(report_dir).iterdir() if p.suffix.lower() == ".pdf"]))
+    out_file = Path(out_file)
+    previous = {}
+    if out_file.exists():
+        with out_file.open("r", encoding="utf-8") as f:
+            previous = json.load(f)
+
+    digests = {p: file_hash(p) for p in paths}
+    todo = [p for p in paths if previous.get(p.name, {}).get("sha256") != digests[p]]
+    logger.info(f"{len(paths)} report(s); {len(todo)} new or changed")
+    results = {name: rep for name, rep in previous.items() if name in {Path(p).name for p in paths}}
+    if todo:
+        station_paths = _station_paths(data_file or Path(__file__).parent / "data.json")
+        for path, (digest, pages) in extract_reports(todo, cache_dir, max_workers, digests).items():
+            report = ingest_report(path, digest, pages, station_paths)
+            results[path.name] = report
+            logger.info(f"{path.name}: {len(report['fields'])} fields, missing {report['missing']}")
+            if report["unmapped_stations"]:
+                logger.info(f"{path.name}: stations not in data.json: {sorted(report['unmapped_stations'])}")
+
+    results = dict(sorted(results.items()))
+    try:
+        if write_json_if_changed(out_file, results):
+            logger.info(f"Saved ingestion results to {out_file}")
+    except Exception:
+        logger.exception(f"Failed to write ingestion results to {out_file}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="从年报 PDF 抽取 data.json 字段（带页码）")
+    parser.add_argument("files", nargs="*", help="PDF 文件（默认 --report-dir 下全部）")
+    parser.add_argument("--report-dir", default=str(DEFAULT_REPORT_DIR), help="年报目录")
+    parser.add_argument("--workers", type=int, default=None, help="进程数（默认 CPU 数）")
+    parser.add_argument("--out", default=str(OUT_FILE), help="结果 JSON")
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR), help="逐页文本缓存目录")
+    args = parser.parse_args(argv)
+    ingest(args.files or None, args.out, args.cache_dir, args.workers, report_dir=Path(args.report_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from station_registry import StationRegistry
+
+# 持股比例低于该值（%）的一级子公司不并入理论营收
+CONSOLIDATION_THRESHOLD = 50.0
+
+
+@dataclass
+class TheoreticalRevenue:
+    """
+    电站 × 年份的理论营收（generation_output × on_grid_price，单位同 data.json：亿元）。
+
+    - subsidiaries: 一级子公司名（行顺序同 subsidiary_revenue）
+    - included: 电站 × 年份，该年计入比较的电站（发电量或电价字段至少有一个存在、所属子公司未因持股比例排除）
+    - covered: included 中发电量与电价都是有效数值的电站
+    - station_revenue: 电站 × 年份，未覆盖处为 0
+    - subsidiary_revenue: 子公司 × 年份；total: 各年合计
+    - expected: 各电站的预期营收权重（见 expected_revenue）
+    - coverage: 各年已覆盖电站的预期营收占计入电站预期营收的比例（无计入电站时为 NaN）
+    """
+
+    subsidiaries: list
+    included: np.ndarray
+    covered: np.ndarray
+    station_revenue: np.ndarray
+    subsidiary_revenue: np.ndarray
+    total: np.ndarray
+    expected: np.ndarray
+    coverage: np.ndarray
+
+
+def subsidiary_matrix(stations: StationRegistry, subsidiaries: list) -> np.ndarray:
+    """子公司 × 电站的 0/1 归属矩阵，按子公司汇总即一次矩阵乘法。"""
+    member = np.zeros((len(subsidiaries), len(stations)))
+    row = {sub: j for j, sub in enumerate(subsidiaries)}
+    for i, sub in enumerate(stations.subsidiaries):
+        if sub in row:
+            member[row[sub], i] = 1.0
+    return member
+
+
+def _fill_by_kind(values: np.ndarray, kinds: list) -> np.ndarray:
+    """NaN 用同类型（水电/光伏）电站的均值代替，同类型都缺失时用全部电站的均值。"""
+    values = values.copy()
+    known = ~np.isnan(values)
+    overall = values[known].mean() if known.any() else np.nan
+    kinds = np.asarray(kinds)
+    for kind in set(kinds.tolist()):
+        same = kinds == kind
+        pool = values[same & known]
+        values[same & ~known] = pool.mean() if len(pool) else overall
+    return values
+
+
+def expected_revenue(stations: StationRegistry) -> np.ndarray:
+    """
+    各电站的预期营收（覆盖率的权重）= 多年平均发电量 × 最新有效电价。
+
+    从未有过有效发电量或电价的电站用同类型电站的均值代替，因此缺失数据的电站仍计入覆盖率分母。
+    """
+    counts = stations.generation_mask.sum(axis=1)
+    total = np.where(stations.generation_mask, stations.generation, 0.0).sum(axis=1)
+    generation = np.where(counts > 0, total / np.maximum(counts, 1), np.nan)
+
+    has = stations.price_mask.any(axis=1)
+    last = stations.price_mask.shape[1] - 1 - np.argmax(stations.price_mask[:, ::-1], axis=1)
+    price = np.where(has, stations.price[np.arange(len(stations)), last], np.nan)
+
+    expected = _fill_by_kind(generation, stations.kinds) * _fill_by_kind(price, stations.kinds)
+    return np.nan_to_num(expected)
+
+
+def theoretical_revenue(stations: StationRegistry, subsidiaries: list, excluded: np.ndarray) -> TheoreticalRevenue:
+    """
+    一次掩码相乘与归约算出所有电站、子公司、年份的理论营收。
+
+    excluded: 子公司 × 年份，True 表示该年该子公司不并入（例如持股比例低于 CONSOLIDATION_THRESHOLD）。
+    缺失或 "NA" 的电价/发电量只让该电站不计入覆盖部分，不再丢弃整年；该电站仍按预期营收计入
+    覆盖率分母，使 coverage 低于 1。
+    """
+    member = subsidiary_matrix(stations, subsidiaries)
+    station_excluded = (member.T @ excluded.astype(float)) > 0
+    included = (stations.generation_present | stations.price_present) & ~station_excluded
+    covered = included & stations.generation_mask & stations.price_mask
+
+    station_revenue = np.where(covered, np.nan_to_num(stations.generation) * np.nan_to_num(stations.price), 0.0)
+    subsidiary_revenue = member @ station_revenue
+    total = subsidiary_revenue.sum(axis=0)
+
+    expected = expected_revenue(stations)
+    weight = np.where(included, expected[:, None], 0.0)
+    known = weight.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        coverage = np.where(known > 0, (weight * covered).sum(axis=0) / known, np.nan)
+    return TheoreticalRevenue(
+        subsidiaries=list(subsidiaries),
+        included=included,
+        covered=covered,
+        station_revenue=station_revenue,
+        subsidiary_revenue=subsidiary_revenue,
+        total=total,
+        expected=expected,
+        coverage=coverage,
+    )
@@ -0,0 +1,122 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+@dataclass
+class SensitivityGrid:
+    """
+    估值敏感性网格：market_value[i, j, k] 对应 rates[i]、exclude_sets[j]、ratios[k]。
+
+    - adj_recognized_value / adj_std: 每个排除集合对应的认定值均值与总体标准差（3 位小数）
+    - market_value / std_market_value / per_share_value: (R, S, P) float64，无法计算处为 NaN
+    """
+
+    rates: np.ndarray
+    exclude_sets: list
+    ratios: np.ndarray
+    adj_recognized_value: np.ndarray
+    adj_std: np.ndarray
+    market_value: np.ndarray
+    std_market_value: np.ndarray
+    per_share_value: np.ndarray = None
+    meta: dict = field(default_factory=dict)
+
+    @property
+    def shape(self):
+        return self.market_value.shape
+
+    def to_rows(self) -> list:
+        """展开为表格行（每格一行），NaN 记为 None。"""
+        rows = []
+        for idx in np.ndindex(self.shape):
+            i, j, k = idx
+            mv = self.market_value[idx]
+            smv = self.std_market_value[idx]
+            ps = self.per_share_value[idx] if self.per_share_value is not None else np.nan
+            rows.append({
+                "expected_rate": float(self.rates[i]),
+                "exclude_years": list(self.exclude_sets[j]),
+                "ratio": float(self.ratios[k]),
+                "market_value": float(mv) if np.isfinite(mv) else None,
+                "std_market_value": float(smv) if np.isfinite(smv) else None,
+                "per_share_value": float(ps) if np.isfinite(ps) else None,
+            })
+        return rows
+
+
+def exclusion_stats(years, values, mask, exclude_sets):
+    """
+    一次算出每个排除集合下认定值的均值与总体标准差（未取整）。
+
+    用 (S, Y) 的保留矩阵做矩阵乘法，而不是逐个集合调用 qydl_recognized_value_stats。
+    某集合排除后无有效年份时为 NaN。
+    """
+    years = np.asarray(years)
+    excluded = np.array([np.isin(years, list(s)) for s in exclude_sets], dtype=bool).reshape(len(exclude_sets), len(years))
+    keep = (mask[None, :] & ~excluded).astype(float)
+    v = np.where(mask, values, 0.0)
+    n = keep.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (keep @ v) / n
+        var = (keep @ (v * v)) / n - mean * mean
+    return mean, np.sqrt(np.maximum(var, 0.0))
+
+
+def evaluate_grid(rates, adj, adj_std, ratios, curr_net=None, shares=None):
+    """
+    广播计算 (R, S, P) 网格，与 qydl_market_value_details 的取整方式一致：
+    market_value = round((adj / rate - curr_net) * ratio, 3)，
+    std_market_value = round(未取整的市值 * adj_std / adj, 3)，per_share = market_value / shares。
+    """
+    rates = np.asarray(rates, dtype=float)[:, None, None]
+    adj = np.asarray(adj, dtype=float)[None, :, None]
+    adj_std = np.asarray(adj_std, dtype=float)[None, :, None]
+    ratios = np.asarray(ratios, dtype=float)[None, None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        base = np.where(rates != 0, adj / rates, np.nan)
+        if curr_net is not None:
+            base = base - curr_net
+        raw = base * ratios
+        mv = np.round(raw, 3)
+        smv = np.round(raw * np.where(adj != 0, adj_std / adj, np.nan), 3)
+    per_share = mv / shares if shares not in (0, None) else None
+    return mv, smv, per_share
+
+
+def subset_exclusion_stats(values, max_excluded: int):
+    """
+    枚举所有不超过 max_excluded 个元素的排除子集（位掩码），一次算出每个子集排除后的
+    均值与总体标准差。
+
+    全体的 Σv、Σv² 只算一次；子集表按位逐步扩展：第 i 步把“已选元素少于 max_excluded
+    的子集”加上第 i 位，新子集的 Σv、Σv² 由父子集累加 v[i] 得到，剩余部分的统计量即
+    (全体 - 子集)。子集总数为 Σ C(n, c)（c ≤ max_excluded），不会展开全部 2^n 个子集。
+
+    返回 (bitmasks, counts, mean, std)：bitmasks 第 i 位表示排除 values[i]；
+    排除后无剩余元素时 mean/std 为 NaN。
+    """
+    v = np.asarray(values, dtype=float)
+    n = len(v)
+    if n > 62:
+        raise ValueError(f"too many elements for int64 bitmasks: {n}")
+    total = float(v.sum())
+    total_sq = float((v * v).sum())
+
+    masks = np.zeros(1, dtype=np.int64)
+    counts = np.zeros(1, dtype=np.int64)
+    sums = np.zeros(1)
+    sums_sq = np.zeros(1)
+    for i in range(n):
+        grow = counts < max_excluded
+        masks = np.concatenate([masks, masks[grow] | (1 << i)])
+        counts = np.concatenate([counts, counts[grow] + 1])
+        sums = np.concatenate([sums, sums[grow] + v[i]])
+        sums_sq = np.concatenate([sums_sq, sums_sq[grow] + v[i] * v[i]])
+
+    remaining = n - counts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (total - sums) / remaining
+        var = (total_sq - sums_sq) / remaining - mean * mean
+    order = np.lexsort((masks, counts))
+    return masks[order], counts[order], mean[order], np.sqrt(np.maximum(var, 0.0))[order]
@@ -0,0 +1,186 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class Stage:
+    """流水线中的一个阶段。
+
+    - name: 阶段名（唯一）
+    - func: 模块级函数（进程池需要可 pickle），按 inputs 顺序接收参数
+    - inputs: 依赖的上下文键
+    - outputs: 产出的上下文键；一个输出时 func 直接返回该值，多个输出时返回同长度 tuple
+    - deps: 该阶段读取的 data.json 字段（指标路径或节点前缀），用于增量构建
+    - artifacts: 该阶段写出的固定文件名（相对输出目录）
+    """
+
+    name: str
+    func: Callable
+    inputs: tuple = field(default_factory=tuple)
+    outputs: tuple = field(default_factory=tuple)
+    deps: tuple = field(default_factory=tuple)
+    artifacts: tuple = field(default_factory=tuple)
+
+
+def _run_timed(func, args, name=None):
+    """在 worker 中执行阶段函数，返回 (结果, 墙钟耗时秒)。开启追踪时记为名为 name 的 span。"""
+    start = time.perf_counter()
+    with span(name or getattr(func, "__name__", "stage")):
+        result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def validate_stages(stages, context_keys=()):
+    """检查阶段图：名字与输出唯一、输入可满足、无环。出错时抛出 ValueError。
+
+    返回按拓扑顺序排列的阶段列表。"""
+    names = set()
+    producers = {}
+    for st in stages:
+        if st.name in names:
+            raise ValueError(f"duplicate stage name: {st.name}")
+        names.add(st.name)
+        for out in st.outputs:
+            if out in producers or out in context_keys:
+                raise ValueError(f"output {out!r} of stage {st.name} is produced more than once")
+            producers[out] = st.name
+
+    available = set(context_keys)
+    pending = list(stages)
+    order = []
+    while pending:
+        ready = [st for st in pending if all(i in available for i in st.inputs)]
+        if not ready:
+            missing = {i for st in pending for i in st.inputs if i not in available and i not in producers}
+            if missing:
+                raise ValueError(f"unsatisfied stage inputs: {sorted(missing)}")
+            raise ValueError(f"cycle between stages: {[st.name for st in pending]}")
+        for st in ready:
+            available.update(st.outputs)
+            pending.remove(st)
+            order.append(st)
+    return order
+
+
+def prune_fresh(stages, is_fresh, context_keys=()) -> set:
+    """
+    返回可以跳过的阶段名集合：is_fresh(stage) 为真，且其输出不被任何需要运行的阶段使用。
+    """
+    skip = set()
+    needed = set()
+    for st in reversed(validate_stages(stages, context_keys)):
+        if is_fresh(st) and not any(out in needed for out in st.outputs):
+            skip.add(st.name)
+        else:
+            needed.update(st.inputs)
+    return skip
+
+
+def run_stages(stages, context: dict, executor: str = "process", max_workers=None, skip=()):
+    """
+    按依赖关系运行阶段，每个阶段每次运行最多执行一次，互不依赖的阶段并发执行。
+
+    - stages: Stage 列表
+    - context: 初始上下文（例如 {"store": store, "out_dir": out_dir}），不会被修改
+    - executor: "process"（本函数的缺省值）、"thread"（阶段需线程安全）或 "serial"；
+      qydl_generation_output_analysis 默认传 "thread"，阶段在本进程内共享 store 与其派生缓存
+    - max_workers: 池大小，默认由 concurrent.futures 决定
+    - skip: 本次不运行的阶段名（例如 prune_fresh 判定为最新的阶段），其输出不会出现在 context 中
+
+    阶段抛出异常时记录日志并跳过所有依赖它的阶段，与原先逐个 try/except 的行为一致。
+    开启追踪（tracing.start_tracing）时每个阶段记为一个 span；"process" 执行器下
+    span 留在子进程中，不会出现在本进程的 trace 里。
+    返回 (context, timings)：context 含全部阶段输出，timings 为 阶段名 -> 墙钟耗时秒。
+    """
+
+    validate_stages(stages, tuple(context))
+    ctx = dict(context)
+    timings = {}
+    for st in stages:
+        if st.name in skip:
+            logger.info(f"Stage {st.name} is up to date; skipped")
+    pending = [st for st in stages if st.name not in skip]
+    failed = set()
+
+    def ready(st):
+        return all(i in ctx for i in st.inputs)
+
+    def blocked(st):
+        return any(i in failed for i in st.inputs)
+
+    def finish(st, result, elapsed):
+        timings[st.name] = elapsed
+        logger.info(f"Stage {st.name} finished in {elapsed:.3f}s")
+        if len(st.outputs) == 1:
+            ctx[st.outputs[0]] = result
+        elif st.outputs:
+            ctx.update(zip(st.outputs, result))
+
+    def fail(st):
+        logger.exception(f"Stage {st.name} failed")
+        failed.update(st.outputs)
+
+    def skip_blocked():
+        for st in [st for st in pending if blocked(st)]:
+            logger.info(f"Stage {st.name} skipped: an upstream stage failed")
+            failed.update(st.outputs)
+            pending.remove(st)
+
+    if executor == "serial":
+        while pending:
+            skip_blocked()
+            batch = [st for st in pending if ready(st)]
+            if not batch:
+                break
+            for st in batch:
+                pending.remove(st)
+                try:
+                    result, elapsed = _run_timed(st.func, [ctx[i] for i in st.inputs], st.name)
+                except Exception:
+                    fail(st)
+                    continue
+                finish(st, result, elapsed)
+        for st in pending:
+            logger.info(f"Stage {st.name} skipped: inputs unavailable")
+        return ctx, timings
+
+    if executor == "process":
+        # 进程池（连带 multiprocessing）只在用到时导入
+        from concurrent.futures import ProcessPoolExecutor
+
+        pool = ProcessPoolExecutor(max_workers=max_workers)
+    elif executor == "thread":
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+    else:
+        raise ValueError(f"unknown executor: {executor}")
+
+    with pool:
+        running = {}
+        while pending or running:
+            skip_blocked()
+            for st in [st for st in pending if ready(st)]:
+                pending.remove(st)
+                running[pool.submit(_run_timed, st.func, [ctx[i] for i in st.inputs], st.name)] = st
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                st = running.pop(fut)
+                try:
+                    result, elapsed = fut.result()
+                except Exception:
+                    fail(st)
+                    continue
+                finish(st, result, elapsed)
+
+    for st in pending:
+        logger.info(f"Stage {st.name} skipped: inputs unavailable")
+    return ctx, timings
@@ -0,0 +1,118 @@
+from collections import Counter
+from dataclasses import dataclass, field
+
+import numpy as np
+
+SUBSIDIARIES = "subsidiaries"
+GENERATION = "generation_output"
+PRICE = "on_grid_price"
+CAPACITY = "installed_capacity_mw"
+SHARE = "shareholding_ratio"
+
+
+@dataclass
+class StationRegistry:
+    """
+    由 data.json 推导出的电站索引：`subsidiaries` 下每个含 generation_output 的节点是一个电站。
+
+    - names / paths / subsidiaries / kinds: 每个电站的名字、节点路径、所属一级子公司、"hydro" 或 "pv"
+    - years: 与 YearStore 相同的年份索引
+    - generation / price / capacity / shareholding: 电站 × 年份的 float64 矩阵，缺失为 NaN
+      （shareholding 取所属一级子公司的 shareholding_ratio）
+    - *_mask: 对应矩阵的有效值掩码
+    - generation_present / price_present: 该年该电站节点下是否存在此字段（包括 "NA"）
+    """
+
+    years: np.ndarray
+    names: list = field(default_factory=list)
+    paths: list = field(default_factory=list)
+    subsidiaries: list = field(default_factory=list)
+    kinds: list = field(default_factory=list)
+    generation: np.ndarray = None
+    generation_mask: np.ndarray = None
+    generation_present: np.ndarray = None
+    price: np.ndarray = None
+    price_mask: np.ndarray = None
+    price_present: np.ndarray = None
+    capacity: np.ndarray = None
+    capacity_mask: np.ndarray = None
+    shareholding: np.ndarray = None
+    shareholding_mask: np.ndarray = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def index(self, name: str) -> int:
+        """电站名 -> 行号。"""
+        return self.names.index(name)
+
+    def by_subsidiary(self) -> dict:
+        """一级子公司 -> 其下电站行号列表（按登记顺序）。"""
+        out = {}
+        for i, sub in enumerate(self.subsidiaries):
+            out.setdefault(sub, []).append(i)
+        return out
+
+
+def station_kind(path: str) -> str:
+    """按节点路径判断电站类型：路径中任一段含 "pv" 词即为光伏，否则为水电。"""
+    for part in path.split(".")[1:]:
+        if "pv" in part.split("_"):
+            return "pv"
+    return "hydro"
+
+
+def _ancestors(path: str):
+    parts = path.split(".")
+    return [".".join(parts[:k]) for k in range(1, len(parts))]
+
+
+def build_station_registry(store) -> StationRegistry:
+    """一次遍历 store 中 subsidiaries 下的字段，登记所有电站（电站节点之下不再继续查找）。"""
+
+    head = SUBSIDIARIES + "."
+    suffix = "." + GENERATION
+    nodes = [
+        name[: -len(suffix)]
+        for name in store.columns
+        if name.startswith(head) and name.endswith(suffix)
+    ]
+    node_set = set(nodes)
+    nodes = [n for n in nodes if not any(a in node_set for a in _ancestors(n))]
+
+    # 电站名默认取节点最后一段；重名时用子公司前缀区分
+    last = [n.rsplit(".", 1)[-1] for n in nodes]
+    counts = Counter(last)
+    names = [
+        short if counts[short] == 1 else n[len(head):].replace(".", "_")
+        for n, short in zip(nodes, last)
+    ]
+    subsidiaries = [n[len(head):].split(".", 1)[0] for n in nodes]
+
+    n_years = len(store.years)
+
+    def rows(arrays, dtype=float):
+        return np.vstack(arrays).astype(dtype) if arrays else np.empty((0, n_years), dtype=dtype)
+
+    gen_f = [f"{n}.{GENERATION}" for n in nodes]
+    price_f = [f"{n}.{PRICE}" for n in nodes]
+    cap_f = [f"{n}.{CAPACITY}" for n in nodes]
+    share_f = [f"{head}{sub}.{SHARE}" for sub in subsidiaries]
+
+    return StationRegistry(
+        years=store.years,
+        names=names,
+        paths=nodes,
+        subsidiaries=subsidiaries,
+        kinds=[station_kind(n) for n in nodes],
+        generation=rows([store.col(f) for f in gen_f]),
+        generation_mask=rows([store.mask(f) for f in gen_f], bool),
+        generation_present=rows([store.is_present(f) for f in gen_f], bool),
+        price=rows([store.col(f) for f in price_f]),
+        price_mask=rows([store.mask(f) for f in price_f], bool),
+        price_present=rows([store.is_present(f) for f in price_f], bool),
+        capacity=rows([store.col(f) for f in cap_f]),
+        capacity_mask=rows([store.mask(f) for f in cap_f], bool),
+        shareholding=rows([store.col(f) for f in share_f]),
+        shareholding_mask=rows([store.mask(f) for f in share_f], bool),
+    )
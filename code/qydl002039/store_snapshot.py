@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from station_registry import StationRegistry
+from tracing import span
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 解析/规范化方式变化时递增，使旧快照全部失效
+SNAPSHOT_VERSION = 1
+HEADER_NAME = "header.json"
+# StationRegistry 中按电站 × 年份存放的矩阵
+STATION_ARRAYS = (
+    "generation", "generation_mask", "generation_present",
+    "price", "price_mask", "price_present",
+    "capacity", "capacity_mask",
+    "shareholding", "shareholding_mask",
+)
+STATION_LISTS = ("names", "paths", "subsidiaries", "kinds")
+
+
+def snapshot_dir(source: Path) -> Path:
+    """data.json 的快照目录：同目录下的 .data.json.snapshot/。"""
+    source = Path(source)
+    return source.with_name(f".{source.name}.snapshot")
+
+
+def source_digest(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _stat_key(st: os.stat_result) -> dict:
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def write_snapshot(source: Path, st: os.stat_result, digest: str, store, registry: StationRegistry) -> Path:
+    """
+    把解析后的 store 与电站索引写成快照（每个数组一个 .npy，可 mmap 打开）：
+
+    - years.npy; values.npy / masks.npy / present.npy: 指标 × 年份矩阵，行顺序同 header["columns"]
+    - station_<attr>.npy: StationRegistry 的电站 × 年份矩阵
+    - header.json: 版本、源文件的 size / mtime_ns / sha256、指标名、meta 与电站名等
+
+    先写到临时目录再整体改名，并发的读取者看不到写了一半的快照。
+    """
+    target = snapshot_dir(source)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    names = list(store.columns)
+    n = len(store.years)
+    np.save(tmp / "years.npy", store.years)
+    np.save(tmp / "values.npy", np.vstack([store.columns[c] for c in names]) if names else np.empty((0, n)))
+    np.save(tmp / "masks.npy", np.vstack([store.masks[c] for c in names]) if names else np.empty((0, n), dtype=bool))
+    np.save(tmp / "present.npy", np.vstack([store.present[c] for c in names]) if names else np.empty((0, n), dtype=bool))
+    for attr in STATION_ARRAYS:
+        np.save(tmp / f"station_{attr}.npy", getattr(registry, attr))
+
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "source": {**_stat_key(st), "sha256": digest},
+        "columns": names,
+        "meta": store.meta,
+        "stations": {attr: getattr(registry, attr) for attr in STATION_LISTS},
+    }
+    with (tmp / HEADER_NAME).open("w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False)
+
+    old = target.with_name(f"{target.name}.{os.getpid()}.old")
+    if target.exists():
+        target.rename(old)
+    tmp.rename(target)
+    shutil.rmtree(old, ignore_errors=True)
+    return target
+
+
+def read_snapshot(source: Path):
+    """
+    读取与源文件一致的快照，返回 (header, arrays)；没有快照或源文件已变化时返回 None。
+
+    源文件 size 与 mtime 都与快照记录相同时直接使用（不读源文件）；否则按内容哈希确认，
+    内容未变（例如只是 touch 过）时更新快照记录的 mtime 后继续使用。数组以只读 mmap 打开。
+    """
+    source = Path(source)
+    target = snapshot_dir(source)
+    header_file = target / HEADER_NAME
+    try:
+        with header_file.open("r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("version") != SNAPSHOT_VERSION:
+            return None
+        st = source.stat()
+        if _stat_key(st) != {k: header["source"][k] for k in ("size", "mtime_ns")}:
+            if source_digest(source.read_bytes()) != header["source"]["sha256"]:
+                return None
+            header["source"].update(_stat_key(st))
+            tmp = header_file.with_name(f"{HEADER_NAME}.{os.getpid()}.tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(header, f, ensure_ascii=False)
+            tmp.replace(header_file)
+        with span("load snapshot", "io"):
+            arrays = {
+                name: np.load(target / f"{name}.npy", mmap_mode="r")
+                for name in ("years", "values", "masks", "present", *(f"station_{a}" for a in STATION_ARRAYS))
+            }
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.exception(f"Failed to read snapshot {target}; rebuilding from {source.name}")
+        return None
+    return header, arrays
+
+
+def registry_from_snapshot(header: dict, arrays: dict, years: np.ndarray) -> StationRegistry:
+    """由快照中的电站数组重建 StationRegistry（矩阵为只读 mmap 视图）。"""
+    return StationRegistry(
+        years=years,
+        **{attr: list(header["stations"][attr]) for attr in STATION_LISTS},
+        **{attr: arrays[f"station_{attr}"] for attr in STATION_ARRAYS},
+    )
@@ -0,0 +1,205 @@
+import math
+from collections import deque
+from dataclasses import dataclass, field
+
+# 默认的滚动窗口：最近 5 期、最近 10 期、全部历史（None）
+DEFAULT_WINDOWS = (5, 10, None)
+
+
+def window_key(window) -> str:
+    return "all" if window is None else str(window)
+
+
+def is_quarter(period: str) -> bool:
+    """期标签是否为季度（如 "2025Q1"）；其余视为年度。"""
+    return "Q" in period.upper()
+
+
+@dataclass
+class RunningStats:
+    """
+    单个窗口上的流式统计：Welford 法维护均值/方差，单调队列维护最大/最小值，每次 push 为 O(1)（均摊）。
+
+    - window: 最近多少期（按期数计，缺失值也占一期）；None 表示全部历史
+    - 缺失值（None/NaN）只推进窗口，不参与统计
+    """
+
+    window: int = None
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    seq: int = 0
+    items: deque = field(default_factory=deque)
+    max_q: deque = field(default_factory=deque)
+    min_q: deque = field(default_factory=deque)
+    all_max: float = None
+    all_min: float = None
+
+    def _add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def _remove(self, x: float):
+        if self.count == 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        delta = x - self.mean
+        self.mean -= delta / (self.count - 1)
+        self.m2 -= delta * (x - self.mean)
+        self.count -= 1
+        self.m2 = max(self.m2, 0.0)
+
+    def push(self, value):
+        """追加一期数值。"""
+        i = self.seq
+        self.seq += 1
+        x = float(value) if isinstance(value, (int, float)) and not math.isnan(value) else None
+
+        if self.window is None:
+            if x is not None:
+                self._add(x)
+                self.all_max = x if self.all_max is None else max(self.all_max, x)
+                self.all_min = x if self.all_min is None else min(self.all_min, x)
+            return
+
+        self.items.append((i, x))
+        if x is not None:
+            self._add(x)
+            while self.max_q and self.max_q[-1][1] <= x:
+                self.max_q.pop()
+            self.max_q.append((i, x))
+            while self.min_q and self.min_q[-1][1] >= x:
+                self.min_q.pop()
+            self.min_q.append((i, x))
+
+        # 移出窗口外的最早一期
+        start = self.seq - self.window
+        while self.items and self.items[0][0] < start:
+            _, old = self.items.popleft()
+            if old is not None:
+                self._remove(old)
+        while self.max_q and self.max_q[0][0] < start:
+            self.max_q.popleft()
+        while self.min_q and self.min_q[0][0] < start:
+            self.min_q.popleft()
+
+    @property
+    def max(self):
+        if self.window is None:
+            return self.all_max
+        return self.max_q[0][1] if self.max_q else None
+
+    @property
+    def min(self):
+        if self.window is None:
+            return self.all_min
+        return self.min_q[0][1] if self.min_q else None
+
+    @property
+    def std(self):
+        """总体标准差；无数值时为 None。"""
+        return math.sqrt(self.m2 / self.count) if self.count else None
+
+    def summary(self, ndigits=3) -> dict:
+        return {
+            "count": self.count,
+            "mean": round(self.mean, ndigits) if self.count else None,
+            "std": round(self.std, ndigits) if self.count else None,
+            "max": self.max,
+            "min": self.min,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "window": self.window,
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "seq": self.seq,
+            "items": [list(t) for t in self.items],
+            "max_q": [list(t) for t in self.max_q],
+            "min_q": [list(t) for t in self.min_q],
+            "all_max": self.all_max,
+            "all_min": self.all_min,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "RunningStats":
+        return cls(
+            window=d.get("window"),
+            count=d["count"],
+            mean=d["mean"],
+            m2=d["m2"],
+            seq=d["seq"],
+            items=deque(tuple(t) for t in d.get("items", [])),
+            max_q=deque(tuple(t) for t in d.get("max_q", [])),
+            min_q=deque(tuple(t) for t in d.get("min_q", [])),
+            all_max=d.get("all_max"),
+            all_min=d.get("all_min"),
+        )
+
+
+@dataclass
+class StationStats:
+    """
+    一个电站的流式统计：多个窗口共用同一串按期追加的数据。
+
+    periods 记录已折入的期标签（年份 "2024" 或季度 "2025Q1" 等），同一标签不会重复折入。
+    年度数据进入 windows，季度数据进入与之同样大小的 quarterly 窗口，两种粒度不混在一起；
+    quarterly 在第一次折入季度数据时创建。
+    """
+
+    windows: dict = field(default_factory=dict)
+    periods: list = field(default_factory=list)
+    quarterly: dict = field(default_factory=dict)
+    # periods 的集合视图，判断重复为 O(1)
+    _seen: set = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._seen = set(self.periods)
+
+    @classmethod
+    def create(cls, windows=DEFAULT_WINDOWS) -> "StationStats":
+        return cls(windows={window_key(w): RunningStats(window=w) for w in windows})
+
+    def push(self, period, value) -> bool:
+        """折入一期；period 已存在时忽略并返回 False。"""
+        period = str(period)
+        if period in self._seen:
+            return False
+        self._seen.add(period)
+        self.periods.append(period)
+        if is_quarter(period):
+            if not self.quarterly:
+                self.quarterly = {k: RunningStats(window=rs.window) for k, rs in self.windows.items()}
+            target = self.quarterly
+        else:
+            target = self.windows
+        for rs in target.values():
+            rs.push(value)
+        return True
+
+    def summary(self, ndigits=3) -> dict:
+        out = {
+            "last_period": self.periods[-1] if self.periods else None,
+            "windows": {k: rs.summary(ndigits) for k, rs in self.windows.items()},
+        }
+        if self.quarterly:
+            out["quarterly"] = {k: rs.summary(ndigits) for k, rs in self.quarterly.items()}
+        return out
+
+    def to_dict(self) -> dict:
+        out = {"periods": list(self.periods), "windows": {k: rs.to_dict() for k, rs in self.windows.items()}}
+        if self.quarterly:
+            out["quarterly"] = {k: rs.to_dict() for k, rs in self.quarterly.items()}
+        return out
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "StationStats":
+        return cls(
+            windows={k: RunningStats.from_dict(v) for k, v in d.get("windows", {}).items()},
+            periods=list(d.get("periods", [])),
+            quarterly={k: RunningStats.from_dict(v) for k, v in d.get("quarterly", {}).items()},
+        )
@@ -0,0 +1,32 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from qydl002039 import as_year_store, qydl_curr_position, qydl_dcf_model
+
+DATA = json.loads((Path(__file__).parent / "data.json").read_text(encoding="utf-8"))
+
+
+def _valuation(**assumptions):
+    store = as_year_store(DATA)
+    _, _, curr_net, shares = qydl_curr_position(store)
+    return qydl_dcf_model(store, **assumptions).valuation(curr_net, shares), curr_net
+
+
+def test_wholly_owned_equity_is_npv_minus_net_debt():
+    names = qydl_dcf_model(as_year_store(DATA)).stations.names
+    result, curr_net = _valuation(share_overrides={name: 100.0 for name in names})
+    assert result["minority_interest"] == pytest.approx(0.0)
+    assert result["equity_value"] == pytest.approx(result["npv"] - curr_net)
+
+
+def test_net_debt_is_taken_from_consolidated_npv():
+    result, curr_net = _valuation()
+    consolidated_equity = result["consolidated_npv"] - curr_net
+    assert 0 < result["minority_interest"] < consolidated_equity
+    assert result["equity_value"] == pytest.approx(
+        consolidated_equity - result["minority_interest"] + result["associates_npv"]
+    )
+    # 少数股东承担其份额的净负债，归属股权价值高于 归属 NPV − 全部合并净负债
+    assert result["equity_value"] > result["npv"] - curr_net
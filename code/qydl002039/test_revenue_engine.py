@@ -0,0 +1,47 @@
+import copy
+import json
+from pathlib import Path
+
+import numpy as np
+
+from qydl002039 import as_year_store, qydl_revenue_comparison, qydl_station_registry
+from revenue_engine import theoretical_revenue
+
+DATA = json.loads((Path(__file__).parent / "data.json").read_text(encoding="utf-8"))
+
+
+def _comparison(data):
+    return qydl_revenue_comparison(as_year_store(data))
+
+
+def test_full_data_is_fully_covered():
+    result = _comparison(DATA)["2024"]
+    assert result["coverage"] == 1.0
+    assert result["missing_stations"] == []
+
+
+def test_missing_generation_lowers_coverage():
+    data = copy.deepcopy(DATA)
+    data["2024"]["subsidiaries"]["beipanjiang"]["guangzhao"]["generation_output"] = "NA"
+    full = _comparison(DATA)["2024"]
+    result = _comparison(data)["2024"]
+
+    assert result["coverage"] < 1.0
+    assert result["missing_stations"] == ["guangzhao"]
+    # 按覆盖率外推的营收比只算已覆盖电站更接近完整数据下的理论营收
+    gap = abs(result["estimated_operating_revenue"] - full["theoretical_operating_revenue"])
+    assert gap < full["theoretical_operating_revenue"] - result["theoretical_operating_revenue"]
+
+
+def test_station_without_price_key_counts_as_missing():
+    data = copy.deepcopy(DATA)
+    del data["2024"]["subsidiaries"]["puding"]["on_grid_price"]
+    store = as_year_store(data)
+    stations = qydl_station_registry(store)
+    subs = store.children("subsidiaries")
+    rev = theoretical_revenue(stations, subs, np.zeros((len(subs), len(store.years)), dtype=bool))
+
+    i, y = stations.index("puding"), list(store.years).index(2024)
+    assert rev.included[i, y] and not rev.covered[i, y]
+    assert rev.expected[i] > 0
+    assert rev.coverage[y] < 1.0
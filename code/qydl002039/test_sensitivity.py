@@ -0,0 +1,55 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from qydl002039 import as_year_store, qydl_exclude_years_search, qydl_get_adj_recognized_value, qydl_recognized_value
+from sensitivity import subset_exclusion_stats
+
+DATA = json.loads((Path(__file__).parent / "data.json").read_text(encoding="utf-8"))
+
+
+def _rounded(x):
+    # 两条路径都保留 3 位小数，浮点误差最多让末位相差 1
+    return None if x is None else pytest.approx(x, abs=1.1e-3)
+
+
+def test_subset_stats_match_direct_computation():
+    values = np.array([3.0, -1.5, 8.25, 4.0, 0.5])
+    masks, counts, mean, std = subset_exclusion_stats(values, max_excluded=len(values))
+    assert len(masks) == 2 ** len(values)
+    for m, c, mu, sd in zip(masks, counts, mean, std):
+        keep = np.array([not (int(m) >> i) & 1 for i in range(len(values))])
+        assert c == len(values) - keep.sum()
+        if keep.any():
+            assert mu == pytest.approx(values[keep].mean())
+            assert sd == pytest.approx(values[keep].std(), abs=1e-12)
+        else:
+            assert np.isnan(mu) and np.isnan(sd)
+
+
+def test_search_matches_per_subset_recomputation():
+    store = as_year_store(DATA)
+    report = qydl_exclude_years_search(store, max_excluded=2)
+    for subset in report["subsets"]:
+        mean, std = qydl_get_adj_recognized_value(store, exclude_years=tuple(subset["exclude_years"]))
+        assert (subset["mean"], subset["std"]) == (_rounded(mean), _rounded(std))
+
+    current = report["current"]
+    assert current["exclude_years"] == [2020, 2021]
+    assert (current["mean"], current["std"]) == tuple(
+        _rounded(x) for x in qydl_get_adj_recognized_value(store, exclude_years=(2020, 2021))
+    )
+
+
+def test_excluding_every_year_gives_no_value():
+    store = as_year_store(DATA)
+    years, _, mask = qydl_recognized_value(store)
+    n = int(mask.sum())
+    report = qydl_exclude_years_search(store, max_excluded=n + 1)
+    assert len(report["subsets"]) == 2 ** n
+    everything = report["subsets"][-1]
+    assert everything["exclude_years"] == [int(y) for y in years[mask]]
+    assert everything["mean"] is None and everything["std"] is None
+    assert qydl_get_adj_recognized_value(store, exclude_years=tuple(everything["exclude_years"])) == (None, None)
@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from qydl002039 import (
+    as_year_store,
+    qydl_get_adj_recognized_value,
+    qydl_market_value_details,
+    qydl_sensitivity_grid,
+)
+
+DATA = json.loads((Path(__file__).parent / "data.json").read_text(encoding="utf-8"))
+RATES = [0.05, 0.07, 0.093]
+EXCLUDE_SETS = [(), (2020, 2021), (2017,), (2016, 2019, 2022)]
+
+
+@pytest.mark.parametrize("exclude_sets", [EXCLUDE_SETS, [()]])
+def test_grid_cells_match_market_value_details(exclude_sets):
+    store = as_year_store(DATA)
+    grid = qydl_sensitivity_grid(store, RATES, exclude_sets=exclude_sets)
+    assert grid.shape == (len(RATES), len(exclude_sets), 1)
+
+    for j, exclude in enumerate(exclude_sets):
+        adj, adj_std = qydl_get_adj_recognized_value(store, exclude_years=exclude)
+        assert (grid.adj_recognized_value[j], grid.adj_std[j]) == (adj, adj_std)
+        for i, rate in enumerate(RATES):
+            details = qydl_market_value_details(store, adj, adj_std, expected_rate=rate)
+            assert grid.market_value[i, j, 0] == pytest.approx(details["market_value"], abs=1e-9)
+            assert grid.std_market_value[i, j, 0] == pytest.approx(details["std_market_value"], abs=1e-9)
+            assert grid.per_share_value[i, j, 0] == pytest.approx(details["expected_stock_value"], abs=1e-6)
+
+
+def test_rate_zero_cell_is_nan():
+    grid = qydl_sensitivity_grid(as_year_store(DATA), [0.0, 0.07])
+    assert np.isnan(grid.market_value[0]).all()
+    assert np.isfinite(grid.market_value[1]).all()
@@ -0,0 +1,53 @@
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from qydl002039 import load_store
+from store_snapshot import read_snapshot, snapshot_dir
+
+DATA_FILE = Path(__file__).parent / "data.json"
+
+
+def _copy(tmp_path) -> Path:
+    path = tmp_path / "data.json"
+    shutil.copyfile(DATA_FILE, path)
+    return path
+
+
+def _bump_mtime(path: Path, st: os.stat_result):
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_same_size_edit_invalidates_snapshot(tmp_path):
+    path = _copy(tmp_path)
+    first = load_store(path)
+    assert first.meta["expected_rate"] == 0.07 and first.columns["net_profit"][0] == 6.33
+    assert read_snapshot(path) is not None
+
+    st = path.stat()
+    raw = path.read_bytes()
+    edited = raw.replace(b'"expected_rate": 0.07', b'"expected_rate": 0.09', 1)
+    edited = edited.replace(b'"net_profit": 6.33', b'"net_profit": 7.44', 1)
+    assert edited != raw and len(edited) == len(raw)
+    path.write_bytes(edited)
+    _bump_mtime(path, st)
+
+    store = load_store(path)
+    assert store.meta["expected_rate"] == 0.09
+    assert store.columns["net_profit"][0] == 7.44
+    # 快照已按新内容重建
+    header, _ = read_snapshot(path)
+    assert header["meta"]["expected_rate"] == 0.09
+
+
+def test_touched_file_keeps_snapshot(tmp_path):
+    path = _copy(tmp_path)
+    first = load_store(path)
+    _bump_mtime(path, path.stat())
+
+    store = load_store(path)
+    assert isinstance(store.columns["net_profit"], np.memmap)
+    np.testing.assert_array_equal(store.columns["net_profit"], first.columns["net_profit"])
+    assert snapshot_dir(path).exists()
@@ -0,0 +1,56 @@
+import json
+
+import numpy as np
+import pytest
+
+from streaming_stats import RunningStats, StationStats
+
+SERIES = [3.0, 7.5, float("nan"), 1.0, 9.0, 9.0, None, 4.0, 2.5, float("nan"), float("nan"), 6.0,
+          0.5, 8.0, 5.0, None, 7.0, 3.5]
+
+
+def _expected(values, window):
+    tail = np.array([np.nan if v is None else v for v in (values if window is None else values[-window:])])
+    tail = tail[~np.isnan(tail)]
+    if tail.size == 0:
+        return {"count": 0, "mean": None, "std": None, "max": None, "min": None}
+    return {"count": tail.size, "mean": tail.mean(), "std": tail.std(), "max": tail.max(), "min": tail.min()}
+
+
+def _assert_matches(rs: RunningStats, values):
+    expected = _expected(values, rs.window)
+    assert rs.count == expected["count"]
+    assert rs.max == expected["max"]
+    assert rs.min == expected["min"]
+    if expected["count"]:
+        assert rs.mean == pytest.approx(expected["mean"])
+        assert rs.std == pytest.approx(expected["std"], abs=1e-12)
+
+
+@pytest.mark.parametrize("window", [5, 10, None])
+def test_window_matches_numpy_after_every_push(window):
+    rs = RunningStats(window=window)
+    for n, value in enumerate(SERIES, 1):
+        rs.push(value)
+        _assert_matches(rs, SERIES[:n])
+
+
+def test_window_of_only_missing_values_is_empty():
+    rs = RunningStats(window=2)
+    for value in (4.0, float("nan"), None):
+        rs.push(value)
+    assert rs.count == 0 and rs.max is None and rs.min is None and rs.std is None
+
+
+def test_round_trip_then_push_matches_uninterrupted():
+    stream = StationStats.create()
+    for year, value in enumerate(SERIES[:-1], 2000):
+        stream.push(year, value)
+    restored = StationStats.from_dict(json.loads(json.dumps(stream.to_dict())))
+    assert not restored.push(2000, 99.0)
+
+    stream.push(2000 + len(SERIES) - 1, SERIES[-1])
+    restored.push(2000 + len(SERIES) - 1, SERIES[-1])
+    assert restored.summary() == stream.summary()
+    for rs in restored.windows.values():
+        _assert_matches(rs, SERIES)
@@ -0,0 +1,193 @@
+import io
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TRACE_NAME = "qydl_trace.json"
+SUMMARY_NAME = "qydl_trace_summary.json"
+# 不改脚本即可开启：QYDL_TRACE=1 开启追踪，QYDL_PROFILE_STAGE=<阶段名> 对该阶段做 cProfile/tracemalloc
+TRACE_ENV = "QYDL_TRACE"
+PROFILE_ENV = "QYDL_PROFILE_STAGE"
+
+_tracer = None
+
+
+class Tracer:
+    """
+    一次运行的追踪记录：每个 span 记为 Chrome trace 的 "X"（complete）事件。
+
+    事件参数包括 cpu_ms（线程 CPU 时间）、bytes_written（span 内本线程写盘字节数，见 span）、
+    rss_peak_delta_kb（进程峰值 RSS 的增长）。
+    """
+
+    def __init__(self, profile_stage: str = None):
+        self.profile_stage = profile_stage
+        self.t0 = time.time()
+        self.events = []
+        self.profiles = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def stack(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def add_event(self, name, cat, start, dur, pid=None, tid=None, args=None):
+        """记录一个已完成的事件；start 为 time.time() 时间戳（秒），便于合并其他进程的事件。"""
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": round((start - self.t0) * 1e6, 1),
+            "dur": round(dur * 1e6, 1),
+            "pid": os.getpid() if pid is None else pid,
+            "tid": threading.get_ident() if tid is None else tid,
+            "args": args or {},
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self) -> dict:
+        """按 span 名汇总：次数、总墙钟时间、总 CPU 时间、写盘字节数。"""
+        by_name = {}
+        for ev in self.events:
+            s = by_name.setdefault(ev["name"], {"cat": ev["cat"], "count": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "bytes_written": 0})
+            s["count"] += 1
+            s["wall_ms"] += ev["dur"] / 1000
+            s["cpu_ms"] += ev["args"].get("cpu_ms", 0.0)
+            s["bytes_written"] += ev["args"].get("bytes_written", 0)
+        for s in by_name.values():
+            s["wall_ms"] = round(s["wall_ms"], 3)
+            s["cpu_ms"] = round(s["cpu_ms"], 3)
+        end = max((ev["ts"] + ev["dur"] for ev in self.events), default=0.0)
+        return {
+            "wall_ms": round(end / 1000, 3),
+            "spans": dict(sorted(by_name.items(), key=lambda kv: -kv[1]["wall_ms"])),
+            "profiles": self.profiles,
+        }
+
+
+def start_tracing(profile_stage: str = None) -> Tracer:
+    """开启本进程的追踪（之前的记录被丢弃）。"""
+    global _tracer
+    _tracer = Tracer(profile_stage)
+    return _tracer
+
+
+def start_tracing_from_env():
+    """QYDL_TRACE 或 QYDL_PROFILE_STAGE 已设置时开启追踪，返回 Tracer 或 None。"""
+    if os.environ.get(TRACE_ENV) or os.environ.get(PROFILE_ENV):
+        return start_tracing(os.environ.get(PROFILE_ENV) or None)
+    return None
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def stop_tracing(out_dir: Path) -> dict:
+    """结束追踪，把 Chrome trace 与汇总写到 out_dir，返回汇总；未开启时返回 None。"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return None
+    out_dir = Path(out_dir)
+    summary = tracer.summary()
+    trace = {"traceEvents": tracer.events, "displayTimeUnit": "ms"}
+    # output_writer 依赖本模块，在这里才导入
+    from output_writer import atomic_write_bytes
+
+    try:
+        atomic_write_bytes(out_dir / TRACE_NAME, json.dumps(trace, ensure_ascii=False).encode("utf-8"))
+        atomic_write_bytes(out_dir / SUMMARY_NAME, json.dumps(summary, ensure_ascii=False, indent=2).encode("utf-8"))
+        logger.info(f"Saved trace ({len(tracer.events)} spans) to {out_dir / TRACE_NAME}")
+    except Exception:
+        logger.exception(f"Failed to write trace to {out_dir}")
+    return summary
+
+
+def add_bytes(n: int):
+    """把写盘字节数计入当前线程所有打开的 span。"""
+    if _tracer is None:
+        return
+    for frame in _tracer.stack():
+        frame["bytes"] += n
+
+
+def add_event(name, cat, start, dur, pid=None, tid=None, args=None):
+    """记录在其他进程中完成的事件（例如渲染进程池中的图表）。"""
+    if _tracer is not None:
+        _tracer.add_event(name, cat, start, dur, pid, tid, args)
+
+
+def _profile_top(prof: "cProfile.Profile", snapshot, limit=25) -> dict:
+    import pstats
+
+    buf = io.StringIO()
+    pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(limit)
+    allocs = [
+        {"where": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+    return {"cprofile_cumulative": buf.getvalue(), "top_allocations": allocs}
+
+
+@contextmanager
+def span(name: str, cat: str = "stage", **args):
+    """
+    计时一段代码。未开启追踪时几乎无开销。
+
+    name 等于 profile_stage 时同时开启 cProfile（仅当前线程）与 tracemalloc，
+    结果记入汇总的 profiles[name]。
+
+    bytes_written 只统计本线程在 span 内实际写盘的字节。默认的 async_writes 下 JSON 由后台
+    writer 线程写出，字节计入该线程的 "write <文件名>"（cat="io"）span，提交写入的阶段
+    span 记为 0；要按阶段统计写盘量时用 --sync-writes。
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+
+    profiling = tracer.profile_stage == name
+    prof = None
+    if profiling:
+        # 剖析工具只在确实剖析某个阶段时导入
+        import cProfile
+        import tracemalloc
+
+        prof = cProfile.Profile()
+        tracemalloc.start()
+        prof.enable()
+
+    frame = {"bytes": 0}
+    stack = tracer.stack()
+    stack.append(frame)
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start, cpu0 = time.time(), time.thread_time()
+    try:
+        yield
+    finally:
+        dur, cpu = time.time() - start, time.thread_time() - cpu0
+        rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        stack.pop()
+        if prof is not None:
+            prof.disable()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            tracer.profiles[name] = _profile_top(prof, snapshot)
+        tracer.add_event(name, cat, start, dur, args={
+            **args,
+            "cpu_ms": round(cpu * 1000, 3),
+            "bytes_written": frame["bytes"],
+            "rss_peak_delta_kb": rss1 - rss0,
+        })
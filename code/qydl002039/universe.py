@@ -0,0 +1,283 @@
+import argparse
+import json
+import logging
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+from build_manifest import write_json_if_changed
+
+logging.basicConfig(format="%(asctime)s %(levelname)s %(funcName)s: %(message)s")
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MANIFEST_NAME = "manifest.json"
+UNIVERSE_VERSION = 1
+SUBSIDIARIES = "subsidiaries"
+
+
+def _split(path: str):
+    """
+    指标路径 -> (表, 字段, 节点)：
+
+    - 公司级字段（不在 subsidiaries 下）-> ("company", path, None)
+    - subsidiaries 下的字段 -> ("node", 最后一段, 节点路径)，例如
+      "subsidiaries.beipanjiang.guangzhao.generation_output" -> ("node", "generation_output", "subsidiaries.beipanjiang.guangzhao")
+    """
+    if path.startswith(SUBSIDIARIES + "."):
+        node, name = path.rsplit(".", 1)
+        return "node", name, node
+    return "company", path, None
+
+
+def _year_index(all_years: list, years) -> dict:
+    """公司年份在全局年份轴上的位置：连续时记为 [start, stop)（可切片得到视图），否则为下标列表。"""
+    idx = [all_years.index(int(y)) for y in years]
+    if idx and idx == list(range(idx[0], idx[0] + len(idx))):
+        return {"start": idx[0], "stop": idx[-1] + 1}
+    return {"index": idx}
+
+
+def _open(path: Path, shape, dtype, fill):
+    arr = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+    arr[...] = fill
+    return arr
+
+
+def import_companies(data_files: dict, root: Path) -> dict:
+    """
+    把多家公司的 data.json 导入为列式数据集 root（{ticker: data.json 路径}），返回清单。
+
+    布局：
+    - company/<指标>.{values,mask,present}.npy: 公司 × 年份（全局年份轴）
+    - node/<字段>.{values,mask,present}.npy: 节点 × 年份；节点是 subsidiaries 下的电站或子公司，
+      各公司的节点占连续若干行
+    - manifest.json: 全局年份、指标与字段名；每个 ticker 的行号、年份位置、节点行区间、
+      原始字段顺序（columns，用于还原 YearStore 与 data.json）与 meta
+
+    分两遍处理：第一遍只收集年份、指标与节点，第二遍逐家公司写入预先分配好的 memmap，
+    任何时刻内存中只有一家公司的数据。
+    """
+    from qydl002039 import load_store
+
+    root = Path(root)
+    tmp = root.with_name(root.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    (tmp / "company").mkdir(parents=True)
+    (tmp / "node").mkdir()
+
+    start = time.perf_counter()
+    tickers = {}
+    years, metrics, fields = set(), {}, {}
+    n_nodes = 0
+    for row, (ticker, path) in enumerate(sorted(data_files.items())):
+        store = load_store(Path(path))
+        nodes = {}
+        for name in store.columns:
+            table, field, node = _split(name)
+            if table == "company":
+                metrics.setdefault(field, None)
+            else:
+                fields.setdefault(field, None)
+                nodes.setdefault(node, None)
+        years.update(store.years.tolist())
+        tickers[ticker] = {
+            "row": row,
+            "source": str(path),
+            "years": store.years.tolist(),
+            "node_start": n_nodes,
+            "nodes": list(nodes),
+            "columns": list(store.columns),
+            "meta": store.meta,
+        }
+        n_nodes += len(nodes)
+
+    all_years = sorted(years)
+    n_comp, n_years = len(tickers), len(all_years)
+
+    def group(kind, names, rows):
+        out = {}
+        for name in names:
+            base = tmp / kind / name
+            out[name] = (
+                _open(base.with_name(name + ".values.npy"), (rows, n_years), np.float64, np.nan),
+                _open(base.with_name(name + ".mask.npy"), (rows, n_years), bool, False),
+                _open(base.with_name(name + ".present.npy"), (rows, n_years), bool, False),
+            )
+        return out
+
+    company = group("company", metrics, n_comp)
+    node = group("node", fields, n_nodes)
+    for ticker, info in tickers.items():
+        store = load_store(Path(info["source"]))
+        cols = np.searchsorted(all_years, store.years)
+        node_row = {p: info["node_start"] + i for i, p in enumerate(info["nodes"])}
+        for name in store.columns:
+            table, field, node_path = _split(name)
+            values, mask, present = company[field] if table == "company" else node[field]
+            r = info["row"] if table == "company" else node_row[node_path]
+            values[r, cols] = store.columns[name]
+            mask[r, cols] = store.masks[name]
+            present[r, cols] = store.is_present(name)
+        info["year_index"] = _year_index(all_years, store.years)
+    for arrays in (*company.values(), *node.values()):
+        for a in arrays:
+            a.flush()
+    del company, node
+
+    manifest = {
+        "version": UNIVERSE_VERSION,
+        "years": all_years,
+        "company_metrics": list(metrics),
+        "node_fields": list(fields),
+        "n_nodes": n_nodes,
+        "tickers": tickers,
+    }
+    write_json_if_changed(tmp / MANIFEST_NAME, manifest)
+    shutil.rmtree(root, ignore_errors=True)
+    tmp.rename(root)
+    logger.info(f"Imported {n_comp} companies x {n_years} years ({n_nodes} nodes) into {root} "
+                f"in {time.perf_counter() - start:.2f}s")
+    return manifest
+
+
+class Universe:
+    """
+    只读打开 import_companies 生成的数据集。数组按需以 mmap 打开，跨公司筛选只读到用到的列。
+
+    - metric(name) / node_field(name): (values, mask, present)，形状为 公司 × 年份 / 节点 × 年份
+    - screen(metric, year): 各公司某年某指标（与 tickers 顺序一致，缺失为 NaN）
+    - store(ticker): 该公司的 YearStore，各列是 mmap 数组的切片视图（年份连续时不复制）
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        with (self.root / MANIFEST_NAME).open("r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != UNIVERSE_VERSION:
+            raise ValueError(f"Unsupported universe version in {self.root}: {self.manifest.get('version')}")
+        self.tickers = sorted(self.manifest["tickers"], key=lambda t: self.manifest["tickers"][t]["row"])
+        self.years = np.array(self.manifest["years"], dtype=np.int64)
+        self._arrays = {}
+
+    def _group(self, kind: str, name: str):
+        key = (kind, name)
+        if key not in self._arrays:
+            base = self.root / kind
+            self._arrays[key] = tuple(
+                np.load(base / f"{name}.{part}.npy", mmap_mode="r") for part in ("values", "mask", "present")
+            )
+        return self._arrays[key]
+
+    def metric(self, name: str):
+        if name not in self.manifest["company_metrics"]:
+            raise KeyError(f"Unknown company metric: {name}")
+        return self._group("company", name)
+
+    def node_field(self, name: str):
+        if name not in self.manifest["node_fields"]:
+            raise KeyError(f"Unknown node field: {name}")
+        return self._group("node", name)
+
+    def screen(self, metric: str, year: int) -> np.ndarray:
+        values, mask, _ = self.metric(metric)
+        j = int(np.searchsorted(self.years, year))
+        if j == len(self.years) or self.years[j] != year:
+            return np.full(len(self.tickers), np.nan)
+        return np.where(mask[:, j], values[:, j], np.nan)
+
+    def _year_slice(self, ticker: str):
+        yi = self.manifest["tickers"][ticker]["year_index"]
+        return slice(yi["start"], yi["stop"]) if "start" in yi else np.array(yi["index"], dtype=np.int64)
+
+    def store(self, ticker: str):
+        """按原始字段顺序组装 YearStore（电站索引由 store 按需推导，与读 data.json 的结果相同）。"""
+        from qydl002039 import YearStore
+
+        info = self.manifest["tickers"][ticker]
+        ys = self._year_slice(ticker)
+        node_row = {p: info["node_start"] + i for i, p in enumerate(info["nodes"])}
+        columns, masks, present = {}, {}, {}
+        for name in info["columns"]:
+            table, field, node_path = _split(name)
+            values, mask, pres = self._group(table, field)
+            r = info["row"] if table == "company" else node_row[node_path]
+            columns[name], masks[name], present[name] = values[r, ys], mask[r, ys], pres[r, ys]
+        return YearStore(years=self.years[ys], columns=columns, masks=masks, present=present, meta=info["meta"])
+
+    def to_data_json(self, ticker: str) -> dict:
+        """还原该公司的 data.json（数值统一为 float，"NA" 按 present/mask 还原，meta 放在年份之后）。"""
+        info = self.manifest["tickers"][ticker]
+        store = self.store(ticker)
+        by_year = {}
+        for i, year in enumerate(store.years.tolist()):
+            entry = {}
+            for name in info["columns"]:
+                if not store.present[name][i]:
+                    continue
+                node = entry
+                *parents, leaf = name.split(".")
+                for p in parents:
+                    node = node.setdefault(p, {})
+                node[leaf] = float(store.columns[name][i]) if store.masks[name][i] else "NA"
+            by_year[str(year)] = entry
+        return {**by_year, **info["meta"]}
+
+
+def export_data_json(root: Path, ticker: str, path: Path):
+    """把数据集中一家公司导出为 data.json。"""
+    data = Universe(root).to_data_json(ticker)
+    with Path(path).open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    logger.info(f"Exported {ticker} to {path}")
+
+
+def main(argv=None):
+    from batch_runner import DEFAULT_ROOT, discover_companies
+
+    parser = argparse.ArgumentParser(description="多公司列式数据集：导入/导出 data.json 与跨公司筛选")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_imp = sub.add_parser("import", help="把 <root>/<ticker>/data.json 导入数据集")
+    p_imp.add_argument("universe")
+    p_imp.add_argument("root", nargs="?", default=str(DEFAULT_ROOT))
+    p_exp = sub.add_parser("export", help="把一家公司导出为 data.json")
+    p_exp.add_argument("universe")
+    p_exp.add_argument("ticker")
+    p_exp.add_argument("out")
+    p_scr = sub.add_parser("screen", help="各公司某年某指标")
+    p_scr.add_argument("universe")
+    p_scr.add_argument("metric")
+    p_scr.add_argument("year", type=int)
+    p_trd = sub.add_parser("trends", help="全部公司成本项趋势拟合（一次批量求解），写出 JSON")
+    p_trd.add_argument("universe")
+    p_trd.add_argument("out")
+    p_trd.add_argument("--horizon", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        companies = discover_companies(Path(args.root))
+        import_companies({d.name: d / "data.json" for d in companies}, Path(args.universe))
+    elif args.command == "export":
+        export_data_json(Path(args.universe), args.ticker, Path(args.out))
+    elif args.command == "trends":
+        from cost_trends import fit_universe
+
+        start = time.perf_counter()
+        fits = fit_universe(Universe(Path(args.universe)), horizon=args.horizon)
+        logger.info(f"Fitted {len(fits.labels)} cost series in {(time.perf_counter() - start) * 1000:.1f} ms")
+        by_ticker = {}
+        for (ticker, metric), row in fits.to_rows().items():
+            by_ticker.setdefault(ticker, {})[metric] = row
+        report = {"years": fits.years.tolist(), "future_years": fits.future_years.tolist(), "tickers": by_ticker}
+        if write_json_if_changed(Path(args.out), report):
+            logger.info(f"Saved cost trends to {args.out}")
+    else:
+        u = Universe(Path(args.universe))
+        for ticker, v in zip(u.tickers, u.screen(args.metric, args.year).tolist()):
+            print(f"{ticker}\t{v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import argparse
+import json
+import logging
+import math
+import os
+import signal
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+logging.basicConfig(format="%(asctime)s %(levelname)s %(funcName)s: %(message)s")
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# 同一份数据上缓存的不同查询结果上限（超过后清空重来）
+RESPONSE_CACHE_SIZE = 1024
+
+
+class QueryError(ValueError):
+    """查询参数无效（返回 400）。"""
+
+
+class UnknownRoute(Exception):
+    """没有这个查询路径（返回 404）。"""
+
+
+def _jsonable(obj):
+    """NaN/inf 转为 None，numpy 标量转为 Python 数值，保证响应是合法 JSON。"""
+    if isinstance(obj, dict):
+        return {str(k): _jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_jsonable(v) for v in obj]
+    if hasattr(obj, "item") and not isinstance(obj, (str, bytes)):
+        obj = obj.item()
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    return obj
+
+
+def _float(params: dict, name: str, default=None):
+    if name not in params:
+        return default
+    try:
+        value = float(params[name])
+    except ValueError:
+        raise QueryError(f"{name} must be a number: {params[name]!r}")
+    if not math.isfinite(value):
+        raise QueryError(f"{name} must be finite")
+    return value
+
+
+def _years(params: dict, name: str, default=()):
+    """逗号分隔的年份列表，例如 exclude=2020,2021；exclude= 表示不排除。"""
+    if name not in params:
+        return tuple(default)
+    try:
+        return tuple(sorted(int(y) for y in params[name].split(",") if y.strip()))
+    except ValueError:
+        raise QueryError(f"{name} must be comma-separated years: {params[name]!r}")
+
+
+class ValuationState:
+    """
+    常驻内存的数据与结果：data.json 只在内容变化（mtime/size）时重新读取，
+    同一份数据上的查询结果按 (路径, 参数) 缓存为序列化好的响应字节；
+    与参数无关的中间结果（电站统计、营收对比、现金流折现模型）存于 store.derived，重新加载时随 store 一起丢弃。
+    """
+
+    def __init__(self, data_file: Path):
+        self.data_file = Path(data_file)
+        self.store = None
+        self.signature = None
+        self.loaded_at = None
+        self.reloads = 0
+        self._responses = {}
+        self._lock = threading.RLock()
+        self.refresh()
+
+    def _stat(self):
+        st = os.stat(self.data_file)
+        return st.st_mtime_ns, st.st_size
+
+    def refresh(self, force: bool = False) -> bool:
+        """data.json 变化（或 force）时重新加载并清空结果缓存，返回是否重新加载。"""
+        from qydl002039 import load_store
+
+        signature = self._stat()
+        if not force and signature == self.signature:
+            return False
+        with self._lock:
+            if not force and signature == self.signature:
+                return False
+            start = time.perf_counter()
+            store = load_store(self.data_file)
+            self.store, self.signature = store, signature
+            self._responses = {}
+            self.loaded_at = time.time()
+            self.reloads += 1
+            logger.info(f"Loaded {self.data_file} in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return True
+
+    def answer(self, path: str, params: dict) -> bytes:
+        """返回查询结果的 JSON 字节（命中缓存时不重新计算）。"""
+        self.refresh()
+        key = (path, tuple(sorted(params.items())))
+        store = self.store
+        cached = self._responses.get(key)
+        if cached is not None and cached[0] is store:
+            return cached[1]
+        handler = ROUTES.get(path)
+        if handler is None:
+            raise UnknownRoute(path)
+        # 计算串行进行：各查询共用 store 上缓存的中间结果（例如现金流折现模型）
+        with self._lock:
+            result = handler(store, params)
+            body = json.dumps(_jsonable(result), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            if self.store is store:
+                if len(self._responses) >= RESPONSE_CACHE_SIZE:
+                    self._responses = {}
+                self._responses[key] = (store, body)
+        return body
+
+
+def query_valuation(store, params: dict) -> dict:
+    """
+    /valuation?rate=0.055&exclude=2020,2022：认可产生价值口径的市值与每股价值，以及同一折现率下的
+    现金流折现估值。rate 默认取 expected_rate，exclude 默认同 qydl_get_adj_recognized_value。
+    """
+    from qydl002039 import qydl_dcf_valuation, qydl_get_adj_recognized_value, qydl_market_value_details
+
+    rate = _float(params, "rate")
+    if rate == 0:
+        raise QueryError("rate must be non-zero")
+    exclude = _years(params, "exclude", (2020, 2021))
+    adj, adj_std = qydl_get_adj_recognized_value(store, exclude_years=exclude)
+    details = qydl_market_value_details(store, adj, adj_std, expected_rate=rate)
+    dcf = qydl_dcf_valuation(store, rate=rate)
+    return {
+        "exclude_years": list(exclude),
+        "market_value": details,
+        "dcf": {key: dcf[key] for key in ("rate", "horizon", "npv", "equity_value", "per_share_value")},
+    }
+
+
+def query_dcf(store, params: dict) -> dict:
+    """/dcf?rate=&horizon=&price_growth=&exclude=：现金流折现估值明细（含各电站 NPV）。"""
+    from qydl002039 import qydl_dcf_valuation
+
+    assumptions = {}
+    if "rate" in params:
+        assumptions["rate"] = _float(params, "rate")
+    if "horizon" in params:
+        horizon = _float(params, "horizon")
+        if horizon < 1 or horizon != int(horizon):
+            raise QueryError("horizon must be a positive integer")
+        assumptions["horizon"] = int(horizon)
+    if "price_growth" in params:
+        assumptions["price_growth"] = _float(params, "price_growth")
+    if "exclude" in params:
+        assumptions["exclude_years"] = _years(params, "exclude")
+    return qydl_dcf_valuation(store, **assumptions)
+
+
+def query_stations(store, params: dict) -> dict:
+    """/stations[?station=puding]：各电站发电量统计（同 generation_output_stats.json）。"""
+    from qydl002039 import qydl_extract_generation_output, qydl_station_stats
+
+    if "station_stats" not in store.derived:
+        store.derived["station_stats"] = qydl_station_stats(qydl_extract_generation_output(store))
+    computed = store.derived["station_stats"]
+    if computed is None:
+        return {"years": [], "stations": {}}
+    years, stats, _ = computed
+    if "station" in params:
+        name = params["station"]
+        if name not in stats:
+            raise QueryError(f"Unknown station: {name}")
+        stats = {name: stats[name]}
+    return {"years": years, "stations": stats}
+
+
+def query_reconciliation(store, params: dict) -> dict:
+    """/reconciliation[?year=2024]：理论营收与实际营收对比（同 operating_revenue_theory_comparison.json）。"""
+    from qydl002039 import qydl_revenue_comparison
+
+    if "revenue_comparison" not in store.derived:
+        store.derived["revenue_comparison"] = qydl_revenue_comparison(store)
+    results = store.derived["revenue_comparison"]
+    if "year" in params:
+        year = params["year"]
+        if year not in results:
+            raise QueryError(f"No reconciliation for year {year}")
+        results = {year: results[year]}
+    return results
+
+
+def query_health(store, params: dict) -> dict:
+    return {"years": store.years.tolist(), "meta": store.meta}
+
+
+ROUTES = {
+    "/valuation": query_valuation,
+    "/dcf": query_dcf,
+    "/stations": query_stations,
+    "/reconciliation": query_reconciliation,
+    "/health": query_health,
+}
+
+
+class ValuationHandler(BaseHTTPRequestHandler):
+    """GET <route>?<参数> 返回 JSON；POST /reload 强制重新加载 data.json。"""
+
+    protocol_version = "HTTP/1.1"
+    # 响应头与正文先写入缓冲、一次发出，避免小包遇上 Nagle + 延迟确认多等约 40 ms
+    wbufsize = 1 << 16
+
+    def _send(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str):
+        self._send(status, json.dumps({"error": message}, ensure_ascii=False).encode("utf-8"))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        try:
+            body = self.server.state.answer(url.path.rstrip("/") or "/", params)
+        except UnknownRoute:
+            self._error(404, f"Unknown route {url.path}; available: {sorted(ROUTES)}")
+        except QueryError as e:
+            self._error(400, str(e))
+        except Exception as e:
+            logger.exception(f"Failed to answer {self.path}")
+            self._error(500, f"{type(e).__name__}: {e}")
+        else:
+            self._send(200, body)
+
+    def do_POST(self):
+        if urlsplit(self.path).path.rstrip("/") != "/reload":
+            self._error(404, f"Unknown route {self.path}")
+            return
+        try:
+            self.server.state.refresh(force=True)
+        except Exception as e:
+            logger.exception("Reload failed")
+            self._error(500, f"{type(e).__name__}: {e}")
+            return
+        self._send(200, json.dumps({"reloads": self.server.state.reloads}).encode("utf-8"))
+
+    def address_string(self):
+        # Unix 套接字的客户端地址为空字符串
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(state: ValuationState, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: Path = None):
+    """创建 HTTP 服务（socket_path 给出时监听 Unix 套接字，否则监听 host:port），state 挂在 server.state 上。"""
+    if socket_path is not None:
+        socket_path = Path(socket_path)
+        socket_path.unlink(missing_ok=True)
+        server = UnixHTTPServer(str(socket_path), ValuationHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ValuationHandler)
+        server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def main(argv=None):
+    from qydl002039 import DATA_FILE
+
+    parser = argparse.ArgumentParser(description="常驻内存的本地估值服务（HTTP，JSON 响应）")
+    parser.add_argument("--data", default=str(DATA_FILE), help="data.json 路径（变化时自动重新加载）")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", default=None, help="改为监听该 Unix 套接字")
+    args = parser.parse_args(argv)
+
+    state = ValuationState(Path(args.data))
+    server = make_server(state, args.host, args.port, args.socket)
+    where = args.socket or f"http://{args.host}:{server.server_address[1]}"
+    logger.info(f"Serving {args.data} on {where}; routes: {sorted(ROUTES)}")
+    # SIGTERM 时正常退出（关闭监听并删除 Unix 套接字文件）
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket:
+            Path(args.socket).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()